@@ -25,3 +25,8 @@ OMB_DATA_DIR = 'open-multiboot'
 OMB_UPLOAD_DIR = 'open-multiboot-upload'
 OMB_TMP_DIR = 'open-multiboot-tmp'
 OMB_MANAGER_VERION = '1.0'
+OMB_EXTRACT_THREADS = 2
+# Uploaded images come from anywhere, ubi_reader checks every node.
+OMB_UBI_CRC = 'full'
+OMB_INSTALL_JOBS = 2
+OMB_STORE_DIR = '.store'
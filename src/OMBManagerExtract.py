@@ -0,0 +1,736 @@
+#############################################################################
+#
+# Copyright (C) 2014 Impex-Sat Gmbh & Co.KG
+# Written by Sandro Cavazzoni <sandro@skanetwork.com>
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#############################################################################
+
+# In-process image extraction, no Enigma2 imports here so the engines can
+# run from a worker thread or outside the box.
+
+from __future__ import print_function
+
+import errno
+import os
+import stat
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+
+UBI_READER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ubi_reader')
+
+# Read size when copying image data between files.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Files of at least this size are copied on the copyTree thread pool.
+COPY_THREAD_MIN_SIZE = 4 * 1024 * 1024
+
+# Seconds between progress callbacks.
+PROGRESS_INTERVAL = 0.5
+
+# Volume holding the root filesystem, the first volume is used when
+# an image has none with this name.
+UBI_ROOTFS_VOLUME = 'rootfs'
+
+
+class ImageCorrupt(Exception):
+	"""The image failed its CRC checks."""
+	pass
+
+
+class ExtractStats(object):
+	"""Throughput of an extraction, handed to progress callbacks.
+
+	total_in or total_files are set by engines that know the size of
+	their input up front, percent() is None otherwise. Workers sharing
+	the stats count through add() and report(), which are thread safe.
+	"""
+
+	def __init__(self, total_in=0, total_files=0):
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self.files = 0
+		self.total_in = total_in
+		self.total_files = total_files
+		self.start = time.time()
+		self.last_report = 0
+		self.lock = threading.Lock()
+
+	def add(self, bytes_in=0, bytes_out=0, files=0):
+		with self.lock:
+			self.bytes_in += bytes_in
+			self.bytes_out += bytes_out
+			self.files += files
+
+	def elapsed(self):
+		return max(time.time() - self.start, 0.001)
+
+	def filesPerSecond(self):
+		return self.files / self.elapsed()
+
+	def bytesPerSecond(self):
+		return self.bytes_out / self.elapsed()
+
+	def percent(self):
+		if self.total_in:
+			return min(100, self.bytes_in * 100 // self.total_in)
+		if self.total_files:
+			return min(100, self.files * 100 // self.total_files)
+		return None
+
+	def report(self, progress, force=False):
+		"""Call progress at most every PROGRESS_INTERVAL seconds."""
+		if not progress:
+			return
+		with self.lock:
+			now = time.time()
+			if not force and now - self.last_report < PROGRESS_INTERVAL:
+				return
+			self.last_report = now
+		progress(self)
+
+	def __str__(self):
+		return '%d files, %.1f MB in, %.1f MB out, %d files/s, %.1f MB/s' % (self.files,
+			self.bytes_in / 1048576.0, self.bytes_out / 1048576.0, self.filesPerSecond(),
+			self.bytesPerSecond() / 1048576.0)
+
+
+class CountingReader(object):
+	"""File object wrapper adding the bytes read to stats.bytes_in."""
+
+	def __init__(self, src, stats):
+		self.src = src
+		self.stats = stats
+
+	def read(self, size=-1):
+		data = self.src.read(size)
+		self.stats.add(bytes_in=len(data))
+		return data
+
+
+def copyStream(src, dst, stats=None, progress=None, lock=None):
+	"""Copy file object src to dst, adding the bytes written to stats.
+
+	Wrap src in a CountingReader on the same stats for bytes_in. lock
+	is held for each write only, so reading and decompressing src
+	overlaps with other writers sharing it.
+	"""
+	while True:
+		data = src.read(COPY_BUFFER_SIZE)
+		if not data:
+			break
+		if lock is None:
+			dst.write(data)
+		else:
+			with lock:
+				dst.write(data)
+		if stats:
+			stats.add(bytes_out=len(data))
+			stats.report(progress)
+
+
+class LimitedReader(object):
+	"""Reader over the next size bytes of src."""
+
+	def __init__(self, src, size):
+		self.src = src
+		self.left = size
+
+	def read(self, size=-1):
+		if size < 0 or size > self.left:
+			size = self.left
+		data = self.src.read(size)
+		self.left -= len(data)
+		return data
+
+
+def stripSectors(data, bs, bso):
+	"""Data bytes of whole bso byte sectors, dropping the last bso - bs."""
+	if sys.version_info[0] >= 3:
+		# Slices of a memoryview are joined without copying them first.
+		data = memoryview(data)
+	return b''.join([data[i:i + bs] for i in range(0, len(data), bso)])
+
+
+class OOBStripper(object):
+	"""Reader over size bytes of a NAND dump with the OOB data dropped.
+
+	Each bso byte sector of src holds bs bytes of data followed by the
+	spare area, read() returns the data only. src is read about
+	COPY_BUFFER_SIZE at a time and a trailing partial sector is skipped,
+	so src ends up just past the size bytes.
+	"""
+
+	def __init__(self, src, size, bs, bso):
+		self.src = src
+		self.bs = bs
+		self.bso = bso
+		self.sectors = size // bso
+		self.tail = size % bso
+		self.buf = b''
+
+	def fill(self):
+		count = min(self.sectors, max(1, COPY_BUFFER_SIZE // self.bso))
+		if not count:
+			skipStream(self.src, self.tail)
+			self.tail = 0
+			return b''
+
+		data = self.src.read(count * self.bso)
+		if len(data) < count * self.bso:
+			# Truncated image, hand out the whole sectors read.
+			count = len(data) // self.bso
+			data = data[:count * self.bso]
+			self.sectors = count
+			self.tail = 0
+		self.sectors -= count
+		return stripSectors(data, self.bs, self.bso)
+
+	def read(self, size=-1):
+		chunks = [self.buf]
+		length = len(self.buf)
+		while size < 0 or length < size:
+			data = self.fill()
+			if not data:
+				break
+			chunks.append(data)
+			length += len(data)
+
+		data = b''.join(chunks)
+		if size < 0 or length <= size:
+			self.buf = b''
+			return data
+		self.buf = data[size:]
+		return data[:size]
+
+
+def loadUbiReader():
+	if UBI_READER_DIR not in sys.path:
+		sys.path.append(UBI_READER_DIR)
+
+
+def extractEntries(dents, total_files, extract, jobs=1, progress=None):
+	"""Call extract(dent, pool, entryDone) for the root directory entries.
+
+	Same as ubi_reader's extract_files, which would swallow the
+	exceptions progress raises. extract calls entryDone for every entry
+	it walks, progress gets an ExtractStats counting them against
+	total_files. pool is a ThreadPool of jobs threads, or None.
+	"""
+	from multiprocessing.pool import ThreadPool
+
+	stats = ExtractStats(total_files=total_files)
+
+	def entryDone():
+		stats.add(files=1)
+		stats.report(progress)
+
+	pool = None
+	if jobs > 1:
+		pool = ThreadPool(jobs)
+	try:
+		for dent in dents:
+			extract(dent, pool, entryDone)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	stats.report(progress, True)
+
+
+def extractUBI(rootfs_path, dst_path, jobs=1, progress=None, lock=None, crc='headers'):
+	"""Extract the root UBIFS volume of an UBI image into dst_path.
+
+	The headers are scanned in this process, jobs only sets the number
+	of threads used to decompress file data. progress is called with an
+	ExtractStats counting directory entries, exceptions it raises stop
+	the extraction. lock is held while writing file data. Raises
+	ImportError when ubi_reader can't be loaded on this box.
+
+	crc is the ubi_reader verification level, 'none', 'headers' or
+	'full'. With 'full' every UBIFS node is checked before any file is
+	written, and ImageCorrupt is raised when one fails.
+	"""
+	loadUbiReader()
+	from ubi import ubi, get_peb_size
+	from ubi.verify import policy, VERIFY_LEVELS
+	from ubi_io import ubi_file, leb_virtual_file
+	from ubifs import ubifs, walk, output
+
+	# Shared by the installs running side by side, they all ask for the
+	# same level.
+	policy.level = VERIFY_LEVELS[crc]
+
+	block_size = get_peb_size(rootfs_path)
+	if not block_size:
+		print('[OMB] Cannot find PEB size of %s' % rootfs_path)
+		return False
+
+	uubi = ubi(ubi_file(rootfs_path, block_size))
+	for image in uubi.images:
+		volumes = image.volumes
+		if not volumes:
+			continue
+
+		if UBI_ROOTFS_VOLUME in volumes:
+			name = UBI_ROOTFS_VOLUME
+		else:
+			name = min(volumes, key=lambda n: volumes[n].vol_id)
+
+		print('[OMB] Extracting UBI volume %s to %s' % (name, dst_path))
+		uubifs = ubifs(leb_virtual_file(uubi, volumes[name]))
+		mst_node = uubifs.master_node
+		inodes = walk.index(uubifs, mst_node.root_lnum, mst_node.root_offs, length=mst_node.root_len)
+		if uubifs.crc_errors:
+			lnum, offset = uubifs.crc_errors[0]
+			raise ImageCorrupt('%d UBIFS nodes failed their CRC check, the first in LEB %d at offset %d' % (len(uubifs.crc_errors), lnum, offset))
+
+		def extract(dent, pool, entryDone):
+			output.dents(uubifs, inodes, dent, dst_path, True, pool, entryDone, lock)
+
+		extractEntries(inodes[1].dent, sum([len(inode.dent) for inode in inodes.values()]), extract, jobs, progress)
+		return True
+
+	print('[OMB] No UBI volume found in %s' % rootfs_path)
+	return False
+
+
+def extractJFFS2(rootfs_path, dst_path, jobs=1, progress=None, lock=None):
+	"""Extract a JFFS2 image into dst_path, see extractUBI.
+
+	Raises ImportError when ubi_reader's jffs2 reader can't be loaded,
+	or when the image has LZO data and the lzo module is missing.
+	"""
+	loadUbiReader()
+	from jffs2 import jffs2, output
+	from jffs2.defines import JFFS2_ROOT_INO, JFFS2_COMPR_LZO
+	from jffs2.misc import lzo_available
+
+	image = jffs2(rootfs_path)
+	try:
+		if JFFS2_COMPR_LZO in image.compr_types and not lzo_available():
+			raise ImportError('No lzo module for the LZO data of %s' % rootfs_path)
+
+		if JFFS2_ROOT_INO not in image.inodes:
+			print('[OMB] No JFFS2 root directory in %s' % rootfs_path)
+			return False
+
+		print('[OMB] Extracting JFFS2 image to %s' % dst_path)
+
+		def extract(dent, pool, entryDone):
+			output.dents(image, dent, dst_path, True, pool, entryDone, lock)
+
+		extractEntries(image.inodes[JFFS2_ROOT_INO].dent, sum([len(inode.dent) for inode in image.inodes.values()]), extract, jobs, progress)
+	finally:
+		image.close()
+	return True
+
+
+def zipMemberName(folder, filename):
+	"""Name of an image file inside the uploaded zip."""
+	if folder:
+		return folder.strip('/') + '/' + filename
+	return filename
+
+
+def extractZipMember(zip_file, name, dst_file, progress=None, lock=None):
+	"""Copy a single member of zip_file to dst_file, False when missing."""
+	try:
+		src = zip_file.open(name)
+	except KeyError:
+		print('[OMB] %s not found in image' % name)
+		return False
+
+	stats = ExtractStats(zip_file.getinfo(name).file_size)
+	dst = open(dst_file, 'wb')
+	try:
+		copyStream(CountingReader(src, stats), dst, stats, progress, lock)
+	finally:
+		dst.close()
+		src.close()
+	return True
+
+
+def skipStream(src, size):
+	"""Read past size bytes of a file object that can't seek."""
+	while size > 0:
+		data = src.read(min(size, COPY_BUFFER_SIZE))
+		if not data:
+			break
+		size -= len(data)
+
+
+def extractTarStream(src, dst_path, flags, progress=None, size=0):
+	"""Unpack a tar archive read from the file object src with tar flags.
+
+	size is the length of src, for the percent handed to progress.
+	"""
+	p = subprocess.Popen(['tar', flags, '-', '-C', dst_path], stdin=subprocess.PIPE)
+	done = False
+	try:
+		try:
+			stats = ExtractStats(size)
+			copyStream(CountingReader(src, stats), p.stdin, stats, progress)
+		except IOError as e:
+			# tar gave up early, its exit code tells why.
+			print('[OMB] tar stopped reading: %s' % e)
+		done = True
+	finally:
+		p.stdin.close()
+		if not done:
+			p.kill()
+	return p.wait() == 0
+
+
+def canExtractTar(compression):
+	"""True when tarfile can decompress 'bz2' or 'xz' on this python."""
+	if compression == 'xz' and sys.version_info < (3, 3):
+		return False
+	try:
+		__import__({'bz2': 'bz2', 'xz': 'lzma'}[compression])
+	except ImportError:
+		return False
+	return True
+
+
+class LockedTarFile(tarfile.TarFile):
+	"""TarFile writing regular file data under write_lock."""
+
+	write_lock = None
+
+	def makefile(self, tarinfo, targetpath):
+		if self.write_lock is None or getattr(tarinfo, 'sparse', None) is not None:
+			return tarfile.TarFile.makefile(self, tarinfo, targetpath)
+
+		source = self.fileobj
+		source.seek(tarinfo.offset_data)
+		target = open(targetpath, 'wb')
+		try:
+			size = tarinfo.size
+			while size > 0:
+				data = source.read(min(size, COPY_BUFFER_SIZE))
+				if not data:
+					raise tarfile.ReadError('unexpected end of data')
+				with self.write_lock:
+					target.write(data)
+				size -= len(data)
+		finally:
+			target.close()
+
+
+def readTarEnd(tar):
+	"""Read the stream of tar, iterated to its end, to the last byte.
+
+	tarfile stops quietly at a header that is cut short or invalid,
+	this raises tarfile.ReadError unless only the zero blocks ending an
+	archive follow. Reading to the end also lets the decompressor and a
+	zip member check their data.
+	"""
+	while True:
+		data = tar.fileobj.read(COPY_BUFFER_SIZE)
+		if not data:
+			break
+		if data.strip(b'\0'):
+			raise tarfile.ReadError('data after the end of the archive')
+
+	if tar.fileobj.tell() < tar.offset + 2 * tarfile.BLOCKSIZE:
+		raise tarfile.ReadError('unexpected end of data')
+	if not getattr(getattr(tar.fileobj, 'cmp', None), 'eof', True):
+		raise tarfile.ReadError('unexpected end of data')
+
+
+def extractTar(src, dst_path, compression, progress=None, size=0, lock=None, update=None):
+	"""Unpack a bz2 or xz compressed tar stream into dst_path like tar xp.
+
+	Owners are restored by number and devices, links and hardlinks are
+	created, so it must run as root for a usable rootfs. progress is
+	called with an ExtractStats every PROGRESS_INTERVAL seconds and once
+	at the end, size is the compressed length of src for its percent.
+	lock is held while writing file data. update is an ImageUpdate when
+	dst_path holds the image to update, it is marked complete once src
+	is read to its end. Check canExtractTar first, python 2 can't do xz.
+	"""
+	stats = ExtractStats(size)
+	tar = LockedTarFile.open(fileobj=CountingReader(src, stats), mode='r|' + compression)
+	tar.write_lock = lock
+
+	kwargs = {}
+	if sys.version_info >= (3, 5):
+		kwargs['numeric_owner'] = True
+	if hasattr(tarfile, 'fully_trusted_filter'):
+		kwargs['filter'] = 'fully_trusted'
+
+	def members():
+		for tarinfo in tar:
+			if update is None or not update.keepMember(tar, tarinfo, lock):
+				yield tarinfo
+			stats.add(bytes_out=tarinfo.size, files=1)
+			stats.report(progress)
+
+	try:
+		tar.extractall(dst_path, members(), **kwargs)
+		readTarEnd(tar)
+	finally:
+		tar.close()
+
+	if update is not None:
+		update.complete = True
+
+	stats.report(progress, True)
+	return stats
+
+
+def scanTree(path):
+	"""List (path, lstat result) of everything below path.
+
+	Parents come before their contents, dot files are included and
+	symlinks are not followed.
+	"""
+	entries = []
+	pending = [path]
+	while pending:
+		top = pending.pop()
+		if hasattr(os, 'scandir'):
+			children = [(entry.path, entry.stat(follow_symlinks=False)) for entry in list(os.scandir(top))]
+		else:
+			children = [(os.path.join(top, name), os.lstat(os.path.join(top, name))) for name in os.listdir(top)]
+
+		children.sort()
+		for child_path, st in children:
+			entries.append((child_path, st))
+			if stat.S_ISDIR(st.st_mode):
+				pending.append(child_path)
+	return entries
+
+
+def _copyFileRange(src_fd, dst_fd, count):
+	return os.copy_file_range(src_fd, dst_fd, count)
+
+
+def _sendfile(src_fd, dst_fd, count):
+	return os.sendfile(dst_fd, src_fd, None, count)
+
+
+def _readWrite(src_fd, dst_fd, count):
+	data = os.read(src_fd, count)
+	written = 0
+	while written < len(data):
+		written += os.write(dst_fd, data[written:])
+	return len(data)
+
+
+def _kernelCopies():
+	copies = []
+	if hasattr(os, 'copy_file_range'):
+		copies.append(_copyFileRange)
+	if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+		copies.append(_sendfile)
+	return copies
+
+# Errors telling that a kernel copy can't handle these files at all.
+KERNEL_COPY_ERRORS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+def copyFd(src_fd, dst_fd, stats=None, progress=None, lock=None):
+	"""Copy src_fd to dst_fd from their current positions to the end.
+
+	The data is copied by the kernel with copy_file_range, or sendfile
+	when it isn't there or refuses the files, and with read and write
+	otherwise. The bytes copied are added to stats.bytes_in and
+	bytes_out, lock is held for each COPY_BUFFER_SIZE chunk as in
+	copyStream.
+	"""
+	copies = _kernelCopies() + [_readWrite]
+	while True:
+		if lock is not None:
+			lock.acquire()
+		try:
+			try:
+				count = copies[0](src_fd, dst_fd, COPY_BUFFER_SIZE)
+			except OSError as e:
+				if len(copies) == 1 or e.errno not in KERNEL_COPY_ERRORS:
+					raise
+				copies.pop(0)
+				continue
+		finally:
+			if lock is not None:
+				lock.release()
+
+		if not count:
+			break
+		if stats:
+			stats.add(count, count)
+			stats.report(progress)
+
+
+def copyFile(src, dst, stats=None, progress=None, lock=None):
+	"""Copy the data of regular file src to a new file dst, see copyFd."""
+	src_fd = os.open(src, os.O_RDONLY)
+	try:
+		dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		try:
+			copyFd(src_fd, dst_fd, stats, progress, lock)
+		finally:
+			os.close(dst_fd)
+	finally:
+		os.close(src_fd)
+
+
+def copyXattrs(src, dst):
+	"""Copy the extended attributes of src to dst, links not followed.
+
+	Attributes the destination filesystem doesn't support are skipped.
+	"""
+	if not hasattr(os, 'listxattr'):
+		return
+
+	try:
+		names = os.listxattr(src, follow_symlinks=False)
+	except OSError as e:
+		if e.errno in (errno.ENOTSUP, errno.ENODATA):
+			return
+		raise
+
+	for name in names:
+		try:
+			value = os.getxattr(src, name, follow_symlinks=False)
+			os.setxattr(dst, name, value, follow_symlinks=False)
+		except OSError as e:
+			if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA):
+				raise
+
+
+def copyMetadata(src, dst, st):
+	"""Give dst the owner, mode, xattrs and times of src.
+
+	st is the lstat result of src, symlinks are not followed.
+	"""
+	is_link = stat.S_ISLNK(st.st_mode)
+	if hasattr(os, 'lchown'):
+		os.lchown(dst, st.st_uid, st.st_gid)
+	elif not is_link:
+		os.chown(dst, st.st_uid, st.st_gid)
+
+	# After chown, which drops the setuid bits.
+	if not is_link:
+		os.chmod(dst, stat.S_IMODE(st.st_mode))
+
+	copyXattrs(src, dst)
+
+	if sys.version_info >= (3, 3):
+		if not is_link:
+			os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+		elif os.utime in os.supports_follow_symlinks:
+			os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+	elif not is_link:
+		os.utime(dst, (st.st_atime, st.st_mtime))
+
+
+def copyTree(src_path, dst_path, jobs=1, progress=None, lock=None):
+	"""Copy the contents of src_path into the existing dst_path like cp -a.
+
+	Hardlinks, symlinks, devices, fifos, owners, modes, xattrs and
+	times are kept, dot files included. Files of COPY_THREAD_MIN_SIZE
+	and more are copied on a pool of jobs threads, the rest in this
+	thread. progress is called with an ExtractStats whose percent is
+	over the bytes to copy, exceptions it raises stop the copy. lock is
+	held while writing file data. Returns the stats.
+	"""
+	from multiprocessing.pool import ThreadPool
+
+	entries = scanTree(src_path)
+
+	total_in = 0
+	inodes = set()
+	for path, st in entries:
+		if stat.S_ISREG(st.st_mode) and (st.st_dev, st.st_ino) not in inodes:
+			inodes.add((st.st_dev, st.st_ino))
+			total_in += st.st_size
+
+	stats = ExtractStats(total_in)
+
+	def reportFile():
+		stats.add(files=1)
+		stats.report(progress)
+
+	def copyBig(src, dst, st):
+		copyFile(src, dst, stats, progress, lock)
+		copyMetadata(src, dst, st)
+		reportFile()
+
+	pool = None
+	if jobs > 1:
+		pool = ThreadPool(jobs)
+
+	links = {}
+	dirs = []
+	results = []
+	try:
+		for src, st in entries:
+			dst = os.path.join(dst_path, os.path.relpath(src, src_path))
+			mode = st.st_mode
+
+			if stat.S_ISDIR(mode):
+				os.mkdir(dst, 0o700)
+				# Set once their contents are in, as that changes the times.
+				dirs.append((src, dst, st))
+				reportFile()
+				continue
+
+			if st.st_nlink > 1:
+				key = (st.st_dev, st.st_ino)
+				if key in links:
+					os.link(links[key], dst)
+					reportFile()
+					continue
+				links[key] = dst
+
+			if stat.S_ISREG(mode):
+				if pool is not None and st.st_size >= COPY_THREAD_MIN_SIZE:
+					# Created here so later hardlinks to it can be made.
+					os.close(os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+					results.append(pool.apply_async(copyBig, (src, dst, st)))
+					continue
+				copyFile(src, dst, stats, progress, lock)
+			elif stat.S_ISLNK(mode):
+				os.symlink(os.readlink(src), dst)
+			else:
+				os.mknod(dst, mode, st.st_rdev)
+
+			copyMetadata(src, dst, st)
+			reportFile()
+
+		for result in results:
+			result.get()
+	except:
+		# Don't wait for the big files still queued.
+		if pool is not None:
+			pool.terminate()
+		raise
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	for src, dst, st in reversed(dirs):
+		copyMetadata(src, dst, st)
+
+	stats.report(progress, True)
+	return stats
@@ -0,0 +1,138 @@
+#############################################################################
+#
+# Copyright (C) 2014 Impex-Sat Gmbh & Co.KG
+# Written by Sandro Cavazzoni <sandro@skanetwork.com>
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#############################################################################
+
+# Metadata of the installed images, asked from their own python through
+# the branding helper and cached next to them. No Enigma2 imports here,
+# the installer fills the cache from its worker thread.
+
+from __future__ import print_function
+
+import os
+from subprocess import Popen, PIPE, STDOUT
+
+BRANDING_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'open-multiboot-branding-helper.pyo')
+
+# Prefix of the cache files in the data folder, followed by the image
+# identifier like the labels.
+IMAGE_INFO_PREFIX = '.info_'
+
+# Keys of the cached info, archs holds the lines of etc/opkg/arch.conf.
+IMAGE_INFO_KEYS = ('key', 'loader', 'box_type', 'distro', 'version')
+
+
+def enigma2Paths(base_path):
+	"""enigma2 python folder of the image in base_path and its lib folder."""
+	if os.path.isdir("/usr/lib64"):
+		return base_path + '/usr/lib64/enigma2/python', '/usr/lib64'
+	return base_path + '/usr/lib/enigma2/python', '/usr/lib'
+
+
+def getDynamicLoader(base_path):
+	p = Popen("/usr/bin/strings " + base_path + "/bin/echo", shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True, universal_newlines=True)
+	loader = p.stdout.read().split("\n")[0].strip()
+	p.wait()
+	return base_path + loader
+
+
+def brandingValue(base_path, loader, key):
+	"""Value of key from the branding helper run by the image's python."""
+	e2_path, usrlib_path = enigma2Paths(base_path)
+	helper = "LC_ALL=C LD_LIBRARY_PATH=" + base_path + "/lib:" + base_path + usrlib_path + " " + loader + " " + base_path + "/usr/bin/python " + BRANDING_HELPER
+	p = Popen(helper + " " + e2_path + " " + key, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True, universal_newlines=True)
+	value = p.stdout.read().strip()
+	p.wait()
+	return value
+
+
+def probeImageInfo(base_path):
+	"""Ask the image in base_path for its box type, distro and version.
+
+	Images without boxbranding have their opkg archs instead.
+	"""
+	info = {'loader': '', 'box_type': '', 'distro': '', 'version': '', 'archs': []}
+	e2_path, usrlib_path = enigma2Paths(base_path)
+	if os.path.exists(e2_path + '/boxbranding.so'):
+		info['loader'] = getDynamicLoader(base_path)
+		info['box_type'] = brandingValue(base_path, info['loader'], 'box_type')
+		info['distro'] = brandingValue(base_path, info['loader'], 'image_distro')
+		info['version'] = brandingValue(base_path, info['loader'], 'image_version')
+	else:
+		try:
+			with open(base_path + '/etc/opkg/arch.conf', 'r') as arch:
+				info['archs'] = [line.strip() for line in arch if line.strip()]
+		except IOError:
+			pass
+	return info
+
+
+def imageInfoKey(base_path):
+	# The image folder changes inode when an update swaps it.
+	st = os.stat(base_path)
+	return '%r %d' % (st.st_mtime, st.st_ino)
+
+
+def writeImageInfo(data_dir, identifier):
+	"""Probe image identifier and save its info, which is returned."""
+	base_path = data_dir + '/' + identifier
+	info = probeImageInfo(base_path)
+	info['key'] = imageInfoKey(base_path)
+
+	info_file = data_dir + '/' + IMAGE_INFO_PREFIX + identifier
+	try:
+		f = open(info_file + '.tmp', 'w')
+		try:
+			for key in IMAGE_INFO_KEYS:
+				f.write('%s=%s\n' % (key, info[key]))
+			for line in info['archs']:
+				f.write('arch=%s\n' % line)
+		finally:
+			f.close()
+		os.rename(info_file + '.tmp', info_file)
+	except (IOError, OSError) as e:
+		print('[OMB] Cannot save %s: %s' % (info_file, e))
+	return info
+
+
+def readImageInfo(data_dir, identifier):
+	"""Info of image identifier, probed again when the cache is stale.
+
+	The cache is valid while the image folder keeps its mtime and inode,
+	installs write it once the image is complete.
+	"""
+	info = {'archs': []}
+	try:
+		f = open(data_dir + '/' + IMAGE_INFO_PREFIX + identifier, 'r')
+		try:
+			for line in f:
+				key, sep, value = line.rstrip('\n').partition('=')
+				if key == 'arch':
+					info['archs'].append(value)
+				elif key in IMAGE_INFO_KEYS:
+					info[key] = value
+		finally:
+			f.close()
+	except IOError:
+		pass
+
+	if info.get('key') == imageInfoKey(data_dir + '/' + identifier) and len(info) == len(IMAGE_INFO_KEYS) + 1:
+		return info
+	return writeImageInfo(data_dir, identifier)
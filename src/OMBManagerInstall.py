@@ -24,24 +24,27 @@ from __future__ import print_function
 #############################################################################
 
 from Screens.Screen import Screen
-from Screens.MessageBox import MessageBox
 
 from Components.ActionMap import ActionMap
+from Components.Button import Button
 from Components.Label import Label
 from Components.Sources.List import List
 
 from Tools.Directories import fileExists
 
-from OMBManagerCommon import OMB_MAIN_DIR, OMB_DATA_DIR, OMB_UPLOAD_DIR, OMB_TMP_DIR
+from OMBManagerCommon import OMB_MAIN_DIR, OMB_DATA_DIR, OMB_UPLOAD_DIR, OMB_TMP_DIR, OMB_EXTRACT_THREADS, OMB_INSTALL_JOBS, OMB_STORE_DIR, OMB_UBI_CRC
+from OMBManagerExtract import ExtractStats, CountingReader, ImageCorrupt, LimitedReader, OOBStripper, copyStream, copyTree, extractJFFS2, extractUBI, extractZipMember, extractTar, extractTarStream, canExtractTar, skipStream, zipMemberName
+from OMBManagerImageInfo import writeImageInfo
 from OMBManagerLocale import _
-
-from enigma import eTimer
+from OMBManagerStore import storeTree
+from OMBManagerUpdate import ImageUpdate
 
 import os
-from os import path
-import glob
+import shutil
 import struct
-from Components.Console import Console
+import tarfile
+import threading
+import zipfile
 from Components.SystemInfo import BoxInfo
 
 OMB_GETBOXTYPE = BoxInfo.getItem("model")
@@ -58,71 +61,160 @@ OMB_GETMACHINEROOTFILE = BoxInfo.getItem("rootfile") # needed
 OMB_GETMACHINEMKUBIFS = BoxInfo.getItem("mkubifs")
 OMB_GETMACHINEUBINIZE = BoxInfo.getItem("ubinize")
 
+# File in the data folder holding the number of concurrent installs.
+OMB_INSTALL_JOBS_FILE = '.install_jobs'
 
-class OMBManagerInstall(Screen):
-	skin = """
-			<screen position="360,150" size="560,400">
-				<widget name="info"
-						position="10,10"
-						size="540,50"
-						font="Regular;18"
-						zPosition="1" />
-				<widget source="list"
-						render="Listbox"
-						position="10,60"
-						zPosition="1"
-						size="540,330"
-						scrollbarMode="showOnDemand"
-						transparent="1" >
+# File in the data folder enabling the store of files shared by images.
+OMB_STORE_ENABLED_FILE = '.store_enabled'
 
-					<convert type="StringList" />
-				</widget>
-			</screen>"""
+# Held while picking the folder name of a new image.
+prepare_lock = threading.Lock()
 
-	def __init__(self, session, mount_point, upload_list):
-		Screen.__init__(self, session)
+# Held by the nandsim and block2mtd paths, the kernel modules and the
+# loop and mtd devices they set up are shared by the whole box.
+mtd_lock = threading.Lock()
 
-		self.setTitle(_('openMultiboot Install'))
+# Write locks by device number, see deviceLock.
+device_locks = {}
+device_locks_lock = threading.Lock()
 
-		self.session = session
+
+def deviceLock(path):
+	"""Lock serializing data writes to the device holding path."""
+	dev = os.stat(path).st_dev
+	with device_locks_lock:
+		if dev not in device_locks:
+			device_locks[dev] = threading.Lock()
+		return device_locks[dev]
+
+
+def readInstallJobs(data_dir):
+	try:
+		return max(1, int(open(data_dir + '/' + OMB_INSTALL_JOBS_FILE).read()))
+	except (IOError, ValueError):
+		return OMB_INSTALL_JOBS
+
+
+class InstallCancelled(Exception):
+	pass
+
+
+class OMBManagerInstallJob(object):
+	"""Installs one uploaded image in a worker thread.
+
+	The manager list polls stage, percent, error and target while the
+	job runs, target_identifier names the image folder as soon as the
+	job has picked it. cancel() stops it at the next stage or progress
+	report and removes what was installed so far. Data is written
+	holding write_lock, finished is called from the worker thread at
+	the end.
+
+	With update set to the identifier of an installed image, the new
+	image replaces it. Tar images are updated in place, writing changed
+	files only. Cancelling one then would leave it half updated, so once
+	the unpacking starts cancel() refuses and the update runs to the
+	end. Other images are unpacked next to it and swapped in when
+	complete.
+	"""
+
+	def __init__(self, mount_point, selected_image, write_lock=None, finished=None, update=None):
 		self.mount_point = mount_point
+		self.selected_image = selected_image
+		self.update_identifier = update
+		self.update = None
+		if write_lock is None:
+			write_lock = threading.Lock()
+		self.write_lock = write_lock
+		self.finished = finished
 
 		self.esize = "128KiB"
 		self.vid_offset = "2048"
 		self.nandsim_parm = "first_id_byte=0x20 second_id_byte=0xac third_id_byte=0x00 fourth_id_byte=0x15"
 
-		self['info'] = Label(_("Choose the image to install"))
-		self["list"] = List(upload_list)
-		self["actions"] = ActionMap(["SetupActions"],
-		{
-			"cancel": self.keyCancel,
-			"ok": self.keyInstall
-		})
+		self.stage = _("Waiting")
+		self.percent = None
+		self.progress = ''
+		self.error = None
+		self.target = None
+		self.target_identifier = None
+		self.cancelled = False
+		self.cancellable = True
+		self.cancel_lock = threading.Lock()
+		self.done = False
+		self.thread = None
+
+		self.target_folder = None
+		self.kernel_target_file = None
+		self.tmp_folder = None
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def isRunning(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def cancel(self):
+		"""Stop the job, False when it can't be cancelled any more."""
+		with self.cancel_lock:
+			if not self.cancellable:
+				return False
+			self.cancelled = True
+		return True
 
-	def keyCancel(self):
-		self.close()
+	def checkCancel(self):
+		if self.cancelled:
+			raise InstallCancelled()
 
-	def keyInstall(self):
-		self.selected_image = self["list"].getCurrent()
-		if not self.selected_image:
-			return
+	def stopCancel(self):
+		"""Refuse cancel() from now on, unless it was already called."""
+		with self.cancel_lock:
+			self.checkCancel()
+			self.cancellable = False
 
-		self.messagebox = self.session.open(MessageBox, _('Please wait while installation is in progress.\nThis operation may take a while.'), MessageBox.TYPE_INFO, enable_input=False)
-		self.timer = eTimer()
-		self.timer.callback.append(self.installPrepare)
-		self.timer.start(100)
-		self.error_timer = eTimer()
-		self.error_timer.callback.append(self.showErrorCallback)
+	def setStage(self, stage):
+		self.checkCancel()
+		print('[OMB] %s: %s' % (self.selected_image, stage))
+		self.stage = stage
+		self.percent = None
 
-	def showErrorCallback(self):
-		self.error_timer.stop()
-		self.session.open(MessageBox, self.error_message, type=MessageBox.TYPE_ERROR)
-		self.close()
+	def installProgress(self, stats):
+		self.checkCancel()
+		self.percent = stats.percent()
+
+	def statusText(self):
+		if self.percent is not None:
+			return '%s %d%%' % (self.stage, self.percent)
+		return self.stage
 
 	def showError(self, error_message):
-		self.messagebox.close()
-		self.error_message = error_message
-		self.error_timer.start(100)
+		# The screen shows the first one once the job is done.
+		if self.error is None:
+			self.error = error_message
+
+	def run(self):
+		try:
+			self.installPrepare()
+		except InstallCancelled:
+			print('[OMB] Install of %s cancelled' % self.selected_image)
+			self.stage = _("Cancelled")
+			self.percent = None
+			self.target = None
+			if self.target_folder:
+				shutil.rmtree(self.target_folder, True)
+			if self.kernel_target_file and os.path.exists(self.kernel_target_file):
+				os.remove(self.kernel_target_file)
+			if self.tmp_folder:
+				shutil.rmtree(self.tmp_folder, True)
+		except Exception:
+			import traceback
+			traceback.print_exc()
+			self.showError(_("Generic error in unpack process"))
+		finally:
+			self.done = True
+			if self.finished:
+				self.finished(self)
 
 	def guessIdentifierName(self, selected_image):
 		selected_image = selected_image.replace(' ', '_')
@@ -137,43 +229,58 @@ class OMBManagerInstall(Screen):
 		return selected_image + '_' + str(count)
 
 	def installPrepare(self):
-		self.timer.stop()
-
+		self.setStage(_("Preparing"))
 		selected_image = self.selected_image
-		selected_image_identifier = self.guessIdentifierName(selected_image)
-
 		source_file = self.mount_point + '/' + OMB_UPLOAD_DIR + '/' + selected_image + '.zip'
-		target_folder = self.mount_point + '/' + OMB_DATA_DIR + '/' + selected_image_identifier
 		kernel_target_folder = self.mount_point + '/' + OMB_DATA_DIR + '/.kernels'
-		kernel_target_file = kernel_target_folder + '/' + selected_image_identifier + '.bin'
-
-		if not os.path.exists(OMB_MAIN_DIR):
-			try:
-				os.makedirs(OMB_MAIN_DIR)
-			except OSError as exception:
-				self.showError(_("Cannot create main folder %s") % OMB_MAIN_DIR)
-				return
 
-		if not os.path.exists(kernel_target_folder):
-			try:
-				os.makedirs(kernel_target_folder)
-			except OSError as exception:
-				self.showError(_("Cannot create kernel folder %s") % kernel_target_folder)
+		# Jobs running side by side must not pick the same folder.
+		with prepare_lock:
+			if self.update_identifier is not None:
+				selected_image_identifier = self.update_identifier
+			else:
+				selected_image_identifier = self.guessIdentifierName(selected_image)
+			# Kept out of the manager list until the job is done.
+			self.target_identifier = selected_image_identifier
+			target_folder = self.mount_point + '/' + OMB_DATA_DIR + '/' + selected_image_identifier
+			kernel_target_file = kernel_target_folder + '/' + selected_image_identifier + '.bin'
+
+			if not os.path.exists(OMB_MAIN_DIR):
+				try:
+					os.makedirs(OMB_MAIN_DIR)
+				except OSError as exception:
+					self.showError(_("Cannot create main folder %s") % OMB_MAIN_DIR)
+					return
+
+			if not os.path.exists(kernel_target_folder):
+				try:
+					os.makedirs(kernel_target_folder)
+				except OSError as exception:
+					self.showError(_("Cannot create kernel folder %s") % kernel_target_folder)
+					return
+
+			if self.update_identifier is not None:
+				if not os.path.isdir(target_folder):
+					self.showError(_("Cannot find folder %s") % target_folder)
+					return
+			elif os.path.exists(target_folder):
+				self.showError(_("The folder %s already exist") % target_folder)
 				return
-
-		if os.path.exists(target_folder):
-			self.showError(_("The folder %s already exist") % target_folder)
-			return
-
-		try:
-			os.makedirs(target_folder)
-		except OSError as exception:
-			self.showError(_("Cannot create folder %s") % target_folder)
-			return
-
-		tmp_folder = self.mount_point + '/' + OMB_TMP_DIR
+			else:
+				try:
+					os.makedirs(target_folder)
+				except OSError as exception:
+					self.showError(_("Cannot create folder %s") % target_folder)
+					return
+		# Removed again when cancelled, an updated image stays.
+		if self.update_identifier is None:
+			self.target_folder = target_folder
+			self.kernel_target_file = kernel_target_file
+
+		tmp_folder = self.mount_point + '/' + OMB_TMP_DIR + '/' + selected_image_identifier
+		self.tmp_folder = tmp_folder
 		if os.path.exists(tmp_folder):
-			Console().ePopen("rm -rf %s" % tmp_folder)
+			shutil.rmtree(tmp_folder, True)
 		try:
 			os.makedirs(tmp_folder)
 			os.makedirs(tmp_folder + '/ubi')
@@ -182,73 +289,250 @@ class OMBManagerInstall(Screen):
 			self.showError(_("Cannot create folder %s") % tmp_folder)
 			return
 
-		if os.system('unzip ' + source_file + ' -d ' + tmp_folder) != 0:
+		try:
+			zip_file = zipfile.ZipFile(source_file)
+		except (IOError, zipfile.BadZipfile):
 			self.showError(_("Cannot deflate image"))
 			return
 
-		nfifile = glob.glob('%s/*.nfi' % tmp_folder)
-		tarxzfile = glob.glob('%s/*.rootfs.tar.xz' % tmp_folder)
+		# Image data is read straight out of the zip, only backends that
+		# need random access get a temp copy of the rootfs.
+		names = zip_file.namelist()
+		nfifile = [name for name in names if name.endswith('.nfi')]
+		tarxzfile = [name for name in names if name.endswith('.rootfs.tar.xz')]
+
+		rootfs_folder = target_folder
+		kernel_file = kernel_target_file
+		if self.update_identifier is not None:
+			kernel_file = tmp_folder + '/' + selected_image_identifier + '.bin'
+			if self.canUpdateInPlace(nfifile, tarxzfile):
+				self.update = ImageUpdate(target_folder, self.manifestFile(), tmp_folder)
+			else:
+				rootfs_folder = tmp_folder + '/rootfs'
+				os.makedirs(rootfs_folder)
+
 		if nfifile:
-			if not self.extractImageNFI(nfifile[0], tmp_folder):
+			nfidata = zip_file.open(nfifile[0])
+			if not self.extractImageNFI(nfidata, tmp_folder):
 				self.showError(_("Cannot extract nfi image"))
-				return
+				rc = False
 			else:
-				Console().ePopen("rm -f %s" % source_file)
-				self.afterInstallImage(target_folder)
-				self.messagebox.close()
-				self.close()
+				rc = self.installImageNFI(tmp_folder, rootfs_folder, kernel_file)
+			nfidata.close()
+		elif tarxzfile:
+			rootfs = zip_file.open(tarxzfile[0])
+			rc = self.installImageTARXZ(rootfs, rootfs_folder, zip_file.getinfo(tarxzfile[0]).file_size)
+			rootfs.close()
+		else:
+			rc = self.installImage(zip_file, rootfs_folder, kernel_file, tmp_folder)
+		zip_file.close()
+
+		if rc and self.update_identifier is not None:
+			rc = self.finishUpdate(rootfs_folder, target_folder, kernel_file, kernel_target_file)
+
+		if rc:
+			self.storeImage(target_folder)
+			self.cacheImageInfo(target_folder)
+			try:
+				os.remove(source_file)
+			except OSError:
+				pass
+			self.target = target_folder
+		self.setStage(_("Cleaning up"))
+		shutil.rmtree(tmp_folder, True)
+
+	def manifestFile(self):
+		return self.mount_point + '/' + OMB_DATA_DIR + '/.manifest_' + self.update_identifier
+
+	def canUpdateInPlace(self, nfifile, tarxzfile):
+		# Only tarfile lets each file be checked before it is written.
+		if nfifile:
+			return False
 		if tarxzfile:
-			if os.system('/bin/tar' + ' xpJf %s -C %s' % (tarxzfile[0], target_folder)) != 0:
-				if not os.path.exists(target_folder + "/usr/bin/enigma2"):
-					self.showError(_("Error unpacking rootfs"))
-					Console().ePopen("rm -rf %s" % tmp_folder)
-				else:
-					self.afterInstallImage(target_folder)
-					Console().ePopen("rm -f %s" % source_file)
-					Console().ePopen("rm -rf %s" % tmp_folder)
-					self.messagebox.close()
-					self.close(target_folder)
+			return canExtractTar('xz')
+		return "tar.bz2" in OMB_GETIMAGEFILESYSTEM and canExtractTar('bz2')
+
+	def finishUpdate(self, rootfs_folder, target_folder, kernel_file, kernel_target_file):
+		self.setStage(_("Updating image"))
+		try:
+			if self.update is not None:
+				self.update.finish()
+				print('[OMB] Updated %s: %s' % (target_folder, self.update))
 			else:
+				# The old image goes with the tmp folder.
+				os.rename(target_folder, self.tmp_folder + '/old')
+				os.rename(rootfs_folder, target_folder)
+				if os.path.exists(self.manifestFile()):
+					os.remove(self.manifestFile())
+			if os.path.exists(kernel_file):
+				os.rename(kernel_file, kernel_target_file)
+		except (IOError, OSError) as e:
+			print('[OMB] Updating %s failed: %s' % (target_folder, e))
+			self.showError(_("Error updating image"))
+			return False
+
+		return True
+
+	def storeImage(self, dst_path):
+		data_dir = self.mount_point + '/' + OMB_DATA_DIR
+		if not os.path.isfile(data_dir + '/' + OMB_STORE_ENABLED_FILE):
+			return
+
+		# The image is complete already, a failure only costs space.
+		self.setStage(_("Sharing files"))
+		try:
+			files, size = storeTree(dst_path, data_dir + '/' + OMB_STORE_DIR, self.installProgress)
+		except InstallCancelled:
+			raise
+		except (IOError, OSError) as e:
+			print('[OMB] Sharing files of %s failed: %s' % (dst_path, e))
+			return
+
+		print('[OMB] Shared %d files, %.1f MB with other images' % (files, size / 1048576.0))
+
+	def cacheImageInfo(self, dst_path):
+		# Probed here once, the list reads it back while the folder is unchanged.
+		try:
+			writeImageInfo(os.path.dirname(dst_path), os.path.basename(dst_path))
+		except (IOError, OSError) as e:
+			print('[OMB] Caching info of %s failed: %s' % (dst_path, e))
+
+	def installImage(self, zip_file, dst_path, kernel_dst_path, tmp_folder):
+		rootfs_name = zipMemberName(OMB_GETIMAGEFOLDER, OMB_GETMACHINEROOTFILE)
+		kernel_name = zipMemberName(OMB_GETIMAGEFOLDER, OMB_GETMACHINEKERNELFILE)
+
+		if "tar.bz2" in OMB_GETIMAGEFILESYSTEM:
+			try:
+				rootfs = zip_file.open(rootfs_name)
+			except KeyError:
+				self.showError(_("Error unpacking rootfs"))
+				return False
+			rc = self.installImageTARBZ2(rootfs, dst_path, zip_file.getinfo(rootfs_name).file_size)
+			rootfs.close()
+		elif "ubi" in OMB_GETIMAGEFILESYSTEM or "jffs2" in OMB_GETIMAGEFILESYSTEM:
+			self.setStage(_("Reading image"))
+			rootfs_path = tmp_folder + '/' + os.path.basename(rootfs_name)
+			if not extractZipMember(zip_file, rootfs_name, rootfs_path, self.installProgress, self.write_lock):
 				self.showError(_("Error unpacking rootfs"))
-				Console().ePopen("rm -rf %s" % tmp_folder)
-		elif self.installImage(tmp_folder, target_folder, kernel_target_file, tmp_folder):
-			Console().ePopen("rm -f %s" % source_file)
-			Console().ePopen("rm -rf %s" % tmp_folder)
-			self.messagebox.close()
-			self.close(target_folder)
+				return False
+			rc = self.installRootfs(rootfs_path, dst_path, tmp_folder)
 		else:
-			Console().ePopen("rm -rf %s" % tmp_folder)
+			self.showError(_("Your STB doesn\'t seem supported"))
+			return False
 
-	def installImage(self, src_path, dst_path, kernel_dst_path, tmp_folder):
+		if rc and os.path.exists(dst_path + '/usr/bin/enigma2'):
+			self.setStage(_("Copying kernel"))
+			if not extractZipMember(zip_file, kernel_name, kernel_dst_path, self.installProgress, self.write_lock):
+				self.showError(_("Error copying kernel"))
+				return False
+
+		return rc
+
+	def installRootfs(self, rootfs_path, dst_path, tmp_folder):
+		self.setStage(_("Unpacking rootfs"))
 		if "ubi" in OMB_GETIMAGEFILESYSTEM:
-			return self.installImageUBI(src_path, dst_path, kernel_dst_path, tmp_folder)
+			return self.installImageUBI(rootfs_path, dst_path, tmp_folder)
 		elif "jffs2" in OMB_GETIMAGEFILESYSTEM:
-			return self.installImageJFFS2(src_path, dst_path, kernel_dst_path, tmp_folder)
-		elif "tar.bz2" in OMB_GETIMAGEFILESYSTEM:
-			return self.installImageTARBZ2(src_path, dst_path, kernel_dst_path, tmp_folder)
+			return self.installImageJFFS2(rootfs_path, dst_path, tmp_folder)
 		else:
 			self.showError(_("Your STB doesn\'t seem supported"))
 			return False
 
-	def installImageTARBZ2(self, src_path, dst_path, kernel_dst_path, tmp_folder):
-		base_path = src_path + '/' + OMB_GETIMAGEFOLDER
-		rootfs_path = base_path + '/' + OMB_GETMACHINEROOTFILE
-		kernel_path = base_path + '/' + OMB_GETMACHINEKERNELFILE
+	def installImageNFI(self, src_path, dst_path, kernel_dst_path):
+		if not self.installRootfs(src_path + '/rootfs.bin', dst_path, src_path):
+			return False
+
+		try:
+			os.rename(src_path + '/kernel.bin', kernel_dst_path)
+		except OSError:
+			self.showError(_("Error copying kernel"))
+			return False
+
+		self.afterInstallImage(dst_path)
+
+		return True
 
-		if os.system('tar jxf %s -C %s' % (rootfs_path, dst_path)) != 0:
+	def installImageTARXZ(self, rootfs, dst_path, size=0):
+		self.setStage(_("Unpacking rootfs"))
+		# An updated image has the old enigma2 still, so that alone
+		# doesn't tell the archive was unpacked to the end.
+		if not self.extractRootfsTar(rootfs, dst_path, 'xz', 'xpJf', size) or \
+				not os.path.exists(dst_path + '/usr/bin/enigma2'):
 			self.showError(_("Error unpacking rootfs"))
 			return False
 
-		if os.path.exists(dst_path + '/usr/bin/enigma2'):
-			if os.system('cp ' + kernel_path + ' ' + kernel_dst_path) != 0:
-				self.showError(_("Error copying kernel"))
-				return False
+		self.afterInstallImage(dst_path)
+
+		return True
+
+	def installImageTARBZ2(self, rootfs, dst_path, size=0):
+		self.setStage(_("Unpacking rootfs"))
+		if not self.extractRootfsTar(rootfs, dst_path, 'bz2', 'jxf', size):
+			self.showError(_("Error unpacking rootfs"))
+			return False
 
 		self.dirtyHack(dst_path)
 
 		return True
 
-	def installImageJFFS2(self, src_path, dst_path, kernel_dst_path, tmp_folder):
+	def extractRootfsTar(self, rootfs, dst_path, compression, tar_flags, size=0):
+		# Without a python decompressor for it the tar command is used.
+		# tar does its own writing, it keeps the device for the whole run.
+		if not canExtractTar(compression):
+			with self.write_lock:
+				return extractTarStream(rootfs, dst_path, tar_flags, self.installProgress, size)
+
+		if self.update is not None:
+			# From here the image is half old, half new until the end.
+			self.stopCancel()
+
+		try:
+			stats = extractTar(rootfs, dst_path, compression, self.installProgress, size, self.write_lock, self.update)
+		except (tarfile.TarError, EnvironmentError, EOFError, zipfile.BadZipfile) as e:
+			print('[OMB] Error unpacking rootfs: %s' % e)
+			return False
+
+		print('[OMB] Unpacked rootfs: %s' % stats)
+		return True
+
+	def installImageJFFS2(self, rootfs_path, dst_path, tmp_folder):
+		# Unpack with the jffs2 reader straight into the target folder,
+		# unjffs2 and block2mtd are only used when it can't run on this box.
+		try:
+			extracted = extractJFFS2(rootfs_path, dst_path, OMB_EXTRACT_THREADS, self.installProgress, self.write_lock)
+		except ImportError as e:
+			print('[OMB] jffs2 reader not available: %s' % e)
+			with mtd_lock:
+				with self.write_lock:
+					return self.installImageJFFS2Mount(rootfs_path, dst_path, tmp_folder)
+		except InstallCancelled:
+			raise
+		except Exception as e:
+			print('[OMB] JFFS2 extraction failed: %s' % e)
+			extracted = False
+
+		if not extracted or not os.path.exists(dst_path + '/usr/bin/enigma2'):
+			self.showError(_("Generic error in unpack process"))
+			return False
+
+		return True
+
+	def copyRootfs(self, src_path, dst_path):
+		# Callers hold write_lock for the whole mount, so it isn't passed on.
+		self.setStage(_("Copying rootfs"))
+		try:
+			stats = copyTree(src_path, dst_path, OMB_EXTRACT_THREADS, self.installProgress)
+		except InstallCancelled:
+			raise
+		except (IOError, OSError) as e:
+			print('[OMB] Copying %s failed: %s' % (src_path, e))
+			self.showError(_("Error copying unpacked rootfs"))
+			return False
+
+		print('[OMB] Copied rootfs: %s' % stats)
+		return True
+
+	def installImageJFFS2Mount(self, rootfs_path, dst_path, tmp_folder):
 		rc = True
 		mtdfile = "/dev/mtdblock0"
 		for i in range(0, 20):
@@ -256,10 +540,7 @@ class OMBManagerInstall(Screen):
 			if not os.path.exists(mtdfile):
 				break
 
-		base_path = src_path + '/' + OMB_GETIMAGEFOLDER
-		rootfs_path = base_path + '/' + OMB_GETMACHINEROOTFILE
-		kernel_path = base_path + '/' + OMB_GETMACHINEKERNELFILE
-		jffs2_path = src_path + '/jffs2'
+		jffs2_path = tmp_folder + '/jffs2'
 
 		if os.path.exists('/usr/bin/unjffs2'):
 			if os.system("unjffs2 %s %s" % (rootfs_path, jffs2_path)) != 0:
@@ -267,40 +548,68 @@ class OMBManagerInstall(Screen):
 				rc = False
 
 			if os.path.exists(jffs2_path + '/usr/bin/enigma2'):
-				if os.system('cp -rp ' + jffs2_path + '/* ' + dst_path) != 0:
-					self.showError(_("Error copying unpacked rootfs"))
-					rc = False
-				if os.system('cp ' + kernel_path + ' ' + kernel_dst_path) != 0:
-					self.showError(_("Error copying kernel"))
+				if not self.copyRootfs(jffs2_path, dst_path):
 					rc = False
 		else:
-			Console().ePopen("modprobe loop")
-			Console().ePopen("modprobe mtdblock")
-			Console().ePopen("modprobe block2mtd")
-			Console().ePopen("mknod %s b 31 0" % mtdfile)
-			Console().ePopen("losetup /dev/loop0 %s" % rootfs_path)
-			Console().ePopen('echo "/dev/loop0,%s" > /sys/module/block2mtd/parameters/block2mtd' % self.esize)
-			Console().ePopen("mount -t jffs2 %s %s" % (mtdfile, jffs2_path))
+			os.system("modprobe loop")
+			os.system("modprobe mtdblock")
+			os.system("modprobe block2mtd")
+			os.system("mknod %s b 31 0" % mtdfile)
+			os.system("losetup /dev/loop0 %s" % rootfs_path)
+			os.system('echo "/dev/loop0,%s" > /sys/module/block2mtd/parameters/block2mtd' % self.esize)
+			os.system("mount -t jffs2 %s %s" % (mtdfile, jffs2_path))
 
-			if os.path.exists(jffs2_path + '/usr/bin/enigma2'):
-				if os.system('cp -rp ' + jffs2_path + '/* ' + dst_path) != 0:
-					self.showError(_("Error copying unpacked rootfs"))
-					rc = False
-				if os.system('cp ' + kernel_path + ' ' + kernel_dst_path) != 0:
-					self.showError(_("Error copying kernel"))
+			try:
+				if os.path.exists(jffs2_path + '/usr/bin/enigma2'):
+					if not self.copyRootfs(jffs2_path, dst_path):
+						rc = False
+				else:
+					self.showError(_("Generic error in unpack process"))
 					rc = False
-			else:
-				self.showError(_("Generic error in unpack process"))
-				rc = False
-
-			Console().ePopen("umount %s" % jffs2_path)
-			Console().ePopen("rmmod block2mtd")
-			Console().ePopen("rmmod mtdblock")
-			Console().ePopen("rmmod loop")
+			finally:
+				os.system("umount %s" % jffs2_path)
+				os.system("rmmod block2mtd")
+				os.system("rmmod mtdblock")
+				os.system("rmmod loop")
 
 		return rc
 
-	def installImageUBI(self, src_path, dst_path, kernel_dst_path, tmp_folder):
+	def installImageUBI(self, rootfs_path, dst_path, tmp_folder):
+		# Unpack with ubi_reader straight into the target folder, nandsim
+		# is used when ubi_reader can't run on this box or can't read the
+		# image.
+		try:
+			extracted = extractUBI(rootfs_path, dst_path, OMB_EXTRACT_THREADS, self.installProgress, self.write_lock, OMB_UBI_CRC)
+		except InstallCancelled:
+			raise
+		except ImageCorrupt as e:
+			# nandsim would mount it just the same, don't fall back.
+			print('[OMB] %s: %s' % (rootfs_path, e))
+			self.showError(_("The image is corrupt"))
+			return False
+		except Exception as e:
+			print('[OMB] ubi_reader failed: %s' % e)
+			extracted = False
+
+		if not extracted:
+			# Start over from an empty folder, the reader may have got halfway.
+			shutil.rmtree(dst_path, True)
+			os.makedirs(dst_path)
+			with mtd_lock:
+				with self.write_lock:
+					return self.installImageUBINandsim(rootfs_path, dst_path, tmp_folder)
+
+		if not os.path.exists(dst_path + '/usr/bin/enigma2'):
+			self.showError(_("Generic error in unpack process"))
+			return False
+
+		self.dirtyHack(dst_path)
+
+		self.afterInstallImage(dst_path)
+
+		return True
+
+	def installImageUBINandsim(self, rootfs_path, dst_path, tmp_folder):
 		rc = True
 		for i in range(0, 20):
 			mtdfile = "/dev/mtd" + str(i)
@@ -308,54 +617,33 @@ class OMBManagerInstall(Screen):
 				break
 		mtd = str(i)
 
-		base_path = src_path + '/' + OMB_GETIMAGEFOLDER
-		rootfs_path = base_path + '/' + OMB_GETMACHINEROOTFILE
-		kernel_path = base_path + '/' + OMB_GETMACHINEKERNELFILE
-		ubi_path = src_path + '/ubi'
-
-		# This is idea from EGAMI Team to handle universal UBIFS unpacking - used only for INI-HDp model
-		if OMB_GETBOXTYPE in ("xpeedlx3", "sezammarvel", "mbultra", "beyonwizt4", "atemionemesis"):
-			if path.isdir("/usr/lib64"):
-				ubifile = "/usr/lib64/enigma2/python/Plugins/Extensions/OpenMultiboot/ubi_reader/ubi_extract_files.pyo"
-			else:
-				ubifile = "/usr/lib/enigma2/python/Plugins/Extensions/OpenMultiboot/ubi_reader/ubi_extract_files.pyo"
-			Console().ePopen("chmod 755 %s" % ubifile)
-			Console().ePopen("python %s %s -o %s" % (ubifile, rootfs_path, ubi_path))
-			Console().ePopen("cp -rp %s/rootfs/* %s" % (ubi_path, dst_path))
-			Console().ePopen("chmod -R +x %s" % dst_path)
-			Console().ePopen("rm -rf %s" % ubi_path)
-			Console().ePopen("cp %s %s" % (kernel_path, kernel_dst_path))
-			self.dirtyHack(dst_path)
-			return True
+		ubi_path = tmp_folder + '/ubi'
 
 		virtual_mtd = tmp_folder + '/virtual_mtd'
-		Console().ePopen("modprobe nandsim cache_file=%s %s" % (virtual_mtd, self.nandsim_parm))
+		os.system("modprobe nandsim cache_file=%s %s" % (virtual_mtd, self.nandsim_parm))
 		if not os.path.exists('/dev/mtd' + mtd):
-			Console().ePopen('rmmod nandsim')
+			os.system('rmmod nandsim')
 			self.showError(_("Cannot create virtual MTD device"))
 			return False
 
 		if not os.path.exists('/dev/mtdblock' + mtd):
-			Console().ePopen("dd if=%s of=/dev/mtd%s bs=2048" % (rootfs_path, mtd))
+			os.system("dd if=%s of=/dev/mtd%s bs=2048" % (rootfs_path, mtd))
 		else:
-			Console().ePopen("dd if=%s of=/dev/mtdblock%s bs=2048" % (rootfs_path, mtd))
-		Console().ePopen("ubiattach /dev/ubi_ctrl -m %s -O %s" % (mtd, self.vid_offset))
-		Console().ePopen("mount -t ubifs ubi1_0 %s" % ubi_path)
+			os.system("dd if=%s of=/dev/mtdblock%s bs=2048" % (rootfs_path, mtd))
+		os.system("ubiattach /dev/ubi_ctrl -m %s -O %s" % (mtd, self.vid_offset))
+		os.system("mount -t ubifs ubi1_0 %s" % ubi_path)
 
-		if os.path.exists(ubi_path + '/usr/bin/enigma2'):
-			if os.system('cp -rp ' + ubi_path + '/* ' + dst_path) != 0:
-				self.showError(_("Error copying unpacked rootfs"))
-				rc = False
-			if os.system('cp ' + kernel_path + ' ' + kernel_dst_path) != 0:
-				self.showError(_("Error copying kernel"))
+		try:
+			if os.path.exists(ubi_path + '/usr/bin/enigma2'):
+				if not self.copyRootfs(ubi_path, dst_path):
+					rc = False
+			else:
+				self.showError(_("Generic error in unpack process"))
 				rc = False
-		else:
-			self.showError(_("Generic error in unpack process"))
-			rc = False
-
-		Console().ePopen("umount %s" % ubi_path)
-		Console().ePopen("ubidetach -m %s" % mtd)
-		Console().ePopen("rmmod nandsim")
+		finally:
+			os.system("umount %s" % ubi_path)
+			os.system("ubidetach -m %s" % mtd)
+			os.system("rmmod nandsim")
 
 		self.dirtyHack(dst_path)
 
@@ -364,16 +652,15 @@ class OMBManagerInstall(Screen):
 		return rc
 
 	# Based on nfi Extract by gutemine
-	def extractImageNFI(self, nfifile, extractdir):
-		nfidata = open(nfifile, 'r')
+	def extractImageNFI(self, nfidata, extractdir):
+		self.setStage(_("Reading image"))
 		header = nfidata.read(32)
-		if header[:3] != 'NFI':
+		if header[:3] != b'NFI':
 			print('Sorry, old NFI format deteced')
-			nfidata.close()
 			return False
 		else:
-			machine_type = header[4:4 + header[4:].find('\0')]
-			if header[:4] == 'NFI3':
+			machine_type = header[4:4 + header[4:].find(b'\0')].decode('ascii', 'replace')
+			if header[:4] == b'NFI3':
 				machine_type = 'dm7020hdv2'
 
 		print('Dreambox image type: %s' % machine_type)
@@ -403,31 +690,38 @@ class OMBManagerInstall(Screen):
 		(total_size, ) = struct.unpack('!L', nfidata.read(4))
 		print('Total image size: %s Bytes' % total_size)
 
+		stats = ExtractStats(total_size)
+		nfidata = CountingReader(nfidata, stats)
+
+		# nfidata may be a zip member, which can't seek or tell.
+		offset = 36
 		part = 0
-		while nfidata.tell() < total_size:
+		while offset < total_size:
 			(size, ) = struct.unpack('!L', nfidata.read(4))
+			offset += 4 + size
 			print('Processing partition # %d size %d Bytes' % (part, size))
 			output_names = {2: 'kernel.bin', 3: 'rootfs.bin'}
 			if part not in output_names:
-				nfidata.seek(size, 1)
+				skipStream(nfidata, size)
 				print('Skipping %d data...' % size)
 			else:
 				print('Extracting %s with %d blocksize...' % (output_names[part], bs))
 				output_filename = extractdir + '/' + output_names[part]
 				if os.path.exists(output_filename):
 					os.remove(output_filename)
-				output = open(output_filename, 'wb')
 				if part == 2:
-					output.write(nfidata.read(size))
+					src = LimitedReader(nfidata, size)
 				else:
-					for sector in range(size / bso):
-						d = nfidata.read(bso)
-						output.write(d[:bs])
-				output.close()
+					src = OOBStripper(nfidata, size, bs, bso)
+				output = open(output_filename, 'wb')
+				try:
+					copyStream(src, output, stats, self.installProgress, self.write_lock)
+				finally:
+					output.close()
 			part = part + 1
 
-		nfidata.close()
-		print('Extracting %s to %s Finished!' % (nfifile, extractdir))
+		stats.report(self.installProgress, True)
+		print('Extracting NFI to %s Finished!' % extractdir)
 
 		return True
 
@@ -464,13 +758,14 @@ class OMBManagerInstall(Screen):
 			pass
 # OpenMultiboot installed in the multiboot image. where the init will go ?
 		if os.path.exists(dst_path + '/sbin/open_multiboot'):
-			Console().ePopen("rm -f %s/sbin/open_multiboot" % dst_path)
-			Console().ePopen("rm -f %s/sbin/open-multiboot-branding-helper.pyo" % dst_path)
-			Console().ePopen("rm -f %s/etc/ipk-postinsts/*-OpenMultiboot" % dst_path)
+			os.system("rm -f %s/sbin/open_multiboot" % dst_path)
+			os.system("rm -f %s/sbin/open-multiboot-branding-helper.pyo" % dst_path)
+			os.system("rm -f %s/etc/ipk-postinsts/*-OpenMultiboot" % dst_path)
 # We can't create the init symlink because it will be overwrited by OpenMultiboot
-			Console().ePopen("ln -sfn /sbin/init.sysvinit %s/sbin/open_multiboot" % dst_path)
+			os.system("ln -sfn /sbin/init.sysvinit %s/sbin/open_multiboot" % dst_path)
 
 	def afterInstallImage(self, dst_path):
+		self.setStage(_("Finishing"))
 		fix = False
 		error = False
 		file = dst_path + '/etc/init.d/volatile-media.sh'
@@ -485,9 +780,164 @@ class OMBManagerInstall(Screen):
 			except:
 				error = True
 			if not fix and not error:
-				import fileinput
-				for line in fileinput.input(file, inplace=True):
+				# Not fileinput, its inplace mode takes over sys.stdout of
+				# every thread.
+				f = open(file, 'r')
+				lines = f.readlines()
+				f.close()
+				f = open(file, 'w')
+				for line in lines:
 					if 'mount -t tmpfs -o size=64k tmpfs /media' in line:
-						print("mountpoint -q \"/media\" || mount -t tmpfs -o size=64k tmpfs /media")
+						f.write("mountpoint -q \"/media\" || mount -t tmpfs -o size=64k tmpfs /media\n")
 					else:
-						print(line.rstrip())
+						f.write(line.rstrip() + '\n')
+				f.close()
+
+
+class OMBManagerInstallQueue(object):
+	"""Batch of installs to one mount point.
+
+	Up to readInstallJobs() jobs run at once, the others wait in order.
+	The jobs share the write lock of the device, so decompressing runs
+	in parallel while the data is written one chunk at a time.
+	"""
+
+	def __init__(self, mount_point):
+		self.mount_point = mount_point
+		self.data_dir = mount_point + '/' + OMB_DATA_DIR
+		self.jobs = []
+		self.lock = threading.Lock()
+
+	def add(self, selected_image, update=None):
+		job = OMBManagerInstallJob(self.mount_point, selected_image, deviceLock(self.mount_point), self.jobFinished, update)
+		with self.lock:
+			self.jobs.append(job)
+		self.schedule()
+		return job
+
+	def cancel(self, job):
+		cancelled = job.cancel()
+		self.schedule()
+		return cancelled
+
+	def jobFinished(self, job):
+		self.schedule()
+
+	def schedule(self):
+		max_jobs = readInstallJobs(self.data_dir)
+		with self.lock:
+			running = len([job for job in self.jobs if job.thread is not None and not job.done])
+			for job in self.jobs:
+				if job.thread is not None or job.done:
+					continue
+				if job.cancelled:
+					job.stage = _("Cancelled")
+					job.done = True
+				elif running < max_jobs:
+					job.start()
+					running += 1
+
+	def currentJobs(self):
+		with self.lock:
+			return list(self.jobs)
+
+	def isActive(self):
+		with self.lock:
+			return len([job for job in self.jobs if not job.done]) > 0
+
+	def images(self):
+		with self.lock:
+			return [job.selected_image for job in self.jobs]
+
+	def updates(self):
+		with self.lock:
+			return [job.update_identifier for job in self.jobs if job.update_identifier is not None and not job.done]
+
+	def targets(self):
+		with self.lock:
+			return [job.target_identifier for job in self.jobs if job.target_identifier is not None and not job.done]
+
+	def popFinished(self):
+		with self.lock:
+			finished = [job for job in self.jobs if job.done]
+			self.jobs = [job for job in self.jobs if not job.done]
+		return finished
+
+
+# Queues by mount point, they outlive the screens showing them.
+install_queues = {}
+
+
+def getInstallQueue(mount_point):
+	if mount_point not in install_queues:
+		install_queues[mount_point] = OMBManagerInstallQueue(mount_point)
+	return install_queues[mount_point]
+
+
+class OMBManagerInstall(Screen):
+	skin = """
+			<screen position="360,150" size="560,400">
+				<widget name="info"
+						position="10,10"
+						size="540,50"
+						font="Regular;18"
+						zPosition="1" />
+				<widget source="list"
+						render="Listbox"
+						position="10,60"
+						zPosition="1"
+						size="540,290"
+						scrollbarMode="showOnDemand"
+						transparent="1" >
+
+					<convert type="StringList" />
+				</widget>
+				<widget name="key_green"
+						position="0,360"
+						size="140,40"
+						valign="center"
+						halign="center"
+						zPosition="5"
+						transparent="1"
+						foregroundColor="white"
+						font="Regular;18" />
+
+				<ePixmap name="green"
+						 pixmap="buttons/green.png"
+						 position="0,360"
+						 size="140,40"
+						 zPosition="4"
+						 transparent="1"
+						 alphatest="on" />
+			</screen>"""
+
+	def __init__(self, session, mount_point, upload_list):
+		Screen.__init__(self, session)
+
+		self.setTitle(_('openMultiboot Install'))
+
+		self.session = session
+		self.mount_point = mount_point
+		self.upload_list = upload_list
+
+		self['info'] = Label(_("Choose the image to install"))
+		self["list"] = List(upload_list)
+		self["key_green"] = Button(_('Install all'))
+		self["actions"] = ActionMap(["SetupActions", "ColorActions"],
+		{
+			"cancel": self.keyCancel,
+			"ok": self.keyInstall,
+			"green": self.keyInstallAll
+		})
+
+	def keyCancel(self):
+		self.close()
+
+	# The manager list queues the chosen images and shows their progress.
+	def keyInstall(self):
+		selected_image = self["list"].getCurrent()
+		if selected_image:
+			self.close([selected_image])
+
+	def keyInstallAll(self):
+		self.close(self.upload_list)
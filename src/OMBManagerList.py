@@ -32,17 +32,20 @@ from Components.ConfigList import ConfigListScreen
 from Components.Pixmap import Pixmap
 from Components.Sources.List import List
 from Components.Label import Label
-from Components.config import getConfigListEntry, config, ConfigYesNo, NoSave
+from Components.config import getConfigListEntry, config, ConfigYesNo, ConfigSelection, NoSave
 
-from OMBManagerInstall import OMBManagerInstall, OMB_GETBOXTYPE
+from OMBManagerInstall import OMBManagerInstall, OMB_GETBOXTYPE, OMB_INSTALL_JOBS_FILE, OMB_STORE_ENABLED_FILE, getInstallQueue, readInstallJobs
 from OMBManagerAbout import OMBManagerAbout
-from OMBManagerCommon import OMB_DATA_DIR, OMB_UPLOAD_DIR
+from OMBManagerCommon import OMB_DATA_DIR, OMB_UPLOAD_DIR, OMB_STORE_DIR
+from OMBManagerImageInfo import BRANDING_HELPER, IMAGE_INFO_PREFIX, enigma2Paths, readImageInfo
 from OMBManagerLocale import _
+from OMBManagerStore import pruneStore
 
 from enigma import eTimer
 
 import os
-from os import path
+from subprocess import Popen, PIPE, STDOUT
+import threading
 from Components.Console import Console
 
 
@@ -167,8 +170,11 @@ class OMBManagerList(Screen):
 		self.data_dir = mount_point + '/' + OMB_DATA_DIR
 		self.upload_dir = mount_point + '/' + OMB_UPLOAD_DIR
 		self.select = None
-		self.dynamic_loader = None
 		self.running_box_type = None
+		self.install_queue = getInstallQueue(mount_point)
+		self.install_timer = eTimer()
+		self.install_timer.callback.append(self.installPoll)
+		self.onClose.append(self.install_timer.stop)
 
 		self["label1"] = Label(_("Current Running Image:"))
 		self["label2"] = Label("")
@@ -192,22 +198,17 @@ class OMBManagerList(Screen):
 			"menu": self.showMen,
 		})
 
-	def getDynamicLoader(self, base_path):
-		p = Popen("/usr/bin/strings " + base_path + "/bin/echo", shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True, universal_newlines=True)
-		target_dynamic_loader = base_path + p.stdout.read().split("\n")[0].strip()
-		#print ("DYNAMIC_LOADER:", target_dynamic_loader)
-		self.dynamic_loader = target_dynamic_loader
+		if self.install_queue.isActive():
+			self.install_timer.start(1000)
 
 	def setRunningBoxType(self):
 		self.running_box_type = OMB_GETBOXTYPE
-		if path.isdir("/usr/lib64"):
-			e2_path = base_path + '/usr/lib64/enigma2/python'
-		else:
-			e2_path = base_path + '/usr/lib/enigma2/python'
+		e2_path, usrlib_path = enigma2Paths('')
 		if os.path.exists(e2_path + '/boxbranding.so'):
-			helper = os.path.dirname("/usr/bin/python " + os.path.abspath(__file__)) + "/open-multiboot-branding-helper.pyo"
+			helper = "/usr/bin/python " + BRANDING_HELPER
 			p = Popen(helper + " " + e2_path + " box_type", shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True, universal_newlines=True)
 			self.running_box_type = p.stdout.read().strip()
+			p.wait()
 			return True
 
 		try:
@@ -217,51 +218,23 @@ class OMBManagerList(Screen):
 			pass
 		return False
 
-	def isCompatible(self, base_path):
-		box_type = OMB_GETBOXTYPE
-		if path.isdir("/usr/lib64"):
-			e2_path = base_path + '/usr/lib64/enigma2/python'
-			usrlib_path = '/usr/lib64'
-		else:
-			e2_path = base_path + '/usr/lib/enigma2/python'
-			usrlib_path = '/usr/lib'
-		if os.path.exists(e2_path + '/boxbranding.so'):
-			helper = "LC_ALL=C LD_LIBRARY_PATH=" + base_path + "/lib:" + base_path + usrlib_path + " " + self.dynamic_loader + " " + base_path + "/usr/bin/python " + os.path.dirname(os.path.abspath(__file__)) + "/open-multiboot-branding-helper.pyo"
-			p = Popen(helper + " " + e2_path + " box_type", shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True, universal_newlines=True)
-			box_type = p.stdout.read().strip()
+	def isCompatible(self, info):
+		if info['loader']:
+			return (self.running_box_type == info['box_type'])
 
-			return (self.running_box_type == box_type)
-		try:
-			archconffile = "%s/etc/opkg/arch.conf" % base_path
-			with open(archconffile, "r") as arch:
-				for line in arch:
-					box_type = line.split()[1]
-					if self.running_box_type == box_type or self.running_box_type in line:
-						return True
-		except:
-			pass
+		if not self.running_box_type:
+			return False
 
-		return False
+		for line in info['archs']:
+			fields = line.split()
+			if len(fields) > 1 and self.running_box_type == fields[1] or self.running_box_type in line:
+				return True
 
-	def guessImageTitle(self, base_path, identifier):
-		image_distro = ""
-		image_version = ""
-		if path.isdir("/usr/lib64"):
-			e2_path = base_path + '/usr/lib64/enigma2/python'
-			usrlib_path = '/usr/lib64'
-		else:
-			e2_path = base_path + '/usr/lib/enigma2/python'
-			usrlib_path = '/usr/lib'
+		return False
 
-		if os.path.exists(e2_path + '/boxbranding.so'):
-			helper = "LC_ALL=C LD_LIBRARY_PATH=" + base_path + "/lib:" + base_path + usrlib_path + " " + self.dynamic_loader + " " + base_path + "/usr/bin/python " + os.path.dirname(os.path.abspath(__file__)) + "/open-multiboot-branding-helper.pyo"
-			fin, fout = os.popen4(helper + " " + e2_path + " image_distro")
-			image_distro = fout.read().strip()
-			fin, fout = os.popen4(helper + " " + e2_path + " image_version")
-			image_version = fout.read().strip()
-
-		if len(image_distro) > 0:
-			return image_distro + " " + image_version
+	def guessImageTitle(self, info, identifier):
+		if len(info['distro']) > 0:
+			return info['distro'] + " " + info['version']
 		else:
 			return identifier
 
@@ -286,25 +259,28 @@ class OMBManagerList(Screen):
 		})
 		self.images_list.append(self.images_entries[0]['label'])
 
-		self.setRunningBoxType()
+		# Asked once, the running image doesn't change.
+		if self.running_box_type is None:
+			self.setRunningBoxType()
 
 		if os.path.exists(self.data_dir):
+			# Folders being installed show up as their jobs below.
+			targets = self.install_queue.targets()
 			for file_entry in os.listdir(self.data_dir):
 				if not os.path.isdir(self.data_dir + '/' + file_entry):
 					continue
 
-				if file_entry[0] == '.':
+				if file_entry[0] == '.' or file_entry in targets:
 					continue
 
-				self.getDynamicLoader(self.data_dir + '/' + file_entry)
-
-				if not self.isCompatible(self.data_dir + '/' + file_entry):
+				info = readImageInfo(self.data_dir, file_entry)
+				if not self.isCompatible(info):
 					continue
 
 				if os.path.exists(self.data_dir + '/.label_' + file_entry):
 					title = self.imageTitleFromLabel('.label_' + file_entry)
 				else:
-					title = self.guessImageTitle(self.data_dir + '/' + file_entry, file_entry)
+					title = self.guessImageTitle(info, file_entry)
 
 				self.images_entries.append({
 					'label': title,
@@ -315,6 +291,35 @@ class OMBManagerList(Screen):
 				})
 				self.images_list.append(title)
 
+		# Queued and running installs follow the installed images.
+		for job in self.install_queue.currentJobs():
+			self.images_entries.append({
+				'label': self.installStatusLabel(job),
+				'identifier': None,
+				'path': None,
+				'job': job
+			})
+			self.images_list.append(self.installStatusLabel(job))
+
+	def installStatusLabel(self, job):
+		return '%s: %s' % (job.selected_image, job.statusText())
+
+	def installPoll(self):
+		finished = self.install_queue.popFinished()
+		for job in finished:
+			if job.error:
+				self.session.open(MessageBox, job.error, type=MessageBox.TYPE_ERROR)
+
+		if finished:
+			self.refresh()
+		else:
+			for index, entry in enumerate(self.images_entries):
+				if 'job' in entry:
+					self["list"].modifyEntry(index, self.installStatusLabel(entry['job']))
+
+		if not self.install_queue.isActive():
+			self.install_timer.stop()
+
 	def refresh(self):
 		self.populateImagesList()
 		self["list"].setList(self.images_list)
@@ -336,6 +341,8 @@ class OMBManagerList(Screen):
 
 		if entry['path'] == '/' or entry['identifier'] == selected:
 			return False
+		if entry['identifier'] in self.install_queue.updates() or entry['identifier'] in self.install_queue.targets():
+			return False
 		return True
 
 	def onSelectionChanged(self):
@@ -345,13 +352,20 @@ class OMBManagerList(Screen):
 		index = self["list"].getIndex()
 		if index >= 0 and index < len(self.images_entries):
 			entry = self.images_entries[index]
-			if self.canDeleteEntry(entry):
+			if 'job' in entry:
+				self["key_yellow"].setText(_('Cancel'))
+			elif self.canDeleteEntry(entry):
 				self["key_yellow"].setText(_('Delete'))
 			else:
 				self["key_yellow"].setText('')
 
 	def KeyOk(self):
 		self.select = self["list"].getIndex()
+		if 'job' in self.images_entries[self.select]:
+			return
+		# The list may predate an install that started on this image.
+		if self.images_entries[self.select]['identifier'] in self.install_queue.targets():
+			return
 		name = self["list"].getCurrent()
 		self.session.openWithCallback(self.confirmNextbootCB, MessageBox, _('Set next boot to %s ?') % name, MessageBox.TYPE_YESNO)
 
@@ -369,6 +383,12 @@ class OMBManagerList(Screen):
 
 	def showMen(self):
 		myoptions = [['Preferences', 'preferences'], ['About', 'about']]
+		index = self["list"].getIndex()
+		if index >= 0 and index < len(self.images_entries):
+			entry = self.images_entries[index]
+			if 'job' not in entry and self.canDeleteEntry(entry):
+				self.entry_to_update = entry
+				myoptions.insert(0, [_('Update %s') % entry['label'], 'update'])
 		self.session.openWithCallback(self.doshowMen, ChoiceBox, title=_("Open MultiBoot Menu"), list=myoptions)
 
 	def doshowMen(self, sel):
@@ -377,9 +397,13 @@ class OMBManagerList(Screen):
 				self.session.open(OMBManagerPreferences, self.data_dir)
 			elif sel[1] == "about":
 				self.session.open(OMBManagerAbout)
+			elif sel[1] == "update":
+				self.keyUpdate()
 
 	def keyRename(self):
 		self.renameIndex = self["list"].getIndex()
+		if 'job' in self.images_entries[self.renameIndex]:
+			return
 		name = self["list"].getCurrent()
 		if self["list"].getIndex() == 0:
 			if name.endswith('(Flash)'):
@@ -400,7 +424,7 @@ class OMBManagerList(Screen):
 			self.refresh()
 
 	def deleteConfirm(self, confirmed):
-		if confirmed and len(self.entry_to_delete['path']) > 1:
+		if confirmed and len(self.entry_to_delete['path']) > 1 and self.canDeleteEntry(self.entry_to_delete):
 			self.messagebox = self.session.open(MessageBox, _('Please wait while delete is in progress.'), MessageBox.TYPE_INFO, enable_input=False)
 			self.timer = eTimer()
 			self.timer.callback.append(self.deleteImage)
@@ -408,12 +432,20 @@ class OMBManagerList(Screen):
 
 	def deleteImage(self):
 		self.timer.stop()
-		Console().ePopen("rm -rf %s" % self.entry_to_delete['path'])
+		Console().ePopen("rm -rf %s" % self.entry_to_delete['path'], self.deleteDone)
 		Console().ePopen("rm -f %s" % self.entry_to_delete['kernelbin'])
 		Console().ePopen("rm -f %s" % self.entry_to_delete['labelfile'])
+		Console().ePopen("rm -f %s/.manifest_%s" % (self.data_dir, self.entry_to_delete['identifier']))
+		Console().ePopen("rm -f %s/%s%s" % (self.data_dir, IMAGE_INFO_PREFIX, self.entry_to_delete['identifier']))
 		self.messagebox.close()
 		self.refresh()
 
+	def deleteDone(self, result, retval, extra_args=None):
+		# Drop the shared files only the deleted image used.
+		thread = threading.Thread(target=pruneStore, args=(self.data_dir + '/' + OMB_STORE_DIR,))
+		thread.daemon = True
+		thread.start()
+
 	def keyDelete(self):
 		if len(self.images_entries) == 0:
 			return
@@ -421,21 +453,28 @@ class OMBManagerList(Screen):
 		index = self["list"].getIndex()
 		if index >= 0 and index < len(self.images_entries):
 			self.entry_to_delete = self.images_entries[index]
-			if self.canDeleteEntry(self.entry_to_delete):
+			if 'job' in self.entry_to_delete and not self.entry_to_delete['job'].cancellable:
+				self.showUpdateRunning(self.entry_to_delete['job'])
+			elif 'job' in self.entry_to_delete:
+				self.session.openWithCallback(self.cancelInstallConfirm, MessageBox, _("Do you want to cancel the installation of %s?") % self.entry_to_delete['job'].selected_image, MessageBox.TYPE_YESNO)
+			elif self.canDeleteEntry(self.entry_to_delete):
 				self.session.openWithCallback(self.deleteConfirm, MessageBox, _("Do you want to delete %s?") % self.entry_to_delete['label'], MessageBox.TYPE_YESNO)
 
-	def keyInstall(self):
+	def uploadList(self):
 		upload_list = []
 		if os.path.exists(self.upload_dir):
 			for file_entry in os.listdir(self.upload_dir):
 				if file_entry[0] == '.' or file_entry == 'flash.zip':
 					continue
 
-				if len(file_entry) > 4 and file_entry[-4:] == '.zip':
+				if len(file_entry) > 4 and file_entry[-4:] == '.zip' and file_entry[:-4] not in self.install_queue.images():
 					upload_list.append(file_entry[:-4])
+		return upload_list
 
+	def keyInstall(self):
+		upload_list = self.uploadList()
 		if len(upload_list) > 0:
-			self.session.openWithCallback(self.refresh, OMBManagerInstall, self.mount_point, upload_list)
+			self.session.openWithCallback(self.installCallback, OMBManagerInstall, self.mount_point, upload_list)
 		else:
 			self.session.open(
 				MessageBox,
@@ -443,6 +482,41 @@ class OMBManagerList(Screen):
 				type=MessageBox.TYPE_ERROR
 			)
 
+	def keyUpdate(self):
+		upload_list = self.uploadList()
+		if len(upload_list) > 0:
+			self.session.openWithCallback(self.updateCallback, ChoiceBox, title=_("Update %s with") % self.entry_to_update['label'], list=[(image, image) for image in sorted(upload_list)])
+		else:
+			self.session.open(
+				MessageBox,
+				_("Please upload an image inside %s") % self.upload_dir,
+				type=MessageBox.TYPE_ERROR
+			)
+
+	def updateCallback(self, sel):
+		if sel:
+			self.install_queue.add(sel[1], self.entry_to_update['identifier'])
+			self.install_timer.start(1000)
+		self.refresh()
+
+	def installCallback(self, images=None):
+		if images:
+			for image in images:
+				self.install_queue.add(image)
+			self.install_timer.start(1000)
+		self.refresh()
+
+	def cancelInstallConfirm(self, confirmed):
+		if confirmed and not self.install_queue.cancel(self.entry_to_delete['job']):
+			self.showUpdateRunning(self.entry_to_delete['job'])
+
+	def showUpdateRunning(self, job):
+		self.session.open(
+			MessageBox,
+			_("%s is being updated in place and can't be cancelled any more") % job.selected_image,
+			type=MessageBox.TYPE_INFO
+		)
+
 
 # TODO: Move into a separate file
 class OMBManagerPreferences(Screen, ConfigListScreen):
@@ -473,6 +547,12 @@ class OMBManagerPreferences(Screen, ConfigListScreen):
 			self.bootmenu_enabled.value = False
 		self.list.append(getConfigListEntry(_("Enable Boot Menu"), self.bootmenu_enabled))
 
+		self.install_jobs = NoSave(ConfigSelection(choices=[str(i) for i in range(1, 5)], default=str(min(readInstallJobs(self.data_dir), 4))))
+		self.list.append(getConfigListEntry(_("Concurrent installs"), self.install_jobs))
+
+		self.store_enabled = NoSave(ConfigYesNo(default=os.path.isfile(self.data_dir + '/' + OMB_STORE_ENABLED_FILE)))
+		self.list.append(getConfigListEntry(_("Share identical files between images (needs btrfs or xfs reflinks)"), self.store_enabled))
+
 		self["config"].list = self.list
 		self["config"].l.setList(self.list)
 
@@ -483,4 +563,13 @@ class OMBManagerPreferences(Screen, ConfigListScreen):
 		else:
 			if not os.path.isfile(self.data_dir + '/.bootmenu.lock'):
 				Console().ePopen("touch %s/.bootmenu.lock" % self.data_dir)
+		try:
+			open(self.data_dir + '/' + OMB_INSTALL_JOBS_FILE, 'w').write(self.install_jobs.value)
+		except IOError:
+			pass
+		if self.store_enabled.value:
+			if not os.path.isfile(self.data_dir + '/' + OMB_STORE_ENABLED_FILE):
+				Console().ePopen("touch %s/%s" % (self.data_dir, OMB_STORE_ENABLED_FILE))
+		elif os.path.isfile(self.data_dir + '/' + OMB_STORE_ENABLED_FILE):
+			os.remove(self.data_dir + '/' + OMB_STORE_ENABLED_FILE)
 		self.close()
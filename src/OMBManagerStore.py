@@ -0,0 +1,284 @@
+#############################################################################
+#
+# Copyright (C) 2014 Impex-Sat Gmbh & Co.KG
+# Written by Sandro Cavazzoni <sandro@skanetwork.com>
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#############################################################################
+
+# Content addressed store the installed images share identical files
+# through, as copy-on-write clones. No Enigma2 imports here, like
+# OMBManagerExtract.
+
+from __future__ import print_function
+
+import errno
+import hashlib
+import os
+import stat
+import tempfile
+
+from OMBManagerExtract import COPY_BUFFER_SIZE, ExtractStats, copyMetadata, scanTree
+
+# Smaller files save too little to be worth hashing.
+STORE_MIN_SIZE = 1024
+
+# Suffix of the temporary clone renamed over a shared file.
+STORE_TMP_SUFFIX = '.omb-store'
+
+# Folder of the store holding, per image, the entries it uses.
+STORE_REFS_DIR = '.refs'
+
+# linux/fs.h FICLONE ioctl.
+FICLONE = 0x40049409
+
+# Errors telling that the filesystem can't clone files.
+REFLINK_ERRORS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS)
+
+
+def fileDigest(path):
+	"""Hex SHA-1 of the contents of file path."""
+	digest = hashlib.sha1()
+	f = open(path, 'rb')
+	try:
+		while True:
+			data = f.read(COPY_BUFFER_SIZE)
+			if not data:
+				break
+			digest.update(data)
+	finally:
+		f.close()
+	return digest.hexdigest()
+
+
+def storeKey(digest, st):
+	"""Store name of a regular file with fileDigest digest and lstat st.
+
+	Files share an entry when content, mode and owner match, the times
+	of the first file added are kept.
+	"""
+	return '%s/%s-%o-%d-%d' % (digest[:2], digest[2:], stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid)
+
+
+def reflink(src, dst):
+	"""Create dst sharing the data of src copy-on-write.
+
+	Returns False, leaving no dst, when the filesystem can't clone.
+	"""
+	import fcntl
+
+	src_fd = os.open(src, os.O_RDONLY)
+	try:
+		dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+		try:
+			fcntl.ioctl(dst_fd, FICLONE, src_fd)
+		except (IOError, OSError) as e:
+			os.close(dst_fd)
+			os.remove(dst)
+			if e.errno in REFLINK_ERRORS:
+				return False
+			raise
+		os.close(dst_fd)
+	finally:
+		os.close(src_fd)
+	return True
+
+
+def canReflink(store_path):
+	"""True when files in store_path can be cloned."""
+	fd, src = tempfile.mkstemp(STORE_TMP_SUFFIX, 'reflink', store_path)
+	dst = src + '.clone'
+	with os.fdopen(fd, 'wb') as f:
+		f.write(b'\0' * 4096)
+	try:
+		if not reflink(src, dst):
+			return False
+		os.remove(dst)
+		return True
+	finally:
+		os.remove(src)
+
+
+def hasXattrs(path):
+	if not hasattr(os, 'listxattr'):
+		return False
+	try:
+		return len(os.listxattr(path, follow_symlinks=False)) > 0
+	except OSError:
+		return False
+
+
+def addFile(path, st, stored, digest):
+	"""Make path a clone of store entry stored, both with digest.
+
+	The entry is created from path when missing. Returns True when path
+	now shares the data of an earlier file.
+	"""
+	if not os.path.isdir(os.path.dirname(stored)):
+		try:
+			os.makedirs(os.path.dirname(stored))
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+	tmp = path + STORE_TMP_SUFFIX
+	# Installs running side by side and pruneStore may add or remove the
+	# entry meanwhile, the second round sees what they left.
+	for attempt in range(2):
+		try:
+			stored_st = os.lstat(stored)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			try:
+				# A clone, so writes to path don't reach the store.
+				if reflink(path, stored):
+					copyMetadata(path, stored, st)
+				return False
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+				continue
+
+		# Only an entry still holding the data it is named by is shared.
+		if stored_st.st_size != st.st_size or fileDigest(stored) != digest:
+			return False
+
+		try:
+			if not reflink(stored, tmp):
+				return False
+			copyMetadata(path, tmp, st)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
+			continue
+		os.rename(tmp, path)
+		return True
+	return False
+
+
+def storeTree(image_path, store_path, progress=None):
+	"""Share the files of image_path with the other images in store_path.
+
+	Files of STORE_MIN_SIZE and more are hashed and identical ones are
+	cloned from the store. Only filesystems with reflinks share data,
+	elsewhere the images are left as they are, as a hardlink would let
+	a write in one image show in all. Files already hardlinked or with
+	xattrs are left alone too. The entries the image uses are listed
+	below STORE_REFS_DIR for pruneStore. progress is called with an
+	ExtractStats hashing against the total size, exceptions it raises
+	stop the scan. Returns (files, bytes) now shared.
+	"""
+	if not os.path.isdir(store_path):
+		os.makedirs(store_path)
+	if not canReflink(store_path):
+		return 0, 0
+
+	entries = []
+	dirs = {image_path: os.lstat(image_path)}
+	for path, st in scanTree(image_path):
+		if stat.S_ISDIR(st.st_mode):
+			dirs[path] = st
+		if stat.S_ISREG(st.st_mode) and st.st_size >= STORE_MIN_SIZE and st.st_nlink == 1:
+			entries.append((path, st))
+
+	stats = ExtractStats(sum([st.st_size for path, st in entries]))
+	shared_files = 0
+	shared_bytes = 0
+	changed = set()
+	keys = []
+	for path, st in entries:
+		if not hasXattrs(path):
+			digest = fileDigest(path)
+			key = storeKey(digest, st)
+			keys.append(key)
+			if addFile(path, st, os.path.join(store_path, key), digest):
+				shared_files += 1
+				shared_bytes += st.st_size
+				changed.add(os.path.dirname(path))
+		stats.add(bytes_in=st.st_size, files=1)
+		stats.report(progress)
+
+	writeRefs(store_path, os.path.basename(image_path), keys)
+
+	# Replacing files touched the times of their folders.
+	for path in changed:
+		if path in dirs:
+			os.utime(path, (dirs[path].st_atime, dirs[path].st_mtime))
+
+	stats.report(progress, True)
+	return shared_files, shared_bytes
+
+
+def writeRefs(store_path, identifier, keys):
+	"""List keys as the store entries image identifier uses."""
+	refs_path = os.path.join(store_path, STORE_REFS_DIR)
+	if not os.path.isdir(refs_path):
+		try:
+			os.makedirs(refs_path)
+		except OSError as e:
+			if e.errno != errno.EEXIST:
+				raise
+
+	tmp = os.path.join(refs_path, identifier + STORE_TMP_SUFFIX)
+	f = open(tmp, 'w')
+	try:
+		for key in keys:
+			f.write(key + '\n')
+	finally:
+		f.close()
+	os.rename(tmp, os.path.join(refs_path, identifier))
+
+
+def pruneStore(store_path):
+	"""Remove store entries no installed image uses any more.
+
+	The images sit next to the store, the lists of those deleted go
+	too. An entry added by an install while this runs may go as well,
+	which only costs the sharing with later installs.
+	"""
+	if not os.path.isdir(store_path):
+		return
+
+	data_dir = os.path.dirname(store_path)
+	refs_path = os.path.join(store_path, STORE_REFS_DIR)
+	used = set()
+	if os.path.isdir(refs_path):
+		for name in os.listdir(refs_path):
+			if name.endswith(STORE_TMP_SUFFIX):
+				continue
+			try:
+				if not os.path.isdir(os.path.join(data_dir, name)):
+					os.remove(os.path.join(refs_path, name))
+					continue
+				f = open(os.path.join(refs_path, name), 'r')
+				try:
+					used.update([line.rstrip('\n') for line in f])
+				finally:
+					f.close()
+			except (IOError, OSError):
+				pass
+
+	for path, st in scanTree(store_path):
+		key = os.path.relpath(path, store_path)
+		if key.split(os.sep)[0] == STORE_REFS_DIR or STORE_TMP_SUFFIX in key:
+			continue
+		if stat.S_ISREG(st.st_mode) and key not in used:
+			try:
+				os.remove(path)
+			except OSError:
+				pass
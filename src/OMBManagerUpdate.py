@@ -0,0 +1,323 @@
+#############################################################################
+#
+# Copyright (C) 2014 Impex-Sat Gmbh & Co.KG
+# Written by Sandro Cavazzoni <sandro@skanetwork.com>
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#############################################################################
+
+# Update of an installed image in place, writing only what changed. No
+# Enigma2 imports here, like OMBManagerExtract.
+
+from __future__ import print_function
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from OMBManagerExtract import COPY_BUFFER_SIZE, copyFile, copyStream, scanTree
+from OMBManagerStore import fileDigest
+
+# Same size files are compared in memory up to this size, bigger ones
+# spill to the spool folder.
+UPDATE_SPOOL_SIZE = 16 * 1024 * 1024
+
+# Suffix of the copy renamed over a hardlinked file before it changes.
+UPDATE_TMP_SUFFIX = '.omb-update'
+
+def _encode(name):
+	if sys.version_info[0] >= 3:
+		return os.fsencode(name)
+	return name
+
+
+def _decode(name):
+	if sys.version_info[0] >= 3:
+		return os.fsdecode(name)
+	return name
+
+
+def readManifest(path):
+	"""Dict of (size, mtime, digest) by file name, stored by writeManifest.
+
+	digest is None for files not hashed yet. Returns an empty dict when
+	path is missing.
+	"""
+	manifest = {}
+	try:
+		f = open(path, 'rb')
+	except IOError:
+		return manifest
+
+	try:
+		for line in f:
+			fields = line.rstrip(b'\n').split(b' ', 3)
+			if len(fields) != 4:
+				continue
+			digest, size, mtime, name = fields
+			try:
+				size = int(size)
+				mtime = int(mtime)
+			except ValueError:
+				continue
+			if digest == b'-':
+				digest = None
+			else:
+				digest = str(digest.decode('ascii'))
+			manifest[_decode(name)] = (size, mtime, digest)
+	finally:
+		f.close()
+	return manifest
+
+
+def writeManifest(path, manifest):
+	"""Save manifest, see readManifest."""
+	tmp = path + '.tmp'
+	f = open(tmp, 'wb')
+	try:
+		for name in sorted(manifest):
+			size, mtime, digest = manifest[name]
+			if '\n' in name:
+				continue
+			f.write(b' '.join([(digest or '-').encode('ascii'), str(size).encode('ascii'),
+				str(mtime).encode('ascii'), _encode(name)]) + b'\n')
+	finally:
+		f.close()
+	os.rename(tmp, path)
+
+
+def memberName(name):
+	"""Path of a tar member relative to the image root, None for the root."""
+	name = os.path.normpath(name).lstrip('/')
+	if name in ('', '.'):
+		return None
+	return name
+
+
+def memberFormat(tarinfo):
+	"""stat file type of a device or fifo tar member."""
+	if tarinfo.ischr():
+		return stat.S_IFCHR
+	if tarinfo.isblk():
+		return stat.S_IFBLK
+	return stat.S_IFIFO
+
+
+def setMemberMetadata(path, tarinfo, st=None, lock=None):
+	"""Give path the owner, mode and time of tarinfo.
+
+	st is the lstat result of path, what already matches is left alone.
+	A hardlinked regular file may be shared with the store or other
+	images, it is replaced by a copy of its own, written holding lock,
+	before anything changes.
+	"""
+	if st is not None and stat.S_ISREG(st.st_mode) and st.st_nlink > 1 and \
+			((st.st_uid, st.st_gid) != (tarinfo.uid, tarinfo.gid) or
+			stat.S_IMODE(st.st_mode) != tarinfo.mode or int(st.st_mtime) != tarinfo.mtime):
+		copyFile(path, path + UPDATE_TMP_SUFFIX, lock=lock)
+		os.rename(path + UPDATE_TMP_SUFFIX, path)
+		st = None
+
+	if st is None or (st.st_uid, st.st_gid) != (tarinfo.uid, tarinfo.gid):
+		os.lchown(path, tarinfo.uid, tarinfo.gid)
+	if tarinfo.issym():
+		return
+	if st is None or stat.S_IMODE(st.st_mode) != tarinfo.mode:
+		os.chmod(path, tarinfo.mode)
+	if st is None or int(st.st_mtime) != tarinfo.mtime:
+		os.utime(path, (tarinfo.mtime, tarinfo.mtime))
+
+
+class ImageUpdate(object):
+	"""Update of the installed image in dst_path to a new image.
+
+	extractTar offers every member of the new image to keepMember before
+	extracting it, which returns True when the installed entry already
+	matches. Otherwise it is removed, so a new file is created rather
+	than writing into one shared with the store. Same size files with
+	other times are compared by content, the digests of installed files
+	are cached in manifest_file. spool_dir holds the tar data compared
+	that doesn't fit in memory. extractTar sets complete once it read
+	the whole image, only then finish() deletes what the new image
+	doesn't have and saves the manifest.
+	"""
+
+	def __init__(self, dst_path, manifest_file, spool_dir=None):
+		self.dst_path = dst_path
+		self.manifest_file = manifest_file
+		self.spool_dir = spool_dir
+		self.manifest = readManifest(manifest_file)
+		self.new_manifest = {}
+		self.existing = {}
+		for path, st in scanTree(dst_path):
+			self.existing[os.path.relpath(path, dst_path)] = st
+		self.seen = set()
+		self.complete = False
+		self.dir_times = {}
+		self.kept = 0
+		self.written = 0
+		self.removed = 0
+
+	def prepare(self, name):
+		"""lstat result of installed entry name, None when missing."""
+		parent = name
+		while parent and parent not in self.seen:
+			self.seen.add(parent)
+			parent = os.path.dirname(parent)
+		return self.existing.get(name)
+
+	def cachedDigest(self, name, st):
+		entry = self.manifest.get(name)
+		if entry and entry[0] == st.st_size and entry[1] == int(st.st_mtime):
+			return entry[2]
+		return None
+
+	def installedDigest(self, name, st):
+		digest = self.cachedDigest(name, st)
+		if digest is None:
+			digest = fileDigest(os.path.join(self.dst_path, name))
+		return digest
+
+	def record(self, name, size, mtime, digest=None):
+		self.new_manifest[name] = (size, int(mtime), digest)
+
+	def clear(self, path, st):
+		if stat.S_ISDIR(st.st_mode):
+			shutil.rmtree(path)
+		else:
+			os.remove(path)
+
+	def keepMember(self, tar, tarinfo, lock=None):
+		"""True when tar member tarinfo needn't be extracted.
+
+		Same size regular files are read from tar and compared, when they
+		differ the new data is written here holding lock, see copyStream.
+		"""
+		name = memberName(tarinfo.name)
+		if name is None:
+			return False
+
+		old = self.prepare(name)
+		if tarinfo.isdir():
+			self.dir_times[name] = tarinfo.mtime
+		if old is None:
+			if tarinfo.isreg():
+				self.record(name, tarinfo.size, tarinfo.mtime)
+				self.written += 1
+			return False
+
+		path = os.path.join(self.dst_path, name)
+		if tarinfo.isdir():
+			if stat.S_ISDIR(old.st_mode):
+				return False
+		elif tarinfo.isreg():
+			if stat.S_ISREG(old.st_mode) and old.st_size == tarinfo.size:
+				self.updateMember(tar, tarinfo, name, path, old, lock)
+				return True
+			self.record(name, tarinfo.size, tarinfo.mtime)
+			self.written += 1
+		elif tarinfo.issym():
+			if stat.S_ISLNK(old.st_mode) and os.readlink(path) == tarinfo.linkname:
+				setMemberMetadata(path, tarinfo, old)
+				return True
+		elif tarinfo.ischr() or tarinfo.isblk() or tarinfo.isfifo():
+			if stat.S_IFMT(old.st_mode) == memberFormat(tarinfo) and (tarinfo.isfifo() or
+					old.st_rdev == os.makedev(tarinfo.devmajor, tarinfo.devminor)):
+				setMemberMetadata(path, tarinfo, old)
+				return True
+
+		# Hardlinks and entries changing kind are made anew.
+		self.clear(path, old)
+		return False
+
+	def updateMember(self, tar, tarinfo, name, path, old, lock=None):
+		"""Keep or rewrite the same size regular file path from tarinfo."""
+		if int(old.st_mtime) == tarinfo.mtime:
+			self.record(name, tarinfo.size, tarinfo.mtime, self.cachedDigest(name, old))
+			setMemberMetadata(path, tarinfo, old, lock)
+			self.kept += 1
+			return
+
+		spool = tempfile.SpooledTemporaryFile(UPDATE_SPOOL_SIZE, dir=self.spool_dir)
+		try:
+			digest = hashlib.sha1()
+			src = tar.extractfile(tarinfo)
+			while True:
+				data = src.read(COPY_BUFFER_SIZE)
+				if not data:
+					break
+				digest.update(data)
+				spool.write(data)
+			digest = digest.hexdigest()
+
+			if digest == self.installedDigest(name, old):
+				setMemberMetadata(path, tarinfo, old, lock)
+				self.kept += 1
+			else:
+				os.remove(path)
+				spool.seek(0)
+				dst = open(path, 'wb')
+				try:
+					copyStream(spool, dst, lock=lock)
+				finally:
+					dst.close()
+				setMemberMetadata(path, tarinfo)
+				self.written += 1
+			self.record(name, tarinfo.size, tarinfo.mtime, digest)
+		finally:
+			spool.close()
+
+	def finish(self):
+		"""Delete what the new image doesn't have and save the manifest."""
+		# Entries of a partly read image are missing from seen too.
+		if not self.complete:
+			raise IOError('image not read to the end, nothing removed')
+
+		# Reversed, contents come before their folder.
+		changed = set()
+		for name in sorted(self.existing, reverse=True):
+			if name in self.seen:
+				continue
+			path = os.path.join(self.dst_path, name)
+			try:
+				if stat.S_ISDIR(self.existing[name].st_mode):
+					os.rmdir(path)
+				else:
+					os.remove(path)
+				self.removed += 1
+				changed.add(os.path.dirname(name))
+			except OSError as e:
+				# Gone with a folder replaced by a file.
+				if e.errno != errno.ENOENT:
+					raise
+
+		# Removing files touched the times tar gave their folders. Only
+		# folders, a file in their place may be shared.
+		for name in changed:
+			path = os.path.join(self.dst_path, name)
+			if name in self.dir_times and os.path.isdir(path) and not os.path.islink(path):
+				mtime = self.dir_times[name]
+				os.utime(path, (mtime, mtime))
+
+		writeManifest(self.manifest_file, self.new_manifest)
+
+	def __str__(self):
+		return '%d files kept, %d written, %d removed' % (self.kept, self.written, self.removed)
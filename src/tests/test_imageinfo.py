@@ -0,0 +1,96 @@
+# Tests of the image info cache, run from this folder with
+# python -m unittest discover
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OMBManagerImageInfo
+from OMBManagerImageInfo import IMAGE_INFO_PREFIX, readImageInfo, writeImageInfo
+
+ARCHS = ['arch all 1', 'arch mips32el 16', 'arch solo 41']
+
+
+class ImageInfoTest(unittest.TestCase):
+
+	def setUp(self):
+		self.data_dir = tempfile.mkdtemp()
+		self.probes = []
+		self.probeImageInfo = OMBManagerImageInfo.probeImageInfo
+		OMBManagerImageInfo.probeImageInfo = self.probe
+		self.makeImage()
+
+	def tearDown(self):
+		OMBManagerImageInfo.probeImageInfo = self.probeImageInfo
+		shutil.rmtree(self.data_dir)
+
+	def probe(self, base_path):
+		self.probes.append(base_path)
+		return self.probeImageInfo(base_path)
+
+	def makeImage(self, archs=ARCHS):
+		"""Image without boxbranding, known by its opkg archs."""
+		opkg = os.path.join(self.data_dir, 'image', 'etc', 'opkg')
+		os.makedirs(opkg)
+		f = open(os.path.join(opkg, 'arch.conf'), 'w')
+		try:
+			f.write(''.join([line + '\n' for line in archs]) + '\n')
+		finally:
+			f.close()
+		os.utime(os.path.join(self.data_dir, 'image'), (1000, 1000))
+
+	def cacheFile(self):
+		return os.path.join(self.data_dir, IMAGE_INFO_PREFIX + 'image')
+
+	def testCached(self):
+		info = writeImageInfo(self.data_dir, 'image')
+		self.assertEqual(info['archs'], ARCHS)
+		self.assertEqual(info['box_type'], '')
+		self.assertEqual(len(self.probes), 1)
+		self.assertEqual(readImageInfo(self.data_dir, 'image'), info)
+		self.assertEqual(len(self.probes), 1)
+
+	def testMtimeChanged(self):
+		writeImageInfo(self.data_dir, 'image')
+		os.utime(os.path.join(self.data_dir, 'image'), (2000, 2000))
+		readImageInfo(self.data_dir, 'image')
+		self.assertEqual(len(self.probes), 2)
+		readImageInfo(self.data_dir, 'image')
+		self.assertEqual(len(self.probes), 2)
+
+	def testFolderReplaced(self):
+		writeImageInfo(self.data_dir, 'image')
+		# Kept so the new folder can't reuse its inode.
+		os.rename(os.path.join(self.data_dir, 'image'), os.path.join(self.data_dir, 'old'))
+		self.makeImage(['arch all 1'])
+		self.assertEqual(readImageInfo(self.data_dir, 'image')['archs'], ['arch all 1'])
+		self.assertEqual(len(self.probes), 2)
+
+	def testCacheMissing(self):
+		self.assertEqual(readImageInfo(self.data_dir, 'image')['archs'], ARCHS)
+		self.assertEqual(len(self.probes), 1)
+		self.assertTrue(os.path.exists(self.cacheFile()))
+		self.assertFalse(os.path.exists(self.cacheFile() + '.tmp'))
+
+	def testCachePartial(self):
+		writeImageInfo(self.data_dir, 'image')
+		f = open(self.cacheFile(), 'r')
+		try:
+			lines = f.readlines()
+		finally:
+			f.close()
+		f = open(self.cacheFile(), 'w')
+		try:
+			f.write(''.join([line for line in lines if not line.startswith('version=')]))
+		finally:
+			f.close()
+		self.assertEqual(readImageInfo(self.data_dir, 'image')['version'], '')
+		self.assertEqual(len(self.probes), 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,193 @@
+# Tests of the JFFS2 reader on generated images, run from this folder
+# with python -m unittest discover
+
+import os
+import shutil
+import stat
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OMBManagerExtract import extractJFFS2, loadUbiReader
+
+loadUbiReader()
+from jffs2 import jffs2
+from jffs2.defines import *
+from jffs2.misc import jffs2_crc, rtime_decompress
+
+MODE_DIR = stat.S_IFDIR | 0o755
+MODE_FILE = stat.S_IFREG | 0o644
+
+
+def rtimeCompress(data):
+	"""Port of the kernel's rtime compressor, see rtime_decompress."""
+	data = bytearray(data)
+	out = bytearray()
+	positions = [0] * 256
+	pos = 0
+	while pos < len(data):
+		value = data[pos]
+		out.append(value)
+		pos += 1
+		backpos = positions[value]
+		positions[value] = pos
+		run = 0
+		while backpos < pos and pos < len(data) and data[pos] == data[backpos] and run < 255:
+			pos += 1
+			backpos += 1
+			run += 1
+		out.append(run)
+	return bytes(out)
+
+
+class JFFS2Image(object):
+	"""Little endian JFFS2 image, written node by node."""
+
+	def __init__(self):
+		self.data = bytearray()
+		self.versions = {}
+
+	def nextVersion(self, key, version):
+		if version is None:
+			version = self.versions.get(key, 0) + 1
+		self.versions[key] = max(version, self.versions.get(key, 0))
+		return version
+
+	def header(self, nodetype, totlen):
+		hdr = struct.pack('<HHI', JFFS2_MAGIC_BITMASK, nodetype, totlen)
+		return hdr + struct.pack('<I', jffs2_crc(hdr))
+
+	def add(self, node):
+		self.data.extend(node)
+		while len(self.data) % JFFS2_NODE_ALIGN:
+			self.data.append(0xff)
+
+	def inode(self, ino, mode, isize, offset=0, data=b'', compr=JFFS2_COMPR_NONE, version=None):
+		if compr == JFFS2_COMPR_ZLIB:
+			cdata = zlib.compress(data)
+		elif compr == JFFS2_COMPR_RTIME:
+			cdata = rtimeCompress(data)
+		else:
+			cdata = data
+		version = self.nextVersion(ino, version)
+		node = self.header(JFFS2_NODETYPE_INODE, JFFS2_RAW_INODE_SZ + len(cdata))
+		node += struct.pack('<IIIHHIIIIIIIBBH', ino, version, mode, os.getuid(), os.getgid(),
+			isize, 1000, 1000, 1000, offset, len(cdata), len(data), compr, 0, 0)
+		node_crc = jffs2_crc(node)
+		node += struct.pack('<I', jffs2_crc(cdata))
+		node += struct.pack('<I', node_crc)
+		self.add(node + cdata)
+
+	def dirent(self, pino, ino, name, dtype=DT_REG, version=None):
+		name = name.encode('ascii')
+		version = self.nextVersion(('dirent', pino), version)
+		node = self.header(JFFS2_NODETYPE_DIRENT, JFFS2_RAW_DIRENT_SZ + len(name))
+		node += struct.pack('<IIIIBB2x', pino, version, ino, 1000, len(name), dtype)
+		node += struct.pack('<I', jffs2_crc(node))
+		node += struct.pack('<I', jffs2_crc(name))
+		self.add(node + name)
+
+	def write(self, path):
+		f = open(path, 'wb')
+		try:
+			f.write(bytes(self.data))
+		finally:
+			f.close()
+
+
+class JFFS2Test(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.out = os.path.join(self.tmp, 'out')
+		os.mkdir(self.out)
+		self.image = JFFS2Image()
+		self.image.inode(JFFS2_ROOT_INO, MODE_DIR, 0)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def extract(self):
+		path = os.path.join(self.tmp, 'rootfs.jffs2')
+		self.image.write(path)
+		self.assertTrue(extractJFFS2(path, self.out))
+
+	def content(self, name):
+		f = open(os.path.join(self.out, name), 'rb')
+		try:
+			return f.read()
+		finally:
+			f.close()
+
+	def testRtimeRoundTrip(self):
+		for data in (b'', b'abc', b'a' * 600, b'abcabcabcabd' * 50, bytes(bytearray(range(256))) * 3):
+			self.assertEqual(bytes(rtime_decompress(rtimeCompress(data), len(data))), data)
+
+	def testCompressions(self):
+		pages = [b'zlib page ' * 400, b'rtime' * 800 + b'!' * 96, b'plain page data']
+		size = sum([len(page) for page in pages])
+		offset = 0
+		for page, compr in zip(pages, (JFFS2_COMPR_ZLIB, JFFS2_COMPR_RTIME, JFFS2_COMPR_NONE)):
+			self.image.inode(2, MODE_FILE, size, offset, page, compr)
+			offset += len(page)
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file')
+		self.extract()
+		self.assertEqual(self.content('file'), b''.join(pages))
+
+	def testComprTypes(self):
+		self.image.inode(2, MODE_FILE, 4, 0, b'data', JFFS2_COMPR_RTIME)
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file')
+		path = os.path.join(self.tmp, 'rootfs.jffs2')
+		self.image.write(path)
+		image = jffs2(path)
+		try:
+			self.assertEqual(image.compr_types, set([JFFS2_COMPR_RTIME]))
+		finally:
+			image.close()
+
+	def testNewestDataWins(self):
+		# Version 2 comes first on flash, version 1 after it.
+		self.image.inode(2, stat.S_IFREG | 0o600, 8, 0, b'NEW', JFFS2_COMPR_ZLIB, version=2)
+		self.image.inode(2, MODE_FILE, 8, 0, b'old data', JFFS2_COMPR_RTIME, version=1)
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file')
+		self.extract()
+		self.assertEqual(self.content('file'), b'NEW data')
+		self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self.out, 'file')).st_mode), 0o600)
+
+	def testTruncateThenExtend(self):
+		self.image.inode(2, MODE_FILE, 8, 0, b'old data')
+		self.image.inode(2, MODE_FILE, 2)
+		self.image.inode(2, MODE_FILE, 6, 4, b'xy')
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file')
+		self.extract()
+		self.assertEqual(self.content('file'), b'ol\x00\x00xy')
+
+	def testNewestDirentWins(self):
+		self.image.inode(2, MODE_FILE, 3, 0, b'two')
+		self.image.inode(3, MODE_FILE, 5, 0, b'three')
+		# The entry is pointed at inode 3 before the older one is read.
+		self.image.dirent(JFFS2_ROOT_INO, 3, 'file', version=2)
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file', version=1)
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'gone', version=3)
+		self.image.dirent(JFFS2_ROOT_INO, 0, 'gone', version=4)
+		self.extract()
+		self.assertEqual(self.content('file'), b'three')
+		self.assertEqual(sorted(os.listdir(self.out)), ['file'])
+
+	def testBadCrcDropped(self):
+		self.image.inode(2, MODE_FILE, 4, 0, b'good')
+		start = len(self.image.data)
+		self.image.inode(2, MODE_FILE, 4, 0, b'evil')
+		# Last byte of the node CRC.
+		self.image.data[start + JFFS2_RAW_INODE_SZ - 1] ^= 0xff
+		self.image.dirent(JFFS2_ROOT_INO, 2, 'file')
+		self.extract()
+		self.assertEqual(self.content('file'), b'good')
+
+
+if __name__ == '__main__':
+	unittest.main()
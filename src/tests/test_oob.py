@@ -0,0 +1,85 @@
+# Tests of the NFI OOB stripper, run from this folder with
+# python -m unittest discover
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OMBManagerExtract import COPY_BUFFER_SIZE, OOBStripper, copyStream, stripSectors
+
+BS = 2048
+BSO = 2112
+
+
+def nandDump(sectors):
+	"""Dump of sectors BSO byte sectors and the data bytes they hold."""
+	dump = []
+	data = []
+	for i in range(sectors):
+		sector = ('%08d' % i).encode('ascii') * (BS // 8)
+		data.append(sector)
+		dump.append(sector + b'\xee' * (BSO - BS))
+	return b''.join(dump), b''.join(data)
+
+
+def readAll(reader, size):
+	chunks = []
+	while True:
+		data = reader.read(size)
+		if not data:
+			break
+		chunks.append(data)
+	return b''.join(chunks)
+
+
+class StripSectorsTest(unittest.TestCase):
+
+	def testDropsSpare(self):
+		dump, data = nandDump(3)
+		self.assertEqual(bytes(stripSectors(dump, BS, BSO)), data)
+
+	def testEmpty(self):
+		self.assertEqual(bytes(stripSectors(b'', BS, BSO)), b'')
+
+
+class OOBStripperTest(unittest.TestCase):
+
+	def testReadSizes(self):
+		dump, data = nandDump(5)
+		for size in (-1, 1, 100, BS, BS + 1, BSO, 5 * BSO):
+			stripper = OOBStripper(io.BytesIO(dump), len(dump), BS, BSO)
+			if size < 0:
+				self.assertEqual(stripper.read(), data)
+			else:
+				self.assertEqual(readAll(stripper, size), data)
+
+	def testManyBuffers(self):
+		# More sectors than one fill() reads.
+		sectors = COPY_BUFFER_SIZE // BSO * 2 + 3
+		dump, data = nandDump(sectors)
+		stripper = OOBStripper(io.BytesIO(dump), len(dump), BS, BSO)
+		dst = io.BytesIO()
+		copyStream(stripper, dst)
+		self.assertEqual(dst.getvalue(), data)
+
+	def testPartialSectorSkipped(self):
+		dump, data = nandDump(2)
+		src = io.BytesIO(dump + b'tail' + b'next partition')
+		stripper = OOBStripper(src, len(dump) + 4, BS, BSO)
+		self.assertEqual(readAll(stripper, 1000), data)
+		# The source is left at the end of the partition.
+		self.assertEqual(src.read(), b'next partition')
+
+	def testTruncated(self):
+		dump, data = nandDump(3)
+		src = io.BytesIO(dump[:2 * BSO + 100])
+		stripper = OOBStripper(src, len(dump), BS, BSO)
+		self.assertEqual(stripper.read(), data[:2 * BS])
+		self.assertEqual(stripper.read(), b'')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,160 @@
+# Tests of the store images share files through, run from this folder
+# with python -m unittest discover
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OMBManagerStore
+from OMBManagerStore import STORE_MIN_SIZE, STORE_REFS_DIR, fileDigest, pruneStore, storeKey, storeTree
+
+SHARED = b'shared data\n' * (STORE_MIN_SIZE // 4)
+
+
+def copyLink(src, dst):
+	"""Stand-in for reflink copying the data, as tmpfs can't clone."""
+	copyLink.calls.append((src, dst))
+	fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+	f = os.fdopen(fd, 'wb')
+	try:
+		src_f = open(src, 'rb')
+		try:
+			f.write(src_f.read())
+		finally:
+			src_f.close()
+	finally:
+		f.close()
+	return True
+
+
+def writeFile(path, data, mode=0o644):
+	if not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	f = open(path, 'wb')
+	try:
+		f.write(data)
+	finally:
+		f.close()
+	os.chmod(path, mode)
+
+
+def readFile(path):
+	f = open(path, 'rb')
+	try:
+		return f.read()
+	finally:
+		f.close()
+
+
+class StoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.data_dir = tempfile.mkdtemp()
+		self.store = os.path.join(self.data_dir, '.store')
+		self.reflink = OMBManagerStore.reflink
+		copyLink.calls = []
+		OMBManagerStore.reflink = copyLink
+
+	def tearDown(self):
+		OMBManagerStore.reflink = self.reflink
+		shutil.rmtree(self.data_dir)
+
+	def image(self, identifier, files):
+		path = os.path.join(self.data_dir, identifier)
+		for name, data in files.items():
+			writeFile(os.path.join(path, name), data)
+		return path
+
+	def key(self, path):
+		return storeKey(fileDigest(path), os.lstat(path))
+
+	def refs(self, identifier):
+		f = open(os.path.join(self.store, STORE_REFS_DIR, identifier), 'r')
+		try:
+			return [line.rstrip('\n') for line in f]
+		finally:
+			f.close()
+
+	def testSharesIdenticalFiles(self):
+		first = self.image('first', {'usr/lib/libshared.so': SHARED, 'etc/small': b'small'})
+		second = self.image('second', {'lib/libshared.so': SHARED, 'etc/small': b'small'})
+		self.assertEqual(storeTree(first, self.store), (0, 0))
+		self.assertEqual(storeTree(second, self.store), (1, len(SHARED)))
+		key = self.key(os.path.join(second, 'lib/libshared.so'))
+		self.assertEqual(readFile(os.path.join(self.store, key)), SHARED)
+		self.assertEqual(readFile(os.path.join(second, 'lib/libshared.so')), SHARED)
+		# Files below STORE_MIN_SIZE stay out of the store.
+		self.assertEqual(self.refs('first'), [key])
+
+	def testModeSplitsEntries(self):
+		first = self.image('first', {'bin/tool': SHARED})
+		second = self.image('second', {'bin/tool': SHARED})
+		os.chmod(os.path.join(second, 'bin/tool'), 0o755)
+		storeTree(first, self.store)
+		self.assertEqual(storeTree(second, self.store), (0, 0))
+		self.assertNotEqual(self.refs('first'), self.refs('second'))
+
+	def testKeepsTimes(self):
+		first = self.image('first', {'a': SHARED})
+		second = self.image('second', {'a': SHARED})
+		os.utime(os.path.join(second, 'a'), (1000000, 1000000))
+		os.utime(second, (2000000, 2000000))
+		storeTree(first, self.store)
+		self.assertEqual(storeTree(second, self.store), (1, len(SHARED)))
+		self.assertEqual(os.stat(os.path.join(second, 'a')).st_mtime, 1000000)
+		self.assertEqual(os.stat(second).st_mtime, 2000000)
+
+	def testHardlinksLeftAlone(self):
+		first = self.image('first', {'a': SHARED})
+		second = self.image('second', {'a': SHARED})
+		os.link(os.path.join(second, 'a'), os.path.join(second, 'b'))
+		storeTree(first, self.store)
+		self.assertEqual(storeTree(second, self.store), (0, 0))
+		self.assertEqual(self.refs('second'), [])
+
+	def testTamperedEntryNotShared(self):
+		first = self.image('first', {'a': SHARED})
+		second = self.image('second', {'a': SHARED})
+		storeTree(first, self.store)
+		stored = os.path.join(self.store, self.refs('first')[0])
+		evil = b'x' * len(SHARED)
+		writeFile(stored, evil)
+		self.assertEqual(storeTree(second, self.store), (0, 0))
+		self.assertEqual(readFile(os.path.join(second, 'a')), SHARED)
+
+	def testNoReflink(self):
+		OMBManagerStore.reflink = lambda src, dst: False
+		first = self.image('first', {'a': SHARED})
+		self.assertEqual(storeTree(first, self.store), (0, 0))
+		self.assertFalse(os.path.exists(os.path.join(self.store, STORE_REFS_DIR)))
+
+	def testPruneStore(self):
+		common = self.image('common', {'a': SHARED})
+		gone = self.image('gone', {'a': SHARED, 'b': b'only in gone\n' * STORE_MIN_SIZE})
+		storeTree(common, self.store)
+		storeTree(gone, self.store)
+		kept = self.refs('common')[0]
+		dropped = [key for key in self.refs('gone') if key != kept]
+		self.assertEqual(len(dropped), 1)
+
+		pruneStore(self.store)
+		self.assertTrue(os.path.exists(os.path.join(self.store, dropped[0])))
+
+		shutil.rmtree(gone)
+		pruneStore(self.store)
+		self.assertTrue(os.path.exists(os.path.join(self.store, kept)))
+		self.assertFalse(os.path.exists(os.path.join(self.store, dropped[0])))
+		self.assertEqual(os.listdir(os.path.join(self.store, STORE_REFS_DIR)), ['common'])
+
+	def testPruneWithoutStore(self):
+		pruneStore(os.path.join(self.data_dir, 'missing'))
+		self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'missing')))
+
+
+if __name__ == '__main__':
+	unittest.main()
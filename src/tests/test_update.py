@@ -0,0 +1,199 @@
+# Tests of the in place image update, run from this folder with
+# python -m unittest discover
+
+import io
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OMBManagerExtract import extractTar
+from OMBManagerStore import fileDigest
+from OMBManagerUpdate import ImageUpdate, memberName, readManifest, setMemberMetadata, writeManifest
+
+
+def makeTar(members):
+	"""bz2 tar stream of (name, data, mtime) members, data None for folders."""
+	buf = io.BytesIO()
+	tar = tarfile.open(fileobj=buf, mode='w:bz2')
+	try:
+		for name, data, mtime in members:
+			tarinfo = tarfile.TarInfo(name)
+			tarinfo.uid = os.getuid()
+			tarinfo.gid = os.getgid()
+			tarinfo.mtime = mtime
+			if data is None:
+				tarinfo.type = tarfile.DIRTYPE
+				tarinfo.mode = 0o755
+				tar.addfile(tarinfo)
+			else:
+				tarinfo.mode = 0o644
+				tarinfo.size = len(data)
+				tar.addfile(tarinfo, io.BytesIO(data))
+	finally:
+		tar.close()
+	return buf.getvalue()
+
+
+def readFile(path):
+	f = open(path, 'rb')
+	try:
+		return f.read()
+	finally:
+		f.close()
+
+
+def writeFile(path, data):
+	f = open(path, 'wb')
+	try:
+		f.write(data)
+	finally:
+		f.close()
+
+
+class ManifestTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmp, 'manifest')
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def testRoundTrip(self):
+		manifest = {
+			'usr/bin/tool': (10, 1000, 'a' * 40),
+			'etc/with space': (0, 2000, None),
+			'etc/new\nline': (1, 3000, 'b' * 40),
+		}
+		writeManifest(self.path, manifest)
+		del manifest['etc/new\nline']
+		self.assertEqual(readManifest(self.path), manifest)
+		self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+	def testBadLinesSkipped(self):
+		writeFile(self.path, b'- 1 2 good\nshort line\n- size 2 bad\n')
+		self.assertEqual(readManifest(self.path), {'good': (1, 2, None)})
+
+	def testMissing(self):
+		self.assertEqual(readManifest(self.path), {})
+
+
+class MemberNameTest(unittest.TestCase):
+
+	def testNames(self):
+		self.assertEqual(memberName('./usr/bin/tool'), 'usr/bin/tool')
+		self.assertEqual(memberName('/etc//passwd'), 'etc/passwd')
+		self.assertEqual(memberName('usr/lib/../bin/'), 'usr/bin')
+		for root in ('.', './', '/', ''):
+			self.assertEqual(memberName(root), None)
+
+
+class SetMemberMetadataTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmp, 'file')
+		self.link = os.path.join(self.tmp, 'link')
+		writeFile(self.path, b'shared')
+		os.chmod(self.path, 0o644)
+		os.utime(self.path, (1000, 1000))
+		os.link(self.path, self.link)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def tarinfo(self, mode, mtime):
+		tarinfo = tarfile.TarInfo('file')
+		tarinfo.uid = os.getuid()
+		tarinfo.gid = os.getgid()
+		tarinfo.mode = mode
+		tarinfo.mtime = mtime
+		return tarinfo
+
+	def testHardlinkCopied(self):
+		setMemberMetadata(self.path, self.tarinfo(0o600, 2000), os.lstat(self.path))
+		st = os.lstat(self.path)
+		self.assertEqual(st.st_nlink, 1)
+		self.assertEqual((stat.S_IMODE(st.st_mode), st.st_mtime), (0o600, 2000))
+		self.assertEqual(readFile(self.path), b'shared')
+		link_st = os.lstat(self.link)
+		self.assertEqual((stat.S_IMODE(link_st.st_mode), link_st.st_mtime), (0o644, 1000))
+		self.assertFalse(os.path.exists(self.path + '.omb-update'))
+
+	def testHardlinkMatchingKept(self):
+		setMemberMetadata(self.path, self.tarinfo(0o644, 1000), os.lstat(self.path))
+		self.assertEqual(os.lstat(self.path).st_nlink, 2)
+
+
+class ImageUpdateTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+		self.image = os.path.join(self.tmp, 'image')
+		self.manifest = os.path.join(self.tmp, 'manifest')
+		os.mkdir(self.image)
+		old = makeTar([
+			('etc', None, 1000),
+			('etc/same', b'unchanged', 1000),
+			('etc/touched', b'same data', 1000),
+			('etc/edited', b'old data', 1000),
+			('etc/resized', b'old', 1000),
+			('etc/dropped', b'gone', 1000),
+			('var', None, 1000),
+		])
+		extractTar(io.BytesIO(old), self.image, 'bz2')
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp)
+
+	def path(self, name):
+		return os.path.join(self.image, name)
+
+	def testUpdate(self):
+		new = makeTar([
+			('etc', None, 3000),
+			('etc/same', b'unchanged', 1000),
+			('etc/touched', b'same data', 2000),
+			('etc/edited', b'new data', 2000),
+			('etc/resized', b'longer', 2000),
+			('etc/added', b'added', 2000),
+		])
+		same_ino = os.lstat(self.path('etc/same')).st_ino
+		update = ImageUpdate(self.image, self.manifest, self.tmp)
+		extractTar(io.BytesIO(new), self.image, 'bz2', update=update)
+		self.assertTrue(update.complete)
+		update.finish()
+
+		self.assertEqual((update.kept, update.written, update.removed), (2, 3, 2))
+		self.assertEqual(sorted(os.listdir(self.image)), ['etc'])
+		self.assertEqual(sorted(os.listdir(self.path('etc'))), ['added', 'edited', 'resized', 'same', 'touched'])
+		self.assertEqual(os.lstat(self.path('etc/same')).st_ino, same_ino)
+		self.assertEqual(readFile(self.path('etc/edited')), b'new data')
+		self.assertEqual(readFile(self.path('etc/resized')), b'longer')
+		self.assertEqual(os.lstat(self.path('etc/touched')).st_mtime, 2000)
+		self.assertEqual(os.lstat(self.path('etc')).st_mtime, 3000)
+
+		manifest = readManifest(self.manifest)
+		self.assertEqual(manifest['etc/edited'], (8, 2000, fileDigest(self.path('etc/edited'))))
+		self.assertEqual(manifest['etc/added'], (5, 2000, None))
+		self.assertFalse('etc/dropped' in manifest)
+
+	def testPartialImageKeepsFiles(self):
+		new = makeTar([('etc', None, 1000), ('etc/same', b'unchanged', 1000)])
+		update = ImageUpdate(self.image, self.manifest, self.tmp)
+		self.assertRaises(tarfile.ReadError, extractTar, io.BytesIO(new[:len(new) // 2]),
+			self.image, 'bz2', update=update)
+		self.assertFalse(update.complete)
+		self.assertRaises(IOError, update.finish)
+		self.assertTrue(os.path.exists(self.path('etc/dropped')))
+		self.assertFalse(os.path.exists(self.manifest))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader/jffs2
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+
+import mmap
+
+from jffs2.defines import *
+from jffs2.misc import jffs2_crc
+from jffs2 import nodes
+from jffs2.log import log
+
+
+class inode(object):
+    """Inode record gathered by the scan
+
+    Attributes:
+    Obj:ino     -- Highest version inode node, None until found.
+    List:dent   -- Highest version directory entry nodes of a
+                   directory inode.
+    List:nodes  -- Inode nodes carrying data or a size change.
+    Int:nlink   -- Number of directory entries linking the inode.
+    Str:hlink   -- Path first extracted to, for hard links.
+
+    Methods:
+    data_nodes() -- List of nodes in version order.
+    """
+    __slots__ = ('ino', 'dent', 'nodes', 'nlink', 'hlink')
+
+    def __init__(self):
+        self.ino = None
+        self.dent = []
+        self.nodes = []
+        self.nlink = 0
+        self.hlink = None
+
+    def data_nodes(self):
+        return sorted(self.nodes, key=lambda node: node.version)
+
+
+class jffs2(object):
+    """JFFS2 object
+
+    Arguments:
+    Str:path           -- File path to JFFS2 image.
+
+    Attributes:
+    Str:endian         -- Byte order of the image, < or >.
+    Dict:inodes        -- Dict of inode objects keyed to inode number.
+    Set:compr_types    -- Compression types used by data nodes.
+    Obj:file           -- Memory map of the image.
+    Obj:log            -- Log object for errors.
+
+    Methods:
+    read_data(node)    -- Compressed data of inode node.
+    close()            -- Release the image.
+
+    The image is scanned once for node headers on 4 byte boundaries.
+    Obsolete nodes and nodes failing their CRC are dropped, for each
+    inode the highest version node holds the metadata and for each
+    name in a directory the highest version entry wins.
+    """
+
+    def __init__(self, path):
+        self.log = log()
+        self._fhandle = open(path, 'rb')
+        self._file = mmap.mmap(self._fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._endian = None
+        self._inodes = {}
+        self._compr_types = set()
+        self._scan()
+
+    def _get_file(self):
+        return self._file
+    file = property(_get_file)
+
+    def _get_endian(self):
+        return self._endian
+    endian = property(_get_endian)
+
+    def _get_inodes(self):
+        return self._inodes
+    inodes = property(_get_inodes)
+
+    def _get_compr_types(self):
+        return self._compr_types
+    compr_types = property(_get_compr_types)
+
+    def _inode(self, ino):
+        if ino not in self._inodes:
+            self._inodes[ino] = inode()
+        return self._inodes[ino]
+
+    def _header(self, pos, endian):
+        """Node header at pos if its magic and CRC are good, else None."""
+        buf = self._file
+        if pos + JFFS2_UNKNOWN_NODE_SZ > len(buf):
+            return None
+
+        hdr = nodes.unknown_node(buf, pos, endian)
+        if hdr.magic != JFFS2_MAGIC_BITMASK:
+            return None
+        if hdr.hdr_crc != jffs2_crc(buf[pos:pos + JFFS2_HDR_CRC_LEN]):
+            return None
+        if hdr.totlen < JFFS2_UNKNOWN_NODE_SZ or pos + hdr.totlen > len(buf):
+            return None
+        return hdr
+
+    def _find_first(self, pos):
+        """Next magic of either byte order, with its byte order."""
+        le = self._file.find(JFFS2_MAGIC_LE, pos)
+        be = self._file.find(JFFS2_MAGIC_BE, pos)
+        if be < 0 or (le >= 0 and le < be):
+            return le, '<'
+        return be, '>'
+
+    def _scan(self):
+        buf = self._file
+        dirents = {}
+        pos = 0
+
+        while True:
+            if self._endian == '<':
+                pos, endian = buf.find(JFFS2_MAGIC_LE, pos), '<'
+            elif self._endian == '>':
+                pos, endian = buf.find(JFFS2_MAGIC_BE, pos), '>'
+            else:
+                pos, endian = self._find_first(pos)
+
+            if pos < 0:
+                break
+
+            if pos % JFFS2_NODE_ALIGN:
+                pos += JFFS2_NODE_ALIGN - pos % JFFS2_NODE_ALIGN
+                continue
+
+            hdr = self._header(pos, endian)
+            if hdr is None:
+                pos += JFFS2_NODE_ALIGN
+                continue
+
+            # The first good node fixes the byte order.
+            self._endian = endian
+
+            if hdr.nodetype == JFFS2_NODETYPE_INODE:
+                self._add_inode(pos)
+            elif hdr.nodetype == JFFS2_NODETYPE_DIRENT:
+                self._add_dirent(pos, dirents)
+
+            pos += (hdr.totlen + JFFS2_NODE_ALIGN - 1) & ~(JFFS2_NODE_ALIGN - 1)
+
+        if self._endian is None:
+            raise Exception('No JFFS2 nodes found.')
+
+        for dent in dirents.values():
+            # Entries unlinked last have inode number 0.
+            if dent.ino:
+                self._inode(dent.pino).dent.append(dent)
+                self._inode(dent.ino).nlink += 1
+
+    def _add_inode(self, pos):
+        buf = self._file
+        node = nodes.raw_inode(buf, pos, self._endian)
+        if node.node_crc != jffs2_crc(buf[pos:pos + JFFS2_RAW_INODE_CRC_LEN]):
+            self.log.write('CRC Fail: inode node offset %s' % pos)
+            return
+
+        rec = self._inode(node.ino)
+        if rec.ino is None or node.version > rec.ino.version:
+            rec.ino = node
+        rec.nodes.append(node)
+        if node.dsize:
+            self._compr_types.add(node.compr)
+
+    def _add_dirent(self, pos, dirents):
+        buf = self._file
+        node = nodes.raw_dirent(buf, pos, self._endian)
+        if node.node_crc != jffs2_crc(buf[pos:pos + JFFS2_RAW_DIRENT_CRC_LEN]) or \
+           node.name_crc != jffs2_crc(node.raw_name):
+            self.log.write('CRC Fail: dirent node offset %s' % pos)
+            return
+
+        key = (node.pino, node.raw_name)
+        if key not in dirents or node.version > dirents[key].version:
+            dirents[key] = node
+
+    def read_data(self, node):
+        data = self._file[node.data_offset:node.data_offset + node.csize]
+        if node.data_crc != jffs2_crc(data):
+            self.log.write('CRC Fail: data of inode %s version %s' % (node.ino, node.version))
+        return data
+
+    def close(self):
+        self._file.close()
+        self._fhandle.close()
+
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#############################################################
+# Adapted in part from linux-source-3.2/include/linux/jffs2.h
+# for use in Python.
+#
+# Original copyright notice.
+# --------------------------
+#
+# JFFS2 -- Journalling Flash File System, Version 2.
+#
+# Copyright © 2001-2007 Red Hat, Inc.
+# Copyright © 2004-2010 David Woodhouse <dwmw2@infradead.org>
+#
+# Created by David Woodhouse <dwmw2@infradead.org>
+#
+# For licensing information, see the file 'LICENCE' in the
+# jffs2 directory.
+#
+#############################################################
+
+import struct
+
+# Constant defines
+
+# Node magic, its byte order gives the byte order of the image.
+JFFS2_MAGIC_BITMASK = 0x1985
+JFFS2_MAGIC_LE = b'\x85\x19'
+JFFS2_MAGIC_BE = b'\x19\x85'
+
+# Root directory inode number.
+JFFS2_ROOT_INO = 1
+
+# Nodes start on 4 byte boundaries.
+JFFS2_NODE_ALIGN = 4
+
+# Compression types
+JFFS2_COMPR_NONE = 0x00
+JFFS2_COMPR_ZERO = 0x01
+JFFS2_COMPR_RTIME = 0x02
+JFFS2_COMPR_RUBINMIPS = 0x03
+JFFS2_COMPR_COPY = 0x04
+JFFS2_COMPR_DYNRUBIN = 0x05
+JFFS2_COMPR_ZLIB = 0x06
+JFFS2_COMPR_LZO = 0x07
+JFFS2_COMPR_LZMA = 0x08
+
+# Node type compatibility bits.
+JFFS2_FEATURE_INCOMPAT = 0xc000
+JFFS2_FEATURE_ROCOMPAT = 0x8000
+JFFS2_FEATURE_RWCOMPAT_COPY = 0x4000
+JFFS2_FEATURE_RWCOMPAT_DELETE = 0x0000
+
+# Cleared in the node type of obsoleted nodes.
+JFFS2_NODE_ACCURATE = 0x2000
+
+# Node types
+JFFS2_NODETYPE_DIRENT = (JFFS2_FEATURE_INCOMPAT | JFFS2_NODE_ACCURATE | 1)
+JFFS2_NODETYPE_INODE = (JFFS2_FEATURE_INCOMPAT | JFFS2_NODE_ACCURATE | 2)
+JFFS2_NODETYPE_CLEANMARKER = (JFFS2_FEATURE_RWCOMPAT_DELETE | JFFS2_NODE_ACCURATE | 3)
+JFFS2_NODETYPE_PADDING = (JFFS2_FEATURE_RWCOMPAT_DELETE | JFFS2_NODE_ACCURATE | 4)
+JFFS2_NODETYPE_SUMMARY = (JFFS2_FEATURE_RWCOMPAT_DELETE | JFFS2_NODE_ACCURATE | 6)
+JFFS2_NODETYPE_XATTR = (JFFS2_FEATURE_INCOMPAT | JFFS2_NODE_ACCURATE | 8)
+JFFS2_NODETYPE_XREF = (JFFS2_FEATURE_INCOMPAT | JFFS2_NODE_ACCURATE | 9)
+
+# Directory entry types, as in dirent.h.
+DT_UNKNOWN = 0
+DT_FIFO = 1
+DT_CHR = 2
+DT_DIR = 4
+DT_BLK = 6
+DT_REG = 8
+DT_LNK = 10
+DT_SOCK = 12
+
+# Number of data nodes decompressed together when a thread pool is used.
+DECOMPRESS_BATCH_SZ = 32
+
+# For happy printing
+PRINT_JFFS2_COMPR = {JFFS2_COMPR_NONE: 'none',
+                     JFFS2_COMPR_ZERO: 'zero',
+                     JFFS2_COMPR_RTIME: 'rtime',
+                     JFFS2_COMPR_RUBINMIPS: 'rubinmips',
+                     JFFS2_COMPR_COPY: 'copy',
+                     JFFS2_COMPR_DYNRUBIN: 'dynrubin',
+                     JFFS2_COMPR_ZLIB: 'zlib',
+                     JFFS2_COMPR_LZO: 'lzo',
+                     JFFS2_COMPR_LZMA: 'lzma'}
+
+# Struct defines, without byte order prefix.
+
+# Header common to all nodes.
+JFFS2_UNKNOWN_NODE_FORMAT = 'HHII'
+JFFS2_UNKNOWN_NODE_FIELDS = ['magic',    # JFFS2_MAGIC_BITMASK
+                             'nodetype', # Node type.
+                             'totlen',   # Full node length.
+                             'hdr_crc']  # CRC32 of the fields above.
+JFFS2_UNKNOWN_NODE_SZ = struct.calcsize('<' + JFFS2_UNKNOWN_NODE_FORMAT)
+# Header CRC covers the node from its start to the hdr_crc field.
+JFFS2_HDR_CRC_LEN = 8
+
+# Directory entry node
+JFFS2_RAW_DIRENT_FORMAT = 'HHIIIIIIBB2xII'
+JFFS2_RAW_DIRENT_FIELDS = ['magic',     # JFFS2_MAGIC_BITMASK
+                           'nodetype',  # JFFS2_NODETYPE_DIRENT
+                           'totlen',    # Full node length.
+                           'hdr_crc',   # Header CRC.
+                           'pino',      # Parent inode number.
+                           'version',   # Version, per parent inode.
+                           'ino',       # Inode number, 0 for unlink.
+                           'mctime',    # Time of the change.
+                           'nsize',     # Name length.
+                           'type',      # DT_ type of the entry.
+                           'node_crc',  # CRC32 of the node up to here.
+                           'name_crc']  # CRC32 of the name.
+JFFS2_RAW_DIRENT_SZ = struct.calcsize('<' + JFFS2_RAW_DIRENT_FORMAT)
+JFFS2_RAW_DIRENT_CRC_LEN = JFFS2_RAW_DIRENT_SZ - 8
+
+# Inode node, holding the metadata and up to one page of data.
+JFFS2_RAW_INODE_FORMAT = 'HHIIIIIHHIIIIIIIBBHII'
+JFFS2_RAW_INODE_FIELDS = ['magic',      # JFFS2_MAGIC_BITMASK
+                          'nodetype',   # JFFS2_NODETYPE_INODE
+                          'totlen',     # Full node length.
+                          'hdr_crc',    # Header CRC.
+                          'ino',        # Inode number.
+                          'version',    # Version, per inode.
+                          'mode',       # File mode and type.
+                          'uid',        # Owner.
+                          'gid',        # Group.
+                          'isize',      # File size.
+                          'atime',      # Last access time.
+                          'mtime',      # Last modification time.
+                          'ctime',      # Last change time.
+                          'offset',     # Where the data goes in the file.
+                          'csize',      # Compressed data size.
+                          'dsize',      # Uncompressed data size.
+                          'compr',      # Compression type.
+                          'usercompr',  # Compression requested by user.
+                          'flags',      # Inode flags.
+                          'data_crc',   # CRC32 of the compressed data.
+                          'node_crc']   # CRC32 of the node up to here.
+JFFS2_RAW_INODE_SZ = struct.calcsize('<' + JFFS2_RAW_INODE_FORMAT)
+JFFS2_RAW_INODE_CRC_LEN = JFFS2_RAW_INODE_SZ - 8
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader/jffs2
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+
+import struct
+import sys
+import zlib
+from jffs2.defines import *
+
+
+def jffs2_crc(buf):
+    """JFFS2 CRC32, seeded with 0 and not inverted unlike zlib's.
+
+    Arguments:
+    Str:buf    -- Data to checksum.
+
+    Returns:
+    Int        -- CRC32.
+    """
+    return ~zlib.crc32(buf, 0xFFFFFFFF) & 0xFFFFFFFF
+
+
+def to_str(name):
+    """File name or link target from image bytes."""
+    if sys.version_info[0] >= 3:
+        return name.decode('utf-8', 'surrogateescape')
+    return name
+
+
+def rtime_decompress(data, unc_len):
+    """Decompress rtime data, a port of the kernel's compr_rtime.c.
+
+    Arguments:
+    Str:data     -- Compressed data, pairs of a byte and a repeat count.
+    Int:unc_len  -- Uncompressed data length.
+
+    Returns:
+    Uncompressed Data.
+    """
+    data = bytearray(data)
+    out = bytearray()
+    positions = [0] * 256
+    pos = 0
+
+    while len(out) < unc_len:
+        value = data[pos]
+        repeat = data[pos + 1]
+        pos += 2
+
+        out.append(value)
+        outpos = len(out)
+        backoffs = positions[value]
+        positions[value] = outpos
+
+        if repeat:
+            if backoffs + repeat >= outpos:
+                # Overlapping copy, byte by byte.
+                for i in range(repeat):
+                    out.append(out[backoffs + i])
+            else:
+                out += out[backoffs:backoffs + repeat]
+
+    return bytes(out[:unc_len])
+
+
+def zlib_decompress(data, unc_len):
+    """Decompress zlib data like the kernel, skipping the adler32 check
+    when the stream has a plain zlib header.
+    """
+    head = bytearray(data[:2])
+    if len(head) == 2 and (head[0] & 0x0f) == 8 and not ((head[0] << 8) + head[1]) % 31:
+        dobj = zlib.decompressobj(-((head[0] >> 4) + 8))
+        return dobj.decompress(data[2:], unc_len)
+
+    dobj = zlib.decompressobj(zlib.MAX_WBITS)
+    return dobj.decompress(data, unc_len)
+
+
+def lzo_available():
+    """True if the lzo module needed for JFFS2_COMPR_LZO data loads."""
+    # ubifs.misc fails to import without it.
+    try:
+        from ubifs import misc
+    except ImportError:
+        return False
+    return hasattr(misc, 'lzo')
+
+
+def decompress(ctype, unc_len, data):
+    """Decompress data.
+
+    Arguments:
+    Int:ctype    -- Compression type, JFFS2_COMPR_*.
+    Int:unc_len  -- Uncompressed data length.
+    Str:data     -- Data to be uncompressed.
+
+    Returns:
+    Uncompressed Data.
+    """
+    if ctype == JFFS2_COMPR_ZLIB:
+        return zlib_decompress(data, unc_len)
+    elif ctype == JFFS2_COMPR_LZO:
+        # The LZO1X module shipped for ubifs, only loaded for LZO images.
+        from ubifs.misc import lzo
+        return lzo.decompress(b''.join((b'\xf0', struct.pack('>I', unc_len), data)))
+    elif ctype == JFFS2_COMPR_RTIME:
+        return rtime_decompress(data, unc_len)
+    elif ctype == JFFS2_COMPR_ZERO:
+        return b'\x00' * unc_len
+    elif ctype == JFFS2_COMPR_NONE:
+        return bytes(data)
+    else:
+        raise Exception('Unsupported compression: %s' % PRINT_JFFS2_COMPR.get(ctype, ctype))
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader/jffs2
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+
+import struct
+from jffs2.defines import *
+from jffs2.misc import to_str
+
+
+# Precompiled node parsers, keyed by byte order.
+_UNKNOWN_NODE_STRUCT = {}
+_RAW_DIRENT_STRUCT = {}
+_RAW_INODE_STRUCT = {}
+for _endian in '<>':
+    _UNKNOWN_NODE_STRUCT[_endian] = struct.Struct(_endian + JFFS2_UNKNOWN_NODE_FORMAT)
+    _RAW_DIRENT_STRUCT[_endian] = struct.Struct(_endian + JFFS2_RAW_DIRENT_FORMAT)
+    _RAW_INODE_STRUCT[_endian] = struct.Struct(_endian + JFFS2_RAW_INODE_FORMAT)
+
+
+class unknown_node(object):
+    __slots__ = JFFS2_UNKNOWN_NODE_FIELDS
+
+    def __init__(self, buf, offset=0, endian='<'):
+        (self.magic, self.nodetype, self.totlen,
+         self.hdr_crc) = _UNKNOWN_NODE_STRUCT[endian].unpack_from(buf, offset)
+
+    def __repr__(self):
+        return 'JFFS2 Node Header'
+
+    def __iter__(self):
+        for key in dir(self):
+            if not key.startswith('_'):
+                yield key, getattr(self, key)
+
+
+class raw_dirent(object):
+    __slots__ = JFFS2_RAW_DIRENT_FIELDS + ['raw_name', 'name']
+
+    def __init__(self, buf, offset=0, endian='<'):
+        (self.magic, self.nodetype, self.totlen, self.hdr_crc, self.pino,
+         self.version, self.ino, self.mctime, self.nsize, self.type,
+         self.node_crc, self.name_crc) = _RAW_DIRENT_STRUCT[endian].unpack_from(buf, offset)
+        start = offset + JFFS2_RAW_DIRENT_SZ
+        self.raw_name = buf[start:start + self.nsize]
+        self.name = to_str(self.raw_name)
+
+    def __repr__(self):
+        return 'JFFS2 Directory Entry Node'
+
+    def __iter__(self):
+        for key in dir(self):
+            if not key.startswith('_'):
+                yield key, getattr(self, key)
+
+
+class raw_inode(object):
+    __slots__ = JFFS2_RAW_INODE_FIELDS + ['data_offset']
+
+    def __init__(self, buf, offset=0, endian='<'):
+        (self.magic, self.nodetype, self.totlen, self.hdr_crc, self.ino,
+         self.version, self.mode, self.uid, self.gid, self.isize, self.atime,
+         self.mtime, self.ctime, self.offset, self.csize, self.dsize,
+         self.compr, self.usercompr, self.flags, self.data_crc,
+         self.node_crc) = _RAW_INODE_STRUCT[endian].unpack_from(buf, offset)
+        self.data_offset = offset + JFFS2_RAW_INODE_SZ
+
+    def __repr__(self):
+        return 'JFFS2 Inode Node'
+
+    def __iter__(self):
+        for key in dir(self):
+            if not key.startswith('_'):
+                yield key, getattr(self, key)
@@ -0,0 +1,235 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader/jffs2
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+
+import os
+import struct
+from multiprocessing.pool import ThreadPool
+
+from jffs2.defines import *
+from jffs2.misc import decompress, to_str
+
+
+def extract_files(jffs2, out_path, perms=False, jobs=1):
+    """Extract JFFS2 contents to_path/
+
+    Arguments:
+    Obj:jffs2    -- JFFS2 object.
+    Str:out_path  -- Path to extract contents to.
+    Bool:perms   -- (optional) Set file permissions and owners.
+    Int:jobs     -- (optional) Number of threads to decompress file
+                    data with.
+    """
+    pool = None
+    try:
+        if jobs > 1:
+            pool = ThreadPool(jobs)
+
+        for dent in jffs2.inodes[JFFS2_ROOT_INO].dent:
+            dents(jffs2, dent, out_path, perms, pool)
+
+    except Exception as e:
+        import traceback
+        jffs2.log.write('%s' % e)
+        traceback.print_exc()
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def dents(jffs2, dent_node, path='', perms=False, pool=None, progress=None, lock=None):
+    if progress:
+        progress()
+
+    inode = jffs2.inodes.get(dent_node.ino)
+    dent_path = os.path.join(path, dent_node.name)
+
+    if inode is None or inode.ino is None:
+        jffs2.log.write('INODE Fail: no inode %s for %s' % (dent_node.ino, dent_path))
+        return
+
+    if dent_node.type == DT_DIR:
+        try:
+            if not os.path.exists(dent_path):
+                os.mkdir(dent_path)
+        except Exception as e:
+            jffs2.log.write('DIR Fail: %s' % e)
+
+        for dnode in sorted(inode.dent, key=lambda dnode: dnode.raw_name):
+            dents(jffs2, dnode, dent_path, perms, pool, progress, lock)
+
+        # After the contents, which change the directory mtime.
+        try:
+            if perms:
+                set_file_perms(dent_path, inode)
+        except Exception as e:
+            jffs2.log.write('DIR Fail: %s' % e)
+
+    elif dent_node.type == DT_REG:
+        try:
+            if inode.nlink > 1:
+                if inode.hlink is None:
+                    inode.hlink = dent_path
+                    process_reg_file(jffs2, inode, dent_path, pool, lock)
+                else:
+                    os.link(inode.hlink, dent_path)
+            else:
+                process_reg_file(jffs2, inode, dent_path, pool, lock)
+
+            if perms:
+                set_file_perms(dent_path, inode)
+
+        except Exception as e:
+            jffs2.log.write('FILE Fail: %s' % e)
+
+    elif dent_node.type == DT_LNK:
+        try:
+            target = to_str(read_file(jffs2, inode))
+            os.symlink(target, dent_path)
+            if perms:
+                os.lchown(dent_path, inode.ino.uid, inode.ino.gid)
+        except Exception as e:
+            jffs2.log.write('SYMLINK Fail: %s : %s' % (dent_path, e))
+
+    elif dent_node.type in [DT_BLK, DT_CHR]:
+        try:
+            dev = get_dev(jffs2, inode)
+            if perms:
+                os.mknod(dent_path, inode.ino.mode, dev)
+                set_file_perms(dent_path, inode)
+            else:
+                # Just create dummy file.
+                write_reg_file(dent_path, str(dev).encode())
+
+        except Exception as e:
+            jffs2.log.write('DEV Fail: %s : %s' % (dent_path, e))
+
+    elif dent_node.type == DT_FIFO:
+        try:
+            os.mkfifo(dent_path, inode.ino.mode & 0o7777)
+            if perms:
+                set_file_perms(dent_path, inode)
+        except Exception as e:
+            jffs2.log.write('FIFO Fail: %s : %s' % (dent_path, e))
+
+    elif dent_node.type == DT_SOCK:
+        try:
+            # Just create dummy file.
+            write_reg_file(dent_path, b'')
+            if perms:
+                set_file_perms(dent_path, inode)
+        except Exception as e:
+            jffs2.log.write('SOCK Fail: %s : %s' % (dent_path, e))
+
+
+def set_file_perms(path, inode):
+    try:
+        os.chmod(path, inode.ino.mode & 0o7777)
+        os.chown(path, inode.ino.uid, inode.ino.gid)
+        os.utime(path, (inode.ino.atime, inode.ino.mtime))
+    except:
+        raise Exception('Failed File Permissions: %s' % (path))
+
+
+def write_reg_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_file(jffs2, inode):
+    """Whole content of a small file, ie. a link target or device."""
+    data = b''
+    for node in inode.data_nodes():
+        if node.dsize:
+            buf = decompress(node.compr, node.dsize, jffs2.read_data(node))
+            data = data[:node.offset].ljust(node.offset, b'\x00') + buf + data[node.offset + node.dsize:]
+    return data[:inode.ino.isize]
+
+
+def get_dev(jffs2, inode):
+    """Device number, stored in the old 16 bit or the new 32 bit format."""
+    data = read_file(jffs2, inode)
+    endian = jffs2.endian
+    if len(data) == 2:
+        (dev, ) = struct.unpack(endian + 'H', data)
+        return os.makedev((dev >> 8) & 0xff, dev & 0xff)
+
+    (dev, ) = struct.unpack(endian + 'I', data[:4])
+    return os.makedev((dev & 0xfff00) >> 8, (dev & 0xff) | ((dev >> 12) & 0xfff00))
+
+
+def process_reg_file(jffs2, inode, path, pool=None, lock=None):
+    """Write regular file from its inode nodes.
+
+    Arguments:
+    Obj:jffs2    -- JFFS2 object.
+    Obj:inode    -- Inode object from the scan.
+    Str:path     -- Path to write file to.
+    Obj:pool     -- (optional) Thread pool to decompress nodes in.
+    Obj:lock     -- (optional) Lock held while writing each batch, to
+                    serialize writes with other extractions.
+
+    Nodes are applied in version order, each writing its data at its
+    offset, so newer data replaces older. A node shrinking the file
+    cuts off what older nodes wrote past its size, and the file ends
+    at the size of the highest version.
+    """
+    try:
+        with open(path, 'wb') as f:
+            data_nodes = inode.data_nodes()
+
+            if pool is None or len(data_nodes) < 2:
+                batch_size = 1
+            else:
+                batch_size = DECOMPRESS_BATCH_SZ
+
+            size = 0
+            for i in range(0, len(data_nodes), batch_size):
+                batch = data_nodes[i:i + batch_size]
+                compr_nodes = [(node.compr, node.dsize, jffs2.read_data(node)) for node in batch]
+
+                if batch_size == 1:
+                    bufs = [decompress(*compr_nodes[0])]
+                else:
+                    bufs = pool.map(_decompress_node, compr_nodes)
+
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    for node, buf in zip(batch, bufs):
+                        if node.dsize:
+                            f.seek(node.offset)
+                            f.write(buf)
+                            size = max(size, node.offset + node.dsize)
+                        if node.isize < size:
+                            f.truncate(node.isize)
+                            size = node.isize
+                finally:
+                    if lock is not None:
+                        lock.release()
+
+            f.truncate(inode.ino.isize)
+
+    except Exception as e:
+        raise Exception('inode num:%s :%s' % (inode.ino.ino, e))
+
+
+def _decompress_node(node):
+    return decompress(*node)
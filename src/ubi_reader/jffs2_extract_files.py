@@ -0,0 +1,90 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+import os
+import sys
+import time
+import argparse
+
+from jffs2 import jffs2
+from jffs2.output import extract_files
+
+output_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'output')
+
+if __name__ == '__main__':
+    description = 'Extract contents of JFFS2 image.'
+    usage = 'jffs2_extract_files.py [options] filepath'
+    parser = argparse.ArgumentParser(usage=usage, description=description)
+
+    parser.add_argument('-l', '--log-file', dest='logpath',
+                      help='Log output to file LOGPATH.')
+
+    parser.add_argument('-k', '--keep-permissions', action='store_true', dest='permissions',
+                      help='Maintain file permissions, requires running as root. (default: False)')
+
+    parser.add_argument('-q', '--quiet', action='store_true', dest='quiet',
+                      help='Suppress warnings and non-fatal errors. (default: False)')
+
+    parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                        help='Number of threads to decompress files with. (default: 1)')
+
+    parser.add_argument('-o', '--output-dir', dest='output_path',
+                        help='Specify output directory path.')
+
+    parser.add_argument('filepath', help='File to extract contents of.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit()
+
+    args = parser.parse_args()
+
+    if args.filepath:
+        path = args.filepath
+        if not os.path.exists(path):
+            parser.error("File path doesn't exist.")
+
+    if args.output_path:
+        output_path = args.output_path
+    else:
+        img_name = os.path.splitext(os.path.basename(path))[0]
+        output_path = os.path.join(output_dir, img_name)
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    elif os.listdir(output_path):
+        parser.error('Output directory is not empty. %s' % output_path)
+
+    start = time.time()
+    # Create JFFS2 object, scanning the image.
+    ujffs2 = jffs2(path)
+    ujffs2.log.log_to_file = args.logpath is not None
+    if args.logpath:
+        ujffs2.log.log_file = args.logpath
+    ujffs2.log.quiet = args.quiet
+    scanned = time.time()
+
+    # Run extract all files.
+    print('Writing to: %s' % output_path)
+    extract_files(ujffs2, output_path, args.permissions, args.jobs)
+    ujffs2.close()
+
+    if not args.quiet:
+        print('Scan %.3fs, extract %.3fs, %s inodes' % (scanned - start, time.time() - scanned, len(ujffs2.inodes)))
+
+    sys.exit(0)
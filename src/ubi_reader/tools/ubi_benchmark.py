@@ -0,0 +1,424 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+import os
+import sys
+import time
+import types
+import random
+import shutil
+import struct
+import argparse
+import tempfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from ubi import ubi, get_peb_size
+from ubi.block import description as block_description, sort
+from ubi.defines import *
+from ubi_io import ubi_file, leb_virtual_file
+
+try:
+    from ubifs import ubifs, walk
+except ImportError:
+    # Generated images only hold zlib data, lzo is only needed for real ones.
+    lzo = types.ModuleType('lzo')
+    sys.modules['lzo'] = sys.modules['ubifs.lzo'] = lzo
+    from ubifs import ubifs, walk
+
+from ubifs.defines import *
+from ui.common import extract_files
+
+IMAGE_SEQ = 0x1b2c3d4e
+INDEX_FANOUT = 32
+
+
+class _geometry(object):
+    """NAND layout of the generated image
+
+    Arguments:
+    Int:peb_size  -- Erase block size, pages are 512 bytes below
+                     64KiB PEBs and 2KiB from there on.
+
+    The VID header is on the second page and data starts on the third.
+    """
+
+    def __init__(self, peb_size):
+        page_size = 512 if peb_size < 64 * 1024 else 2048
+        self.peb_size = peb_size
+        self.vid_hdr_offset = page_size
+        self.data_offset = 2 * page_size
+        self.leb_size = peb_size - self.data_offset
+
+
+def _crc(buf):
+    return ~zlib.crc32(buf) & 0xFFFFFFFF
+
+
+def _peb(geo, ec_hdr, vid_hdr=b'', data=b''):
+    buf = [ec_hdr, b'\xff' * (geo.vid_hdr_offset - len(ec_hdr))]
+    if vid_hdr:
+        buf.extend([vid_hdr, b'\xff' * (geo.data_offset - geo.vid_hdr_offset - len(vid_hdr)), data,
+                    b'\xff' * (geo.leb_size - len(data))])
+    else:
+        buf.append(b'\xff' * (geo.peb_size - geo.vid_hdr_offset))
+    return b''.join(buf)
+
+
+def _ec_hdr(geo, ec):
+    buf = struct.pack(EC_HDR_FORMAT[:-1], UBI_EC_HDR_MAGIC, 1, b'', ec, geo.vid_hdr_offset,
+                      geo.data_offset, IMAGE_SEQ, b'')
+    return buf + struct.pack('>I', _crc(buf))
+
+
+def _vid_hdr(vol_id, lnum, sqnum):
+    buf = struct.pack(VID_HDR_FORMAT[:-1], UBI_VID_HDR_MAGIC, 1, UBI_VID_DYNAMIC, 0, 0, vol_id,
+                      lnum, b'', 0, 0, 0, 0, b'', sqnum, b'')
+    return buf + struct.pack('>I', _crc(buf))
+
+
+def _vtbl(geo, name, reserved_pebs):
+    # Small LEBs hold fewer records than UBI_MAX_VOLUMES.
+    recs = []
+    for i in range(0, min(UBI_MAX_VOLUMES, geo.leb_size // UBI_VTBL_REC_SZ)):
+        if i == 0:
+            rec = struct.pack(VTBL_REC_FORMAT[:-1], reserved_pebs, 1, 0, UBI_VID_DYNAMIC, 0,
+                              len(name), name, UBI_VTBL_AUTORESIZE_FLG, b'')
+        else:
+            rec = b'\x00' * (UBI_VTBL_REC_SZ - 4)
+        recs.append(rec + struct.pack('>I', _crc(rec)))
+    return b''.join(recs)
+
+
+class _ubifs_builder(object):
+    """Lay out UBIFS nodes into LEBs
+
+    Nodes are appended to the current LEB, 8 byte aligned, and a new
+    LEB is started when one does not fit. LEB 0 to 2 are left for the
+    superblock and master nodes.
+    """
+
+    def __init__(self, leb_size):
+        self.leb_size = leb_size
+        self.lebs = [b'', b'', b'']
+        self._leb = []
+        self._leb_len = 0
+        self._sqnum = 0
+
+    def node(self, node_type, body):
+        self._sqnum += 1
+        tail = struct.pack('<QIBB2s', self._sqnum, UBIFS_COMMON_HDR_SZ + len(body), node_type, 0, b'') + body
+        return UBIFS_NODE_MAGIC + struct.pack('<I', _crc(tail)) + tail
+
+    def add(self, node_type, body):
+        buf = self.node(node_type, body)
+        buf += b'\x00' * (-len(buf) % 8)
+
+        if self._leb_len + len(buf) > self.leb_size:
+            self.close_leb()
+
+        loc = (len(self.lebs), self._leb_len, len(buf))
+        self._leb.append(buf)
+        self._leb_len += len(buf)
+        return loc
+
+    def close_leb(self):
+        if self._leb:
+            self.lebs.append(b''.join(self._leb))
+            self._leb = []
+            self._leb_len = 0
+
+
+def _key(ino_num, key_type, value=0):
+    return struct.pack('<II', ino_num, (key_type << UBIFS_S_KEY_BLOCK_BITS) | value) + b'\x00' * 8
+
+
+def _file_data(rnd, pool, size):
+    # Mix of text and incompressible blocks, about like a rootfs.
+    blocks = []
+    while size > 0:
+        n = min(size, UBIFS_BLOCK_SIZE)
+        if rnd.random() < 0.6:
+            line = ('%s=%d\n' % (rnd.choice(('path', 'name', 'value', 'enable')), rnd.randint(0, 999))).encode('ascii')
+            blocks.append((line * (n // len(line) + 1))[:n])
+        else:
+            start = rnd.randint(0, len(pool) - n)
+            blocks.append(pool[start:start + n])
+        size -= n
+    return blocks
+
+
+def generate_image(path, data_size, peb_size=128 * 1024, free_pebs=32, seed=1):
+    """Write an UBI image with an UBIFS rootfs volume to path.
+
+    Arguments:
+    Str:path       -- Image file to write.
+    Int:data_size  -- Bytes of file data to put in the image.
+    Int:peb_size   -- (optional) PEB size of the image.
+    Int:free_pebs  -- (optional) Erased PEBs to append.
+    Int:seed       -- (optional) Random seed for the file tree.
+
+    Returns:
+    Tuple -- Files, directories and PEBs in the image.
+    """
+    rnd = random.Random(seed)
+    pool = b''.join([struct.pack('<Q', rnd.getrandbits(64)) for i in range(0, 128 * 1024)])
+    geo = _geometry(peb_size)
+    fs = _ubifs_builder(geo.leb_size)
+    leafs = []
+
+    def add(node_type, body):
+        leafs.append(fs.add(node_type, body))
+
+    def add_inode(ino_num, mode, size, nlink, data=b''):
+        add(UBIFS_INO_NODE, struct.pack(UBIFS_INO_NODE_FORMAT, _key(ino_num, UBIFS_INO_KEY), 0, size,
+                                        1400000000, 1400000000, 1400000000, 0, 0, 0, nlink, 0, 0,
+                                        mode, 0, len(data), 0, 0, b'', 0, 0, b'') + data)
+
+    def add_dent(parent, ino_num, itype, name):
+        name = name.encode('ascii')
+        add(UBIFS_DENT_NODE, struct.pack(UBIFS_DENT_NODE_FORMAT, _key(parent, UBIFS_DENT_KEY,
+                                         zlib.crc32(name) & UBIFS_S_KEY_HASH_MASK),
+                                         ino_num, 0, itype, len(name), b'') + name + b'\x00')
+
+    dirs = [1]
+    files = 0
+    ino_num = 64
+    written = 0
+
+    while written < data_size:
+        if len(dirs) < 2 or rnd.random() < 0.04:
+            ino_num += 1
+            add_dent(rnd.choice(dirs), ino_num, UBIFS_ITYPE_DIR, 'dir%d' % ino_num)
+            add_inode(ino_num, 0o40755, 0, 2)
+            dirs.append(ino_num)
+            continue
+
+        ino_num += 1
+        parent = rnd.choice(dirs[1:])
+
+        if rnd.random() < 0.05:
+            target = ('file%d' % (ino_num - 1)).encode('ascii')
+            add_dent(parent, ino_num, UBIFS_ITYPE_LNK, 'link%d' % ino_num)
+            add_inode(ino_num, 0o120777, len(target), 1, target)
+            continue
+
+        if rnd.random() < 0.05:
+            size = rnd.randint(64, 1024) * 1024
+        else:
+            size = int(rnd.expovariate(1.0 / 12000)) + 1
+
+        for block_num, block in enumerate(_file_data(rnd, pool, size)):
+            compr = zlib.compressobj(6, zlib.DEFLATED, -11)
+            data = compr.compress(block) + compr.flush()
+            compr_type = UBIFS_COMPR_ZLIB
+            if len(data) >= len(block):
+                data = block
+                compr_type = UBIFS_COMPR_NONE
+            add(UBIFS_DATA_NODE, struct.pack(UBIFS_DATA_NODE_FORMAT, _key(ino_num, UBIFS_DATA_KEY, block_num),
+                                             len(block), compr_type, b'') + data)
+
+        add_dent(parent, ino_num, UBIFS_ITYPE_REG, 'file%d' % ino_num)
+        add_inode(ino_num, 0o100644, size, 1)
+        files += 1
+        written += size
+
+    add_inode(1, 0o40755, 0, 2)
+
+    # Index levels from the leaf nodes up to a single root.
+    fs.close_leb()
+    level = 0
+    branches = leafs
+    while True:
+        parents = []
+        for i in range(0, len(branches), INDEX_FANOUT):
+            group = branches[i:i + INDEX_FANOUT]
+            body = struct.pack(UBIFS_IDX_NODE_FORMAT, len(group), level)
+            for lnum, offs, length in group:
+                body += struct.pack(UBIFS_BRANCH_FORMAT, lnum, offs, length, b'')
+            parents.append(fs.add(UBIFS_IDX_NODE, body))
+
+        branches = parents
+        level += 1
+        if len(branches) == 1:
+            break
+    fs.close_leb()
+
+    root_lnum, root_offs, root_len = branches[0]
+    leb_cnt = len(fs.lebs)
+    fs.lebs[0] = fs.node(UBIFS_SB_NODE, struct.pack(UBIFS_SB_NODE_FORMAT, b'', UBIFS_KEY_HASH_R5, 0, 0,
+                                                    geo.vid_hdr_offset, geo.leb_size, leb_cnt, leb_cnt, 0, 1, 1, 1, 1,
+                                                    INDEX_FANOUT, 0, 4, UBIFS_COMPR_ZLIB, b'', 0, 0, 0,
+                                                    1000000000, b'', 0, b''))
+    mst = fs.node(UBIFS_MST_NODE, struct.pack(UBIFS_MST_NODE_FORMAT, ino_num, 1, 0, 3, root_lnum, root_offs,
+                                              root_len, 0, root_lnum, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+                                              0, 0, 0, 0, leb_cnt - root_lnum, leb_cnt, b''))
+    fs.lebs[1] = fs.lebs[2] = mst
+
+    vtbl = _vtbl(geo, b'rootfs', leb_cnt)
+    sqnum = 0
+    f = open(path, 'wb')
+    for lnum in range(0, 2):
+        sqnum += 1
+        f.write(_peb(geo, _ec_hdr(geo, 1), _vid_hdr(UBI_INTERNAL_VOL_START, lnum, sqnum), vtbl))
+    for lnum, leb in enumerate(fs.lebs):
+        sqnum += 1
+        f.write(_peb(geo, _ec_hdr(geo, 1), _vid_hdr(0, lnum, sqnum), leb))
+    for i in range(0, free_pebs):
+        f.write(_peb(geo, _ec_hdr(geo, 1)))
+    f.close()
+
+    return files, len(dirs), 2 + leb_cnt + free_pebs
+
+
+def _best(repeat, func):
+    best = None
+    for i in range(0, repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def time_phases(path, tmp_dir, repeat, use_mmap=False, jobs=1):
+    """Time extracting the first volume of an UBI image, phase by phase
+
+    Arguments:
+    Str:path       -- Path to UBI image.
+    Str:tmp_dir    -- Folder the files are extracted below.
+    Int:repeat     -- Runs of each phase, the best is kept.
+    Bool:use_mmap  -- Memory map the image instead of reading it.
+    Int:jobs       -- Number of processes to scan the image and threads
+                      to decompress files with.
+
+    Returns:
+    List           -- (name, seconds) of each phase.
+    """
+    def scan():
+        return ubi(ubi_file(path, block_size, use_mmap=use_mmap), jobs)
+
+    def read_headers():
+        # First pages of each PEB, enough for the EC and VID headers.
+        bufs = []
+        f = open(path, 'rb')
+        for offset in range(uubi.file.start_offset, uubi.file.end_offset, block_size):
+            f.seek(offset)
+            bufs.append(f.read(uubi.min_io_size + UBI_VID_HDR_SZ))
+        f.close()
+        return bufs
+
+    def parse_headers():
+        for buf in hdr_bufs:
+            block_description(buf)
+
+    def sort_blocks():
+        # Queries made between the scan and the extraction.
+        blocks = uubi.blocks
+        sort.by_type(blocks)
+        for image in uubi.images:
+            seq_blocks = sort.by_image_seq(blocks, image.image_seq)
+            sort.by_vol_id(blocks, seq_blocks)
+            sort.clean_bad(blocks, seq_blocks)
+            for vol in image.volumes.values():
+                sort.by_leb(vol.get_blocks(blocks))
+
+    def open_ubifs():
+        return ubifs(leb_virtual_file(uubi, volume))
+
+    def walk_index():
+        uubifs = open_ubifs()
+        mst = uubifs.master_node
+        walk.index(uubifs, mst.root_lnum, mst.root_offs, {})
+
+    def extract():
+        out_path = os.path.join(tmp_dir, 'out')
+        if os.path.exists(out_path):
+            shutil.rmtree(out_path)
+        os.mkdir(out_path)
+        extract_files(open_ubifs(), out_path, False, jobs)
+
+    times = []
+    elapsed, block_size = _best(repeat, lambda: get_peb_size(path))
+    times.append(('peb size', elapsed))
+    elapsed, uubi = _best(repeat, scan)
+    times.append(('scan', elapsed))
+    volume = min(uubi.images[0].volumes.values(), key=lambda v: v.vol_id)
+    hdr_bufs = read_headers()
+    times.append(('headers', _best(repeat, parse_headers)[0]))
+    times.append(('sort', _best(repeat, sort_blocks)[0]))
+    times.append(('walk', _best(repeat, walk_index)[0]))
+    times.append(('extract', _best(repeat, extract)[0]))
+    return times
+
+
+if __name__ == '__main__':
+    description = 'Time scanning, walking and extracting an UBI image.'
+    usage = 'ubi_benchmark.py [options] [filepath]'
+    parser = argparse.ArgumentParser(usage=usage, description=description)
+
+    parser.add_argument('-s', '--size', type=int, dest='size', default=64,
+                        help='MiB of file data in the generated image. (default: 64)')
+
+    parser.add_argument('-p', '--peb-size', type=int, dest='peb_size', default=128,
+                        help='KiB PEB size of the generated image. (default: 128)')
+
+    parser.add_argument('-f', '--free-pebs', type=int, dest='free_pebs', default=32,
+                        help='Erased PEBs at the end of the generated image. (default: 32)')
+
+    parser.add_argument('-r', '--repeat', type=int, dest='repeat', default=3,
+                        help='Runs of each step, the best is shown. (default: 3)')
+
+    parser.add_argument('-m', '--mmap', action='store_true', dest='use_mmap',
+                        help='Memory map the image instead of reading it. (default: False)')
+
+    parser.add_argument('-b', '--both', action='store_true', dest='both',
+                        help='Time reading and memory mapping the image back to back. (default: False)')
+
+    parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                        help='Number of processes to scan the image and threads to decompress files with. (default: 1)')
+
+    parser.add_argument('filepath', nargs='?',
+                        help='Image to time instead of a generated one, first volume is used.')
+
+    args = parser.parse_args()
+    tmp_dir = tempfile.mkdtemp(prefix='ubi_benchmark')
+
+    try:
+        if args.filepath:
+            path = args.filepath
+        else:
+            path = os.path.join(tmp_dir, 'ubi.img')
+            files, dirs, pebs = generate_image(path, args.size * 1024 * 1024, args.peb_size * 1024, args.free_pebs)
+            print('Generated %s files in %s dirs, %s PEBs' % (files, dirs, pebs))
+
+        if args.both:
+            read_times = time_phases(path, tmp_dir, args.repeat, False, args.jobs)
+            mmap_times = time_phases(path, tmp_dir, args.repeat, True, args.jobs)
+            print('%-10s %9s %9s %8s' % ('', 'read', 'mmap', 'speedup'))
+            for (name, read_time), (name, mmap_time) in zip(read_times, mmap_times):
+                print('%-10s %8.3fs %8.3fs %7.2fx' % (name, read_time, mmap_time, read_time / mmap_time))
+        else:
+            image_size = os.path.getsize(path)
+            for name, elapsed in time_phases(path, tmp_dir, args.repeat, args.use_mmap, args.jobs):
+                print('%-10s %8.3fs %8.1f MB/s' % (name, elapsed, image_size / elapsed / 1048576.0))
+
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -31,6 +31,8 @@ class ubi():
 
     Arguments:
     Obj:image       -- UBI image object
+    Int:jobs        -- (optional) Number of processes to scan block
+                       headers with. (default: 1)
 
     Attributes:
     Int:leb_size       -- Size of Logical Erase Blocks.
@@ -42,14 +44,14 @@ class ubi():
     List:layout_blocks_list   -- List of all layout blocks in file.
     List:int_vol_blocks_list  -- List of internal volumes minus layout.
     List:unknown_blocks_list  -- List of blocks with unknown types. *
-    Dict:blocks               -- Dict keyed by PEB number of all blocks.
+    Obj:blocks                -- block_table keyed by PEB number of all blocks.
     * More research into these is needed.
     """
 
-    def __init__(self, ubi_file):
+    def __init__(self, ubi_file, jobs=1):
         self._file = ubi_file
         self._first_peb_num = 0
-        self._blocks = extract_blocks(self)
+        self._blocks = extract_blocks(self, jobs)
         self._block_count = len(self.blocks)
 
         if self._block_count <= 0:
@@ -62,7 +64,7 @@ class ubi():
         self._int_vol_blocks_list = int_vol_list
         self._unknown_blocks_list = unknown_list
 
-        arbitrary_block = self.blocks.itervalues().next()
+        arbitrary_block = next(self.blocks.itervalues())
         self._min_io_size = arbitrary_block.ec_hdr.vid_hdr_offset
         self._leb_size = self.file.block_size - arbitrary_block.ec_hdr.data_offset
 
@@ -207,43 +209,45 @@ def get_peb_size(path):
     Returns:
     Int         -- PEB size.
 
-    Searches file for Magic Number, picks most
-        common length between them.
+    Streams file searching for Magic Number, keeping a running count
+        of the lengths between them. Stops early once a power of two
+        length has been seen PEB_SIZE_MIN_HITS times and outnumbers
+        all other lengths, else picks the most common one.
     """
+    occurances = {}
+    last_offset = None
     file_offset = 0
-    offsets = []
+    tail = b''
+    tail_len = len(UBI_EC_HDR_MAGIC) - 1
+
     f = open(path, 'rb')
-    f.seek(0, 2)
-    file_size = f.tell() + 1
-    f.seek(0)
 
-    for i in range(0, file_size, FILE_CHUNK_SZ):
-        buf = f.read(FILE_CHUNK_SZ)
-        for m in re.finditer(UBI_EC_HDR_MAGIC, buf):
-            start = m.start()
+    while True:
+        chunk = f.read(FILE_CHUNK_SZ)
+        if not chunk:
+            break
 
-            if not file_offset:
-                file_offset = start
-                idx = start
-            else:
-                idx = start + file_offset
+        # Carry the end of the previous chunk over so magic numbers
+        # straddling a chunk boundary are still found.
+        buf = tail + chunk
+        buf_offset = file_offset - len(tail)
+        file_offset += len(chunk)
+        tail = buf[-tail_len:]
 
-            offsets.append(idx)
+        for m in re.finditer(UBI_EC_HDR_MAGIC, buf):
+            idx = buf_offset + m.start()
 
-        file_offset += FILE_CHUNK_SZ
-    f.close()
+            if last_offset is not None:
+                diff = idx - last_offset
+                occurances[diff] = occurances.get(diff, 0) + 1
 
-    occurances = {}
-    for i in range(0, len(offsets)):
-        try:
-            diff = offsets[i] - offsets[i - 1]
-        except:
-            diff = offsets[i]
+                if _peb_size_settled(occurances, diff):
+                    f.close()
+                    return diff
 
-        if diff not in occurances:
-            occurances[diff] = 0
+            last_offset = idx
 
-        occurances[diff] += 1
+    f.close()
 
     most_frequent = 0
     block_size = 0
@@ -254,3 +258,23 @@ def get_peb_size(path):
             block_size = offset
 
     return block_size
+
+
+def _peb_size_settled(occurances, diff):
+    """Check if diff is a clear winner for PEB size
+
+    Arguments:
+    Dict:occurances -- Count of lengths between magic numbers.
+    Int:diff        -- Length that was just counted.
+
+    Returns:
+    Bool            -- True if diff is a power of two seen at least
+                       PEB_SIZE_MIN_HITS times and more often than
+                       all other lengths together.
+    """
+    hits = occurances[diff]
+
+    if hits < PEB_SIZE_MIN_HITS or diff & (diff - 1):
+        return False
+
+    return hits > sum(occurances.values()) - hits
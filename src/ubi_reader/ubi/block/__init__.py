@@ -18,9 +18,12 @@
 #############################################################
 
 import re
+from array import array
+from multiprocessing import Pool
 from ubi import display
 from ubi.defines import *
 from ubi.headers import *
+from ubi.verify import policy
 
 # build block object out of data
 # takes raw data divided up by ec magic number
@@ -45,15 +48,30 @@ class description(object):
     Int:leb_num          -- Logical Erase Block number.
     Int:file_offset      -- Address location in file of this block.
     Int:size             -- Size of total block data or PEB size.
+    Int:ec               -- Erase count, from ec_hdr.
+    Int:image_seq        -- Image sequence number, from ec_hdr.
+    Int:data_offset      -- Where LEB data starts, from ec_hdr.
+    Int:vol_id           -- Volume ID, from vid_hdr.
+    Int:data_pad         -- Unused bytes at end of LEB, from vid_hdr.
+    Int:sqnum            -- Sequence number, from vid_hdr.
     Will print out all information when invoked as a string.
+
+    Arguments:
+    Str:block_buf        -- PEB data.
+    Dict:vtbl_cache      -- (optional) Volume table records already
+                            parsed, keyed by image_seq, LEB number
+                            and sqnum of the layout block.
     """
 
-    def __init__(self, block_buf):
+    def __init__(self, block_buf, vtbl_cache=None):
 
         self.file_offset = -1
         self.peb_num = -1
         self.leb_num = -1
         self.size = -1
+        self.vol_id = 0
+        self.data_pad = 0
+        self.sqnum = 0
 
         self.vid_hdr = None
         self.is_internal_vol = False
@@ -61,19 +79,309 @@ class description(object):
 
         # TODO better understanding of block types/errors
         self.ec_hdr = extract_ec_hdr(block_buf[0:UBI_EC_HDR_SZ])
+        self.ec = self.ec_hdr.ec
+        self.image_seq = self.ec_hdr.image_seq
+        self.data_offset = self.ec_hdr.data_offset
 
         if not self.ec_hdr.errors:
             self.vid_hdr = extract_vid_hdr(block_buf[self.ec_hdr.vid_hdr_offset:self.ec_hdr.vid_hdr_offset + UBI_VID_HDR_SZ])
 
-            self.is_internal_vol = self.vid_hdr.vol_id >= UBI_INTERNAL_VOL_START
+            # Free and erased PEBs have no VID header, keep their defaults.
+            if not self.vid_hdr.errors:
+                self.is_internal_vol = self.vid_hdr.vol_id >= UBI_INTERNAL_VOL_START
 
-            if self.vid_hdr.vol_id >= UBI_INTERNAL_VOL_START:
-                self.vtbl_recs = extract_vtbl_rec(block_buf[self.ec_hdr.data_offset:])
+                if self.vid_hdr.vol_id == UBI_LAYOUT_VOLUME_ID:
+                    vtbl_key = (self.ec_hdr.image_seq, self.vid_hdr.lnum, self.vid_hdr.sqnum)
 
-            self.leb_num = self.vid_hdr.lnum
+                    if vtbl_cache is not None and vtbl_key in vtbl_cache:
+                        self.vtbl_recs = vtbl_cache[vtbl_key]
+                    else:
+                        self.vtbl_recs = extract_vtbl_rec(block_buf[self.ec_hdr.data_offset:
+                                                                    self.ec_hdr.data_offset + UBI_MAX_VOLUMES * UBI_VTBL_REC_SZ])
+                        if vtbl_cache is not None:
+                            vtbl_cache[vtbl_key] = self.vtbl_recs
+
+                self.leb_num = self.vid_hdr.lnum
+                self.vol_id = self.vid_hdr.vol_id
+                self.data_pad = self.vid_hdr.data_pad
+                self.sqnum = self.vid_hdr.sqnum
 
         self.is_vtbl = bool(self.vtbl_recs) or False
-        self.is_valid = not self.ec_hdr.errors and not self.vid_hdr.errors
+        self.is_valid = not self.ec_hdr.errors and self.vid_hdr is not None and not self.vid_hdr.errors
+
+    def __repr__(self):
+        return 'Block: PEB# %s: LEB# %s' % (self.peb_num, self.leb_num)
+
+    def display(self, tab=''):
+        display.block(self, tab)
+
+
+# Per block flag bits kept in block_table.
+_BLK_VALID = 1
+_BLK_INTERNAL_VOL = 2
+_BLK_VTBL = 4
+
+
+class block_table(object):
+    """Array backed table of UBI blocks
+
+    Arguments:
+    Obj:ubi_file   -- UBI file object blocks are read from.
+
+    Methods:
+    append(peb_num, *columns) -- Add a block row, columns in order
+                                 of scan_block results.
+    row(peb_num)              -- Table row number of PEB number.
+        Int:peb_num
+    description(row)          -- Full block description object of row.
+        Int:row
+    index(column)             -- PEB numbers grouped by column value.
+        Str:column
+    by_type()                 -- PEB numbers grouped by block type.
+
+    Keeps one compact column per field instead of a description object
+    per PEB, so images with hundreds of thousands of blocks do not
+    build as many Python objects. Behaves like the Dict of blocks keyed
+    by PEB number it replaces. Items are block_entry objects, which
+    read their headers back from file only when they are asked for.
+    """
+
+    def __init__(self, ubi_file):
+        self._file = ubi_file
+        self.peb_num = array('L')
+        self.file_offset = array('L')
+        # 64 bit on flash, double keeps it exact on 32 bit boxes.
+        self.ec = array('d')
+        self.vol_id = array('L')
+        self.lnum = array('l')
+        self.image_seq = array('L')
+        self.data_offset = array('L')
+        self.data_pad = array('L')
+        # 64 bit on flash, double keeps it exact on 32 bit boxes.
+        self.sqnum = array('d')
+        self.flags = array('B')
+        self._rows = None
+        self._descs = {}
+        self._indexes = {}
+        self.vtbl_cache = {}
+
+    def append(self, peb_num, file_offset, ec, vol_id, lnum, image_seq, data_offset, data_pad, sqnum, flags):
+        self._indexes = {}
+
+        row = len(self.flags)
+        if self._rows is None and row and peb_num != self.peb_num[0] + row:
+            # PEB numbers stopped being contiguous, index them instead.
+            self._rows = dict((n, i) for i, n in enumerate(self.peb_num))
+        if self._rows is not None:
+            self._rows[peb_num] = row
+
+        self.peb_num.append(peb_num)
+        self.file_offset.append(file_offset)
+        self.ec.append(ec)
+        self.vol_id.append(vol_id)
+        self.lnum.append(lnum)
+        self.image_seq.append(image_seq)
+        self.data_offset.append(data_offset)
+        self.data_pad.append(data_pad)
+        self.sqnum.append(sqnum)
+        self.flags.append(flags)
+
+    def row(self, peb_num):
+        """Get table row number of a PEB number.
+
+        Argument:
+        Int:peb_num    -- PEB number of block.
+
+        Returns:
+        Int            -- Row number, KeyError if not in table.
+        """
+        if self._rows is not None:
+            return self._rows[peb_num]
+
+        row = peb_num - self.peb_num[0] if self.peb_num else -1
+        if row < 0 or row >= len(self.flags):
+            raise KeyError(peb_num)
+        return row
+
+    def index(self, column):
+        """Get PEB numbers grouped by value of a column.
+
+        Argument:
+        Str:column     -- Name of column, vol_id, image_seq, etc.
+
+        Returns:
+        Dict           -- Lists of PEB numbers in table order, keyed
+                          by column value. Built once and kept.
+        """
+        if column not in self._indexes:
+            idx = {}
+            for row, value in enumerate(getattr(self, column)):
+                if value not in idx:
+                    idx[value] = []
+                idx[value].append(self.peb_num[row])
+            self._indexes[column] = idx
+
+        return self._indexes[column]
+
+    def by_type(self):
+        """Get PEB numbers grouped by block type.
+
+        Returns:
+        List:layout, data, int_vol, unknown -- As sort.by_type.
+        """
+        layout = []
+        data = []
+        int_vol = []
+        unknown = []
+
+        for flags, pebs in self.index('flags').items():
+            if not flags & _BLK_VALID:
+                unknown.extend(pebs)
+            elif flags & _BLK_VTBL:
+                layout.extend(pebs)
+            elif flags & _BLK_INTERNAL_VOL:
+                int_vol.extend(pebs)
+            else:
+                data.extend(pebs)
+
+        return sorted(layout), sorted(data), sorted(int_vol), sorted(unknown)
+
+    def description(self, row):
+        """Get full block description object of a row.
+
+        Argument:
+        Int:row    -- Row number in table.
+
+        Returns:
+        Obj        -- Block description, parsed from file once
+                      and kept.
+        """
+        if row not in self._descs:
+            blk = description(self._file.read_at(self.file_offset[row], self._file.block_size), self.vtbl_cache)
+            blk.file_offset = self.file_offset[row]
+            blk.peb_num = self.peb_num[row]
+            blk.size = self._file.block_size
+            self._descs[row] = blk
+
+        return self._descs[row]
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __contains__(self, peb_num):
+        try:
+            self.row(peb_num)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.peb_num)
+
+    def __getitem__(self, peb_num):
+        return block_entry(self, self.row(peb_num))
+
+    def keys(self):
+        return list(self.peb_num)
+
+    def iterkeys(self):
+        return iter(self.peb_num)
+
+    def itervalues(self):
+        for row in range(0, len(self.flags)):
+            yield block_entry(self, row)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for row in range(0, len(self.flags)):
+            yield self.peb_num[row], block_entry(self, row)
+
+    def items(self):
+        return list(self.iteritems())
+
+
+class block_entry(object):
+    """UBI block backed by a block_table row
+
+    Arguments:
+    Obj:table  -- block_table the block is in.
+    Int:row    -- Row number of the block.
+
+    Has the same attributes as a block description object. Plain
+    values come from the table, ec_hdr, vid_hdr and vtbl_recs parse
+    the block on first use.
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def _get_peb_num(self):
+        return self._table.peb_num[self._row]
+    peb_num = property(_get_peb_num)
+
+    def _get_leb_num(self):
+        return self._table.lnum[self._row]
+    leb_num = property(_get_leb_num)
+
+    def _get_file_offset(self):
+        return self._table.file_offset[self._row]
+    file_offset = property(_get_file_offset)
+
+    def _get_size(self):
+        return self._table._file.block_size
+    size = property(_get_size)
+
+    def _get_ec(self):
+        return int(self._table.ec[self._row])
+    ec = property(_get_ec)
+
+    def _get_image_seq(self):
+        return self._table.image_seq[self._row]
+    image_seq = property(_get_image_seq)
+
+    def _get_data_offset(self):
+        return self._table.data_offset[self._row]
+    data_offset = property(_get_data_offset)
+
+    def _get_vol_id(self):
+        return self._table.vol_id[self._row]
+    vol_id = property(_get_vol_id)
+
+    def _get_data_pad(self):
+        return self._table.data_pad[self._row]
+    data_pad = property(_get_data_pad)
+
+    def _get_sqnum(self):
+        return int(self._table.sqnum[self._row])
+    sqnum = property(_get_sqnum)
+
+    def _get_is_valid(self):
+        return bool(self._table.flags[self._row] & _BLK_VALID)
+    is_valid = property(_get_is_valid)
+
+    def _get_is_internal_vol(self):
+        return bool(self._table.flags[self._row] & _BLK_INTERNAL_VOL)
+    is_internal_vol = property(_get_is_internal_vol)
+
+    def _get_is_vtbl(self):
+        return bool(self._table.flags[self._row] & _BLK_VTBL)
+    is_vtbl = property(_get_is_vtbl)
+
+    def _get_ec_hdr(self):
+        return self._table.description(self._row).ec_hdr
+    ec_hdr = property(_get_ec_hdr)
+
+    def _get_vid_hdr(self):
+        return self._table.description(self._row).vid_hdr
+    vid_hdr = property(_get_vid_hdr)
+
+    def _get_vtbl_recs(self):
+        return self._table.description(self._row).vtbl_recs
+    vtbl_recs = property(_get_vtbl_recs)
 
     def __repr__(self):
         return 'Block: PEB# %s: LEB# %s' % (self.peb_num, self.leb_num)
@@ -97,34 +405,119 @@ def get_blocks_in_list(blocks, idx_list):
     return {i: blocks[i] for i in idx_list}
 
 
-def extract_blocks(ubi):
+def scan_block(buf, file_offset, vtbl_cache=None):
+    """Parse headers of a PEB into block_table columns
+
+    Arguments:
+    Str:buf          -- PEB data.
+    Int:file_offset  -- Address location in file of this block.
+    Dict:vtbl_cache  -- (optional) Parsed volume tables, see description.
+
+    Returns:
+    Tuple -- file_offset, ec, vol_id, lnum, image_seq, data_offset,
+             data_pad, sqnum, flags. None if buf is not a UBI block.
+    """
+    if buf[0:len(UBI_EC_HDR_MAGIC)] != UBI_EC_HDR_MAGIC:
+        return None
+
+    blk = description(buf, vtbl_cache)
+
+    flags = 0
+    if blk.is_valid:
+        flags |= _BLK_VALID
+    if blk.is_internal_vol:
+        flags |= _BLK_INTERNAL_VOL
+    if blk.is_vtbl:
+        flags |= _BLK_VTBL
+
+    return (file_offset, blk.ec, blk.vol_id, blk.leb_num, blk.image_seq,
+            blk.data_offset, blk.data_pad, blk.sqnum, flags)
+
+
+def _scan_range(args):
+    """Process pool worker, scan_block over a range of PEBs
+
+    Arguments:
+    Tuple:args  -- path, block_size, start and end offset in file,
+                   and CRC verification level.
+
+    Returns:
+    Tuple -- List of scan_block results in file order, and the CRC
+             verification stats of the range.
+    """
+    path, block_size, start, end, verify_level = args
+    rows = []
+    vtbl_cache = {}
+    policy.reset(verify_level)
+
+    f = open(path, 'rb')
+    f.seek(start)
+    for i in range(start, end, block_size):
+        rows.append(scan_block(f.read(block_size), i, vtbl_cache))
+    f.close()
+
+    return rows, policy.stats()
+
+
+def _scan_parallel(ubi_file, jobs):
+    """Scan PEB headers of file in a process pool
+
+    Arguments:
+    Obj:ubi_file  -- UBI file object.
+    Int:jobs      -- Number of worker processes.
+
+    Returns:
+    Generator -- scan_block results in file order.
+    """
+    block_size = ubi_file.block_size
+    start = ubi_file.start_offset
+    end = ubi_file.end_offset
+
+    # Several ranges per worker, so a slow range does not stall the rest.
+    peb_cnt = (end - start + block_size - 1) // block_size
+    range_pebs = max(1, (peb_cnt + jobs * 4 - 1) // (jobs * 4))
+    range_sz = range_pebs * block_size
+    ranges = [(ubi_file.path, block_size, i, min(i + range_sz, end), policy.level)
+              for i in range(start, end, range_sz)]
+
+    pool = Pool(jobs)
+    try:
+        for rows, stats in pool.imap(_scan_range, ranges):
+            policy.merge(stats)
+            for row in rows:
+                yield row
+    finally:
+        pool.close()
+        pool.join()
+
+
+def extract_blocks(ubi, jobs=1):
     """Get a list of UBI block objects from file
 
     Arguments:.
     Obj:ubi    -- UBI object.
+    Int:jobs   -- (optional) Number of processes to scan headers with.
 
     Returns:
-    Dict -- Of block objects keyed by PEB number.
+    Obj -- block_table of blocks keyed by PEB number.
     """
-    blocks = {}
-    start_peb = 0
-    ubi.file.seek(ubi.file.start_offset)
+    blocks = block_table(ubi.file)
     peb_count = 0
     cur_offset = 0
 
-    for i in range(ubi.file.start_offset, ubi.file.end_offset, ubi.file.block_size):
-        buf = ubi.file.read(ubi.file.block_size)
+    if jobs > 1:
+        rows = _scan_parallel(ubi.file, jobs)
+    else:
+        rows = (scan_block(ubi.file.read_at(i, ubi.file.block_size), i, blocks.vtbl_cache)
+                for i in range(ubi.file.start_offset, ubi.file.end_offset, ubi.file.block_size))
 
-        if buf.startswith(UBI_EC_HDR_MAGIC):
-            blk = description(buf)
-            blk.file_offset = i
-            blk.peb_num = ubi.first_peb_num + peb_count
-            blk.size = ubi.file.block_size
-            blocks[blk.peb_num] = blk
+    for row in rows:
+        if row is not None:
+            blocks.append(ubi.first_peb_num + peb_count, *row)
             peb_count += 1
         else:
             cur_offset += ubi.file.block_size
-            ubi.first_peb_num = cur_offset / ubi.file.block_size
+            ubi.first_peb_num = cur_offset // ubi.file.block_size
             ubi.file.start_offset = cur_offset
 
     return blocks
@@ -17,6 +17,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
 
+from array import array
+from ubi.block import block_table
+
 
 def list_by_list(blist, slist):
     """Sort list of block indexes, by another list.
@@ -28,12 +31,8 @@ def list_by_list(blist, slist):
     Returns:
     List        -- List of block indexes matching slist from blist.
     """
-    slist_blocks = []
-    for block in blist:
-        if block in slist:
-            slist_blocks.append(block)
-
-    return slist_blocks
+    slist = set(slist)
+    return [block for block in blist if block in slist]
 
 
 def by_image_seq(blocks, image_seq):
@@ -46,9 +45,12 @@ def by_image_seq(blocks, image_seq):
     Returns:
     List        -- List of block indexes matching image_seq number.
     """
+    if isinstance(blocks, block_table):
+        return list(blocks.index('image_seq').get(image_seq, []))
+
     seq_blocks = []
     for block in blocks:
-        if blocks[block].ec_hdr.image_seq == image_seq:
+        if blocks[block].image_seq == image_seq:
             seq_blocks.append(block)
 
     return seq_blocks
@@ -64,31 +66,37 @@ def by_range(blocks, block_range):
     Returns:
     List                        -- Indexes of blocks sorted by LEB.
     """
-    peb_range = range(block_range[0], block_range[1])
-    return [i for i in blocks if i in peb_range]
+    return [i for i in blocks if block_range[0] <= i < block_range[1]]
 
 
 def by_leb(blocks):
-    """Sort blocks by Logical Erase Block number.
+    """Map Logical Erase Block numbers to blocks.
 
     Arguments:
     List:blocks -- List of block objects to sort.
 
     Returns:
-    List              -- Indexes of blocks sorted by LEB.
+    Array       -- Block indexes, position in array is LEB number.
+                   -1 for LEBs no block was found for.
+
+    If more than one block claims a LEB, as when UBI wrote a newer
+    copy during wear-levelling, the one with highest sqnum is used.
     """
-    slist_len = len(blocks)
-    slist = ['x'] * slist_len
+    leb_map = array('l')
 
     for block in blocks:
-        if blocks[block].leb_num >= slist_len:
-            add_elements = blocks[block].leb_num - slist_len + 1
-            slist += (['x'] * add_elements)
-            slist_len = len(slist)
+        leb_num = blocks[block].leb_num
+        if leb_num < 0:
+            continue
+
+        if leb_num >= len(leb_map):
+            leb_map.extend([-1] * (leb_num - len(leb_map) + 1))
+
+        cur = leb_map[leb_num]
+        if cur == -1 or blocks[block].sqnum > blocks[cur].sqnum:
+            leb_map[leb_num] = block
 
-        slist[blocks[block].leb_num] = block
-    return slist
-    return sorted(blocks.iterkeys(), key=lambda x: blocks[x].leb_num)
+    return leb_map
 
 
 def by_vol_id(blocks, slist=None):
@@ -104,6 +112,20 @@ def by_vol_id(blocks, slist=None):
 
     vol_blocks = {}
 
+    if slist:
+        slist = set(slist)
+
+    if isinstance(blocks, block_table):
+        layout, data, int_vol, unknown = blocks.by_type()
+        invalid = set(unknown)
+
+        for vol_id, pebs in blocks.index('vol_id').items():
+            pebs = [i for i in pebs if i not in invalid and (not slist or i in slist)]
+            if pebs:
+                vol_blocks[vol_id] = pebs
+
+        return vol_blocks
+
     # sort block by volume
     # not reliable with multiple partitions (fifo)
 
@@ -113,10 +135,10 @@ def by_vol_id(blocks, slist=None):
         elif not blocks[i].is_valid:
             continue
 
-        if blocks[i].vid_hdr.vol_id not in vol_blocks:
-            vol_blocks[blocks[i].vid_hdr.vol_id] = []
+        if blocks[i].vol_id not in vol_blocks:
+            vol_blocks[blocks[i].vol_id] = []
 
-        vol_blocks[blocks[i].vid_hdr.vol_id].append(blocks[i].peb_num)
+        vol_blocks[blocks[i].vol_id].append(blocks[i].peb_num)
 
     return vol_blocks
 
@@ -134,7 +156,10 @@ def clean_bad(blocks, slist=None):
 
     clean_blocks = []
 
-    for i in range(0, len(blocks)):
+    if slist:
+        slist = set(slist)
+
+    for i in blocks:
         if slist and i not in slist:
             continue
 
@@ -162,6 +187,12 @@ def by_type(blocks, slist=None):
                     of crc in ed_hdr or vid_hdr.
     """
 
+    if slist:
+        slist = set(slist)
+
+    if isinstance(blocks, block_table):
+        return tuple(list_by_list(l, slist) if slist else l for l in blocks.by_type())
+
     layout = []
     data = []
     int_vol = []
@@ -42,8 +42,11 @@ UBI_MAX_VOLUMES = 128
 # Internal Volume ID start.
 UBI_INTERNAL_VOL_START = 2147479551
 
+# Layout volume, holds the volume table records.
+UBI_LAYOUT_VOLUME_ID = UBI_INTERNAL_VOL_START
+
 # Error Count header.
-UBI_EC_HDR_MAGIC = '\x55\x42\x49\x23' # UBI#
+UBI_EC_HDR_MAGIC = b'\x55\x42\x49\x23' # UBI#
 EC_HDR_FORMAT = '>4sB3sQIII32sI'
 EC_HDR_FIELDS = ['magic',           # Magic string UBI#
                  'version',         # UBI version meant to accept this image.
@@ -59,7 +62,7 @@ EC_HDR_FIELDS = ['magic',           # Magic string UBI#
 UBI_EC_HDR_SZ = struct.calcsize(EC_HDR_FORMAT) # 64
 
 # Volume ID header.
-UBI_VID_HDR_MAGIC = '\x55\x42\x49\x21' # UBI!
+UBI_VID_HDR_MAGIC = b'\x55\x42\x49\x21' # UBI!
 VID_HDR_FORMAT = '>4sBBBBII4sIIII4sQ12sI'
 VID_HDR_FIELDS = ['magic',      # Magic string UBI!
                   'version',    # UBI version meant to accept this image.
@@ -114,3 +117,16 @@ PRINT_COMPAT_LIST = [0, 'Delete', 'Read Only', 0, 'Preserve', 'Reject']
 
 # File chunk size for reads.
 FILE_CHUNK_SZ = 5 * 1024 * 1024
+
+# Default byte budget of the leb_virtual_file LEB cache.
+LEB_CACHE_SZ = 2 * 1024 * 1024
+
+# Consistent EC header gaps needed before PEB size detection stops reading.
+PEB_SIZE_MIN_HITS = 16
+
+# Names on flash are bytes, paths and volume keys are native strings.
+if bytes is str:
+    native_str = str
+else:
+    def native_str(buf):
+        return bytes(buf).decode('utf-8', 'surrogateescape')
@@ -19,7 +19,7 @@ from __future__ import print_function
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
 
-from ubi.defines import PRINT_COMPAT_LIST, PRINT_VOL_TYPE_LIST, UBI_VTBL_AUTORESIZE_FLG
+from ubi.defines import PRINT_COMPAT_LIST, PRINT_VOL_TYPE_LIST, UBI_VTBL_AUTORESIZE_FLG, native_str
 
 
 def ubi(ubi, tab=''):
@@ -133,6 +133,6 @@ def vol_rec(vol_rec, tab=''):
         elif key == 'flags' and value == UBI_VTBL_AUTORESIZE_FLG:
             value = 'autoresize'
         elif key == 'name':
-            value = value.strip('\x00')
+            value = native_str(value.strip(b'\x00'))
 
         print('%s%s: %s' % (tab, key, value))
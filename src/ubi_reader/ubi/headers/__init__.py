@@ -18,16 +18,29 @@
 #############################################################
 
 import struct
+from zlib import crc32
 from ubi.defines import *
 from ubi.headers import errors
 
+# Unused volume table slot, zeros followed by their crc.
+_EMPTY_VTBL_REC = b'\x00' * (UBI_VTBL_REC_SZ - 4)
+_EMPTY_VTBL_REC += struct.pack('>I', ~crc32(_EMPTY_VTBL_REC) & 0xFFFFFFFF)
+
+
+# Precompiled header parsers.
+_EC_HDR_STRUCT = struct.Struct(EC_HDR_FORMAT)
+_VID_HDR_STRUCT = struct.Struct(VID_HDR_FORMAT)
+_VTBL_REC_STRUCT = struct.Struct(VTBL_REC_FORMAT)
+
 
 class ec_hdr(object):
-    def __init__(self, buf):
-        fields = dict(zip(EC_HDR_FIELDS, struct.unpack(EC_HDR_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
-        setattr(self, 'errors', [])
+    __slots__ = EC_HDR_FIELDS + ['errors']
+
+    def __init__(self, buf, offset=0):
+        (self.magic, self.version, self.padding, self.ec, self.vid_hdr_offset,
+         self.data_offset, self.image_seq, self.padding2,
+         self.hdr_crc) = _EC_HDR_STRUCT.unpack_from(buf, offset)
+        self.errors = []
 
     def __repr__(self):
         return 'Error Count Header'
@@ -39,11 +52,14 @@ class ec_hdr(object):
 
 
 class vid_hdr(object):
-    def __init__(self, buf):
-        fields = dict(zip(VID_HDR_FIELDS, struct.unpack(VID_HDR_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
-        setattr(self, 'errors', [])
+    __slots__ = VID_HDR_FIELDS + ['errors']
+
+    def __init__(self, buf, offset=0):
+        (self.magic, self.version, self.vol_type, self.copy_flag, self.compat,
+         self.vol_id, self.lnum, self.padding, self.data_size, self.used_ebs,
+         self.data_pad, self.data_crc, self.padding2, self.sqnum, self.padding3,
+         self.hdr_crc) = _VID_HDR_STRUCT.unpack_from(buf, offset)
+        self.errors = []
 
     def __iter__(self):
         for key in dir(self):
@@ -55,15 +71,17 @@ class vid_hdr(object):
 
 
 class vtbl_rec(object):
-    def __init__(self, buf):
-        fields = dict(zip(VTBL_REC_FIELDS, struct.unpack(VTBL_REC_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
-        setattr(self, 'errors', [])
-        setattr(self, 'rec_index', -1)
+    __slots__ = VTBL_REC_FIELDS + ['errors', 'rec_index']
+
+    def __init__(self, buf, offset=0):
+        (self.reserved_pebs, self.alignment, self.data_pad, self.vol_type,
+         self.upd_marker, self.name_len, self.name, self.flags, self.padding,
+         self.crc) = _VTBL_REC_STRUCT.unpack_from(buf, offset)
+        self.errors = []
+        self.rec_index = -1
 
     def __repr__(self):
-        return 'Volume Table Record: %s' % getattr(self, 'name')
+        return 'Volume Table Record: %s' % self.name
 
     def __iter__(self):
         for key in dir(self):
@@ -91,12 +109,16 @@ def extract_vid_hdr(buf):
 def extract_vtbl_rec(buf):
     data_buf = buf
     vtbl_recs = []
-    vtbl_rec_ret = ''
+    vtbl_rec_ret = None
 
     for i in range(0, UBI_MAX_VOLUMES):
         offset = i * UBI_VTBL_REC_SZ
         vtbl_rec_buf = data_buf[offset:offset + UBI_VTBL_REC_SZ]
 
+        # Empty slots never hold a volume, skip the unpack and crc.
+        if vtbl_rec_buf == _EMPTY_VTBL_REC:
+            continue
+
         if len(vtbl_rec_buf) == UBI_VTBL_REC_SZ:
             vtbl_rec_ret = vtbl_rec(vtbl_rec_buf)
             errors.vtbl_rec(vtbl_rec_ret, vtbl_rec_buf)
@@ -16,12 +16,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
-from zlib import crc32
 from ubi.defines import *
+from ubi.verify import policy, VERIFY_HEADERS
 
 
 def ec_hdr(ec_hdr, buf):
-    if ec_hdr.hdr_crc != (~crc32(buf[:-4]) & 0xFFFFFFFF):
+    if not policy.crc('ec_hdr', VERIFY_HEADERS, ec_hdr.hdr_crc, buf[:-4]):
         ec_hdr.errors.append('crc')
 
     return ec_hdr
@@ -30,7 +30,11 @@ def ec_hdr(ec_hdr, buf):
 def vid_hdr(vid_hdr, buf):
     vid_hdr.errors = []
 
-    if vid_hdr.hdr_crc != (~crc32(buf[:-4]) & 0xFFFFFFFF):
+    # Free PEBs are erased past the EC header, whatever the CRC level.
+    if vid_hdr.magic != UBI_VID_HDR_MAGIC:
+        vid_hdr.errors.append('magic')
+
+    if not policy.crc('vid_hdr', VERIFY_HEADERS, vid_hdr.hdr_crc, buf[:-4]):
         vid_hdr.errors.append('crc')
 
     return vid_hdr
@@ -39,13 +43,13 @@ def vid_hdr(vid_hdr, buf):
 def vtbl_rec(vtbl_rec, buf):
     likely_vtbl = True
 
-    if vtbl_rec.name_len != len(vtbl_rec.name.strip('\x00')):
+    if vtbl_rec.name_len != len(vtbl_rec.name.strip(b'\x00')):
         likely_vtbl = False
 
     elif vtbl_rec.vol_type not in [1, 2]:
         likely_vtbl = False
 
-    if vtbl_rec.crc != (~crc32(buf[:-4]) & 0xFFFFFFFF):
+    if not policy.crc('vtbl_rec', VERIFY_HEADERS, vtbl_rec.crc, buf[:-4]):
         vtbl_rec.errors.append('crc')
 
     if not likely_vtbl:
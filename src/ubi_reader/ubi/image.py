@@ -23,7 +23,7 @@ from ubi.block import get_blocks_in_list
 
 class description(object):
     def __init__(self, blocks, layout_info):
-        self._image_seq = blocks[layout_info[0]].ec_hdr.image_seq
+        self._image_seq = blocks[layout_info[0]].image_seq
         self.vid_hdr_offset = blocks[layout_info[0]].ec_hdr.vid_hdr_offset
         self.version = blocks[layout_info[0]].ec_hdr.version
         self._start_peb = min(layout_info[2])
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#############################################################
+# ubi_reader/ubi
+# (c) 2013 Jason Pruitt (jrspruitt@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#############################################################
+
+import time
+from zlib import crc32
+
+# Verification levels, each includes the checks of the ones below it.
+VERIFY_NONE = 0     # No CRC checks.
+VERIFY_HEADERS = 1  # UBI EC/VID headers and volume table records.
+VERIFY_FULL = 2     # Headers plus every UBIFS node.
+
+VERIFY_LEVELS = {'none': VERIFY_NONE,
+                 'headers': VERIFY_HEADERS,
+                 'full': VERIFY_FULL}
+
+
+class verify(object):
+    """CRC verification policy
+
+    Arguments:
+    Int:level   -- (optional) One of VERIFY_NONE, VERIFY_HEADERS or
+                   VERIFY_FULL. (default: VERIFY_HEADERS)
+
+    Attributes:
+    Int:level     -- Verification level.
+    Dict:checked  -- Count of CRCs computed, keyed by kind.
+    Dict:failed   -- Count of CRC mismatches, keyed by kind.
+    Dict:skipped  -- Count of CRCs not computed due to level, keyed
+                     by kind.
+    Dict:time     -- Seconds spent computing CRCs, keyed by kind.
+
+    Methods:
+    crc(kind, min_level, crc, buf)
+                  -- True if level is below min_level or crc matches buf.
+    stats()       -- Tuple of the counter dicts, see merge.
+    merge(stats)  -- Add stats() of another policy, ie. a scan worker.
+    reset(level)  -- Set level and clear counters.
+    display(tab)  -- Print counters.
+    """
+
+    def __init__(self, level=VERIFY_HEADERS):
+        self.reset(level)
+
+    def reset(self, level=VERIFY_HEADERS):
+        self.level = level
+        self.checked = {}
+        self.failed = {}
+        self.skipped = {}
+        self.time = {}
+
+    def crc(self, kind, min_level, crc, buf):
+        if self.level < min_level:
+            self.skipped[kind] = self.skipped.get(kind, 0) + 1
+            return True
+
+        start = time.time()
+        ok = crc == (~crc32(buf) & 0xFFFFFFFF)
+        self.time[kind] = self.time.get(kind, 0) + time.time() - start
+        self.checked[kind] = self.checked.get(kind, 0) + 1
+
+        if not ok:
+            self.failed[kind] = self.failed.get(kind, 0) + 1
+
+        return ok
+
+    def stats(self):
+        return (self.checked, self.failed, self.skipped, self.time)
+
+    def merge(self, stats):
+        for mine, theirs in zip(self.stats(), stats):
+            for kind in theirs:
+                mine[kind] = mine.get(kind, 0) + theirs[kind]
+
+    def display(self, tab=''):
+        kinds = set(self.checked) | set(self.skipped)
+        for kind in sorted(kinds):
+            print('%s%s CRC: %s checked, %s failed, %s skipped, %.3fs' %
+                  (tab, kind, self.checked.get(kind, 0), self.failed.get(kind, 0),
+                   self.skipped.get(kind, 0), self.time.get(kind, 0)))
+
+    def __repr__(self):
+        return 'CRC Verification Policy'
+
+
+# Policy used by header and node parsing.
+policy = verify()
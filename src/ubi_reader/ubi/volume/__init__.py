@@ -18,6 +18,7 @@
 #############################################################
 
 from ubi import display
+from ubi.defines import native_str
 from ubi.block import sort, get_blocks_in_list
 
 
@@ -43,7 +44,7 @@ class description(object):
     def __init__(self, vol_id, vol_rec, block_list):
         self._vol_id = vol_id
         self._vol_rec = vol_rec
-        self._name = self._vol_rec.name
+        self._name = native_str(self._vol_rec.name.strip(b'\x00'))
         self._block_list = block_list
 
     def __repr__(self):
@@ -76,14 +77,10 @@ class description(object):
         display.volume(self, tab)
 
     def reader(self, ubi):
-        last_leb = 0
         for block in sort.by_leb(self.get_blocks(ubi.blocks)):
-            if block == 'x':
-            #while 0 != (ubi.blocks[block].leb_num - last_leb):
-                last_leb += 1
-                yield '\xff' * ubi.leb_size
+            if block == -1:
+                yield b'\xff' * ubi.leb_size
             else:
-                last_leb += 1
                 yield ubi.file.read_block_data(ubi.blocks[block])
 
 
@@ -104,7 +101,7 @@ def get_volumes(blocks, layout_info):
     vol_blocks_lists = sort.by_vol_id(blocks, layout_info[2])
 
     for vol_rec in blocks[layout_info[0]].vtbl_recs:
-        vol_name = vol_rec.name.strip('\x00')
+        vol_name = native_str(vol_rec.name.strip(b'\x00'))
         if vol_rec.rec_index not in vol_blocks_lists:
             vol_blocks_lists[vol_rec.rec_index] = []
         volumes[vol_name] = description(vol_rec.rec_index, vol_rec, vol_blocks_lists[vol_rec.rec_index])
@@ -21,6 +21,8 @@ import sys
 import argparse
 
 from ubi import ubi, get_peb_size
+from ubi import verify
+from ubi.verify import VERIFY_LEVELS, VERIFY_NONE
 from ubifs import ubifs
 from ubi_io import ubi_file, leb_virtual_file
 from ui.common import extract_files, output_dir
@@ -42,6 +44,15 @@ if __name__ == '__main__':
     parser.add_argument('-p', '--peb-size', type=int, dest='block_size',
                         help='Specify PEB size.')
 
+    parser.add_argument('-m', '--mmap', action='store_true', dest='use_mmap',
+                        help='Memory map the image instead of reading it. (default: False)')
+
+    parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                        help='Number of processes to scan the image and threads to decompress files with. (default: 1)')
+
+    parser.add_argument('-c', '--crc', dest='crc', default='headers', choices=sorted(VERIFY_LEVELS),
+                        help='CRC verification, headers checks UBI headers, full also checks UBIFS nodes. (default: headers)')
+
     parser.add_argument('-o', '--output-dir', dest='output_path',
                         help='Specify output directory path.')
 
@@ -79,14 +90,15 @@ if __name__ == '__main__':
 
     perms = args.permissions
     quiet = args.quiet
+    verify.policy.reset(VERIFY_LEVELS[args.crc])
 
     if not os.path.exists(output_path):
         os.makedirs(output_path)
 
     # Create file object.
-    ufile = ubi_file(path, block_size)
+    ufile = ubi_file(path, block_size, use_mmap=args.use_mmap)
     # Create UBI object
-    uubi = ubi(ufile)
+    uubi = ubi(ufile, args.jobs)
 
     # Traverse items found extracting files.
     for image in uubi.images:
@@ -108,6 +120,9 @@ if __name__ == '__main__':
             uubifs.log.quiet = quiet
             # Run extract all files.
             print('Writing to: %s' % vol_out_path)
-            extract_files(uubifs, vol_out_path, perms)
+            extract_files(uubifs, vol_out_path, perms, args.jobs)
+
+    if not quiet and verify.policy.level != VERIFY_NONE:
+        verify.policy.display()
 
     sys.exit(0)
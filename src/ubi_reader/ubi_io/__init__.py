@@ -17,7 +17,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
 
+import mmap
+from collections import OrderedDict
 from ubi.block import sort
+from ubi.defines import LEB_CACHE_SZ
+
+try:
+    _view = buffer
+except NameError:
+    def _view(obj, offset, size):
+        return memoryview(obj)[offset:offset + size]
 
 
 class ubi_file(object):
@@ -29,6 +38,8 @@ class ubi_file(object):
     Int:start_offset -- (optional) Where to start looking in the file for
                         UBI data.
     Int:end_offset   -- (optional) Where to stop looking in the file.
+    Bool:use_mmap    -- (optional) Map the file into memory and hand out
+                        slices of the mapping instead of reading copies.
 
     Methods:
     seek            -- Put file head to specified byte offset.
@@ -36,6 +47,10 @@ class ubi_file(object):
     read            -- Read specified bytes from file handle.
         Int:size
     tell            -- Returns byte offset of current file location.
+    read_at         -- Returns data at offset without moving file head,
+                       a view of the mapping in mmap mode.
+        Int:offset
+        Int:size
     read_block      -- Returns complete PEB data of provided block
                        description.
         Obj:block
@@ -48,10 +63,17 @@ class ubi_file(object):
     extract blocks, etc.
     """
 
-    def __init__(self, path, block_size, start_offset=0, end_offset=None):
+    def __init__(self, path, block_size, start_offset=0, end_offset=None, use_mmap=False):
+        self._path = path
         self._fhandle = open(path, 'rb')
+        self._mmap = None
         self._start_offset = start_offset
 
+        if use_mmap:
+            self._mmap = mmap.mmap(self._fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._fhandle.close()
+            self._fhandle = self._mmap
+
         if end_offset:
             self._end_offset = end_offset
         else:
@@ -65,6 +87,10 @@ class ubi_file(object):
 
         self._fhandle.seek(self._start_offset)
 
+    def _get_path(self):
+        return self._path
+    path = property(_get_path)
+
     def _set_start(self, i):
         self._start_offset = i
 
@@ -80,6 +106,10 @@ class ubi_file(object):
         return self._block_size
     block_size = property(_get_block_size)
 
+    def _get_is_mmap(self):
+        return self._mmap is not None
+    is_mmap = property(_get_is_mmap)
+
     def seek(self, offset):
         self._fhandle.seek(offset)
 
@@ -89,6 +119,13 @@ class ubi_file(object):
     def tell(self):
         return self._fhandle.tell()
 
+    def read_at(self, offset, size):
+        if self._mmap is not None:
+            return _view(self._mmap, offset, size)
+
+        self._fhandle.seek(offset)
+        return self._fhandle.read(size)
+
     def reset(self):
         self._fhandle.seek(self.start_offset)
 
@@ -115,8 +152,7 @@ class ubi_file(object):
         Argument:
         Obj:block -- Block data is desired for.
         """
-        self.seek(block.file_offset)
-        return self._fhandle.read(block.size)
+        return self.read_at(block.file_offset, block.size)
 
     def read_block_data(self, block):
         """Read LEB data from file
@@ -124,35 +160,98 @@ class ubi_file(object):
         Argument:
         Obj:block -- Block data is desired for.
         """
-        self.seek(block.file_offset + block.ec_hdr.data_offset)
-        buf = self._fhandle.read(block.size - block.ec_hdr.data_offset - block.vid_hdr.data_pad)
-        return buf
+        return self.read_at(block.file_offset + block.data_offset,
+                            block.size - block.data_offset - block.data_pad)
 
 
 class leb_virtual_file():
-    def __init__(self, ubi, volume):
+    """File like object of a volume's LEBs
+
+    Arguments:
+    Obj:ubi          -- UBI object.
+    Obj:volume       -- Volume object to read.
+    Int:cache_size   -- (optional) Byte budget of LEB cache.
+                        (default: LEB_CACHE_SZ)
+
+    Attributes:
+    Int:cache_hits   -- Reads served from LEB cache.
+    Int:cache_misses -- Reads that had to go to the UBI file.
+
+    Keeps recently read LEBs in a least recently used cache, so walking
+    between index and data LEBs does not read the same LEB over and over.
+    In mmap mode LEBs are views of the mapping, which cost no memory, so
+    they are not cached and the counters stay at 0. Reads crossing a LEB
+    boundary or reaching its data_pad tail continue into the next LEB.
+    """
+
+    def __init__(self, ubi, volume, cache_size=LEB_CACHE_SZ):
         self._ubi = ubi
         self._volume = volume
         self._blocks = sort.by_leb(self._volume.get_blocks(self._ubi.blocks))
         self._seek = 0
         self.leb_data_size = len(self._blocks) * self._ubi.leb_size
-        self._last_leb = -1
-        self._last_buf = ''
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_used = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def read(self, i):
-        buf = ''
-        leb = int(self.tell() / self._ubi.leb_size)
-        offset = self.tell() % self._ubi.leb_size
+        bufs = []
 
-        if leb == self._last_leb:
-            self.seek(self.tell() + i)
-            return self._last_buf[offset:offset + i]
-        else:
-            buf = self._ubi.file.read_block_data(self._ubi.blocks[self._blocks[leb]])
-            self._last_buf = buf
-            self._last_leb = leb
-            self.seek(self.tell() + i)
-            return buf[offset:offset + i]
+        while i > 0:
+            leb = self.tell() // self._ubi.leb_size
+            offset = self.tell() % self._ubi.leb_size
+
+            if leb >= len(self._blocks):
+                break
+
+            buf = self._get_leb(leb)[offset:offset + i]
+            if not buf:
+                # Offset in the data_pad tail, the volume goes on in the next LEB.
+                self.seek((leb + 1) * self._ubi.leb_size)
+                continue
+
+            bufs.append(buf)
+            self.seek(self.tell() + len(buf))
+            i -= len(buf)
+
+            # Short LEB, data_pad bytes at end are not part of volume.
+            if offset + len(buf) < self._ubi.leb_size and i > 0:
+                self.seek((leb + 1) * self._ubi.leb_size)
+
+        if len(bufs) == 1:
+            return bufs[0]
+
+        return b''.join(bufs)
+
+    def _get_leb(self, leb):
+        if self._ubi.file.is_mmap:
+            return self._read_leb(leb)
+
+        if leb in self._cache:
+            self.cache_hits += 1
+            buf = self._cache.pop(leb)
+            self._cache[leb] = buf
+            return buf
+
+        self.cache_misses += 1
+        buf = self._read_leb(leb)
+
+        if len(buf) <= self._cache_size:
+            while self._cache_used + len(buf) > self._cache_size:
+                self._cache_used -= len(self._cache.popitem(last=False)[1])
+
+            self._cache[leb] = buf
+            self._cache_used += len(buf)
+
+        return buf
+
+    def _read_leb(self, leb):
+        if self._blocks[leb] == -1:
+            return b'\xff' * self._ubi.leb_size
+
+        return self._ubi.file.read_block_data(self._ubi.blocks[self._blocks[leb]])
 
     def reset(self):
         self.seek(0)
@@ -164,11 +263,5 @@ class leb_virtual_file():
         return self._seek
 
     def reader(self):
-        last_leb = 0
-        for block in self._blocks:
-            while 0 != (self._ubi.blocks[block].leb_num - last_leb):
-                last_leb += 1
-                yield '\xff' * self._ubi.leb_size
-
-            last_leb += 1
-            yield self._ubi.file.read_block_data(self._ubi.blocks[block])
+        for leb in range(0, len(self._blocks)):
+            yield self._read_leb(leb)
@@ -37,6 +37,7 @@ class ubifs():
     Obj:sb_node        -- Superblock node of UBIFS image LEB0
     Obj:mst_node       -- Master Node of UBIFS image LEB1
     Obj:log            -- Log object for errors.
+    List:crc_errors    -- (lnum, offset) of nodes failing their CRC check.
 
     Methods:
     key_search    -- Search nodes for matching key.
@@ -45,6 +46,7 @@ class ubifs():
 
     def __init__(self, ubifs_file):
         self.log = log()
+        self.crc_errors = []
         self._file = ubifs_file
         self._sb_node = extract.sb_node(self, UBIFS_COMMON_HDR_SZ)
         self._min_io_size = self._sb_node.min_io_size
@@ -52,6 +54,12 @@ class ubifs():
         self._mst_node = extract.mst_node(self, 1, UBIFS_COMMON_HDR_SZ)
         self._mst_node = extract.mst_node(self, 2, UBIFS_COMMON_HDR_SZ)
 
+        # Superblock is in LEB 0, master node copies in LEB 1 and 2.
+        for lnum in range(0, 3):
+            if extract.common_hdr(self, lnum).errors:
+                self.crc_errors.append((lnum, 0))
+                self.log.write('CRC Fail: LEB %s offset 0' % lnum)
+
     def _get_file(self):
         return self._file
     file = property(_get_file)
@@ -125,7 +133,7 @@ def get_leb_size(path):
 
         for m in re.finditer(UBIFS_NODE_MAGIC, buf):
             start = m.start()
-            chdr = nodes.common_hdr(buf[start:start + UBIFS_COMMON_HDR_SZ])
+            chdr = nodes.common_hdr(buf, start)
 
             if chdr and chdr.node_type == UBIFS_SB_NODE:
                 sb_start = start + UBIFS_COMMON_HDR_SZ
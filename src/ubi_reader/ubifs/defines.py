@@ -35,7 +35,7 @@ import struct
 # Constant defines
 
 # Common Header.
-UBIFS_NODE_MAGIC = '\x31\x18\x10\x06' # Set to LSB
+UBIFS_NODE_MAGIC = b'\x31\x18\x10\x06' # Set to LSB
 
 # Initial CRC32 value.
 UBIFS_CRC32_INIT = 0xFFFFFFFF
@@ -64,7 +64,7 @@ UBIFS_BLOCK_SIZE = 4096
 UBIFS_BLOCK_SHIFT = 12
 
 # UBIFS padding byte pattern.
-UBIFS_PADDING_BYTE = '\xCE'
+UBIFS_PADDING_BYTE = b'\xCE'
 
 # Max key length
 UBIFS_MAX_KEY_LEN = 16
@@ -204,6 +204,8 @@ UBIFS_COMMON_HDR_FIELDS = ['magic',     # UBIFS node magic number.
                            'group_type',# Node group type.
                            'padding']   # Reserved for future, zeros.
 UBIFS_COMMON_HDR_SZ = struct.calcsize(UBIFS_COMMON_HDR_FORMAT)
+# Node CRC covers the node from after the crc field to its end.
+UBIFS_CRC_OFFSET = 8
                             # LEBs needed.
 # Key offset in key nodes
 # out of place because of ordering issues.
@@ -372,3 +374,6 @@ UBIFS_IDX_NODE_SZ = struct.calcsize(UBIFS_IDX_NODE_FORMAT)
 
 # File chunk size for reads.
 FILE_CHUNK_SZ = 5 * 1024 * 1024
+
+# Data nodes handed to the decompression pool at a time.
+DECOMPRESS_BATCH_SZ = 64
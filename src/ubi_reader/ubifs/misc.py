@@ -59,7 +59,7 @@ def decompress(ctype, unc_len, data):
     Uncompressed Data.
     """
     if ctype == UBIFS_COMPR_LZO:
-        return lzo.decompress(''.join(('\xf0', struct.pack('>I', unc_len), data)))
+        return lzo.decompress(b''.join((b'\xf0', struct.pack('>I', unc_len), data)))
     elif ctype == UBIFS_COMPR_ZLIB:
         return zlib.decompress(data, -11)
     else:
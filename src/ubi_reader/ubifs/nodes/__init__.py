@@ -22,12 +22,24 @@ from ubifs.defines import *
 from ubifs.misc import parse_key
 
 
+# Precompiled node parsers.
+_COMMON_HDR_STRUCT = struct.Struct(UBIFS_COMMON_HDR_FORMAT)
+_SB_NODE_STRUCT = struct.Struct(UBIFS_SB_NODE_FORMAT)
+_MST_NODE_STRUCT = struct.Struct(UBIFS_MST_NODE_FORMAT)
+_DENT_NODE_STRUCT = struct.Struct(UBIFS_DENT_NODE_FORMAT)
+_DATA_NODE_STRUCT = struct.Struct(UBIFS_DATA_NODE_FORMAT)
+_IDX_NODE_STRUCT = struct.Struct(UBIFS_IDX_NODE_FORMAT)
+_INO_NODE_STRUCT = struct.Struct(UBIFS_INO_NODE_FORMAT)
+_BRANCH_STRUCT = struct.Struct(UBIFS_BRANCH_FORMAT)
+
+
 class common_hdr(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_COMMON_HDR_FIELDS, struct.unpack(UBIFS_COMMON_HDR_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
-        setattr(self, 'errors', [])
+    __slots__ = UBIFS_COMMON_HDR_FIELDS + ['errors']
+
+    def __init__(self, buf, offset=0):
+        (self.magic, self.crc, self.sqnum, self.len, self.node_type,
+         self.group_type, self.padding) = _COMMON_HDR_STRUCT.unpack_from(buf, offset)
+        self.errors = []
 
     def __repr__(self):
         return 'UBIFS Common Header'
@@ -39,10 +51,15 @@ class common_hdr(object):
 
 
 class sb_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_SB_NODE_FIELDS, struct.unpack(UBIFS_SB_NODE_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
+    __slots__ = UBIFS_SB_NODE_FIELDS
+
+    def __init__(self, buf, offset=0):
+        (self.padding, self.key_hash, self.key_fmt, self.flags, self.min_io_size,
+         self.leb_size, self.leb_cnt, self.max_leb_cnt, self.max_bud_bytes,
+         self.log_lebs, self.lpt_lebs, self.orph_lebs, self.jhead_cnt, self.fanout,
+         self.lsave_cnt, self.fmt_version, self.default_compr, self.padding1,
+         self.rp_uid, self.rp_gid, self.rp_size, self.time_gran, self.uuid,
+         self.ro_compat_version, self.padding2) = _SB_NODE_STRUCT.unpack_from(buf, offset)
 
     def __repr__(self):
         return 'UBIFS Super Block Node'
@@ -54,10 +71,17 @@ class sb_node(object):
 
 
 class mst_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_MST_NODE_FIELDS, struct.unpack(UBIFS_MST_NODE_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
+    __slots__ = UBIFS_MST_NODE_FIELDS
+
+    def __init__(self, buf, offset=0):
+        (self.highest_inum, self.cmt_no, self.flags, self.log_lnum, self.root_lnum,
+         self.root_offs, self.root_len, self.gc_lnum, self.ihead_lnum,
+         self.ihead_offs, self.index_size, self.total_free, self.total_dirty,
+         self.total_used, self.total_dead, self.total_dark, self.lpt_lnum,
+         self.lpt_offs, self.nhead_lnum, self.nhead_offs, self.ltab_lnum,
+         self.ltab_offs, self.lsave_lnum, self.lsave_offs, self.lscan_lnum,
+         self.empty_lebs, self.idx_lebs, self.leb_cnt,
+         self.padding) = _MST_NODE_STRUCT.unpack_from(buf, offset)
 
     def __repr__(self):
         return 'UBIFS Master Block Node'
@@ -69,14 +93,13 @@ class mst_node(object):
 
 
 class dent_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_DENT_NODE_FIELDS, struct.unpack(UBIFS_DENT_NODE_FORMAT, buf)))
-        for key in fields:
-            if key == 'key':
-                setattr(self, key, parse_key(fields[key]))
-            else:
-                setattr(self, key, fields[key])
-        setattr(self, 'name', '')
+    __slots__ = UBIFS_DENT_NODE_FIELDS + ['name']
+
+    def __init__(self, buf, offset=0):
+        (key, self.inum, self.padding1, self.type, self.nlen,
+         self.padding2) = _DENT_NODE_STRUCT.unpack_from(buf, offset)
+        self.key = parse_key(key)
+        self.name = b''
 
     def __repr__(self):
         return 'UBIFS Directory Entry Node'
@@ -88,15 +111,14 @@ class dent_node(object):
 
 
 class data_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_DATA_NODE_FIELDS, struct.unpack(UBIFS_DATA_NODE_FORMAT, buf)))
-        for key in fields:
-            if key == 'key':
-                setattr(self, key, parse_key(fields[key]))
-            else:
-                setattr(self, key, fields[key])
-        setattr(self, 'offset', 0)
-        setattr(self, 'compr_len', 0)
+    __slots__ = UBIFS_DATA_NODE_FIELDS + ['offset', 'compr_len']
+
+    def __init__(self, buf, offset=0):
+        (key, self.size, self.compr_type,
+         self.padding) = _DATA_NODE_STRUCT.unpack_from(buf, offset)
+        self.key = parse_key(key)
+        self.offset = 0
+        self.compr_len = 0
 
     def __repr__(self):
         return 'UBIFS Data Node'
@@ -108,11 +130,11 @@ class data_node(object):
 
 
 class idx_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_IDX_NODE_FIELDS, struct.unpack(UBIFS_IDX_NODE_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
-        setattr(self, 'branches', [])
+    __slots__ = UBIFS_IDX_NODE_FIELDS + ['branches']
+
+    def __init__(self, buf, offset=0):
+        (self.child_cnt, self.level) = _IDX_NODE_STRUCT.unpack_from(buf, offset)
+        self.branches = []
 
     def __repr__(self):
         return 'UBIFS Index Node'
@@ -124,14 +146,16 @@ class idx_node(object):
 
 
 class ino_node(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_INO_NODE_FIELDS, struct.unpack(UBIFS_INO_NODE_FORMAT, buf)))
-        for key in fields:
-            if key == 'key':
-                setattr(self, key, parse_key(fields[key]))
-            else:
-                setattr(self, key, fields[key])
-        setattr(self, 'data', '')
+    __slots__ = UBIFS_INO_NODE_FIELDS + ['data']
+
+    def __init__(self, buf, offset=0):
+        (key, self.creat_sqnum, self.size, self.atime_sec, self.ctime_sec,
+         self.mtime_sec, self.atime_nsec, self.ctime_nsec, self.mtime_nsec,
+         self.nlink, self.uid, self.gid, self.mode, self.flags, self.data_len,
+         self.xattr_cnt, self.xattr_size, self.padding1, self.xattr_names,
+         self.compr_type, self.padding2) = _INO_NODE_STRUCT.unpack_from(buf, offset)
+        self.key = parse_key(key)
+        self.data = b''
 
     def __repr__(self):
         return 'UBIFS Ino Node'
@@ -143,10 +167,11 @@ class ino_node(object):
 
 
 class branch(object):
-    def __init__(self, buf):
-        fields = dict(zip(UBIFS_BRANCH_FIELDS, struct.unpack(UBIFS_BRANCH_FORMAT, buf)))
-        for key in fields:
-            setattr(self, key, fields[key])
+    __slots__ = UBIFS_BRANCH_FIELDS
+
+    def __init__(self, buf, offset=0):
+        (self.lnum, self.offs, self.len,
+         self.key) = _BRANCH_STRUCT.unpack_from(buf, offset)
 
     def __repr__(self):
         return 'UBIFS Branch'
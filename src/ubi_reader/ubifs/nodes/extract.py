@@ -17,8 +17,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
 
+from ubi.verify import policy, VERIFY_FULL
 from ubifs import nodes
 from ubifs.defines import *
+from ubi.defines import native_str
 
 
 def common_hdr(ubifs, lnum, offset=0):
@@ -33,8 +35,17 @@ def common_hdr(ubifs, lnum, offset=0):
     Obj:common_hdr    -- Common header found at lnum/offset.
     """
     ubifs.file.seek((ubifs.leb_size * lnum) + offset)
-    # crc checks here
-    return nodes.common_hdr(ubifs.file.read(UBIFS_COMMON_HDR_SZ))
+    buf = ubifs.file.read(UBIFS_COMMON_HDR_SZ)
+    chdr = nodes.common_hdr(buf)
+
+    # Rest of the node is only read when it is going to be checked.
+    if policy.level >= VERIFY_FULL:
+        buf = b''.join((buf[UBIFS_CRC_OFFSET:], ubifs.file.read(chdr.len - UBIFS_COMMON_HDR_SZ)))
+
+    if not policy.crc('node', VERIFY_FULL, chdr.crc, buf):
+        chdr.errors.append('crc')
+
+    return chdr
 
 
 def ino_node(ubifs, lnum, offset=0):
@@ -96,7 +107,7 @@ def dent_node(ubifs, lnum, offset=0):
     """
     ubifs.file.seek((ubifs.leb_size * lnum) + offset)
     den = nodes.dent_node(ubifs.file.read(UBIFS_DENT_NODE_SZ))
-    den.name = '%s' % ubifs.file.read(den.nlen)
+    den.name = native_str(ubifs.file.read(den.nlen))
     return den
 
 
@@ -22,9 +22,13 @@ import struct
 
 from ubifs.defines import *
 from ubifs.misc import decompress
+from ubi.defines import native_str
 
 
-def dents(ubifs, inodes, dent_node, path='', perms=False):
+def dents(ubifs, inodes, dent_node, path='', perms=False, pool=None, progress=None, lock=None):
+    if progress:
+        progress()
+
     inode = inodes[dent_node.inum]
     dent_path = os.path.join(path, dent_node.name)
 
@@ -37,22 +41,19 @@ def dents(ubifs, inodes, dent_node, path='', perms=False):
         except Exception as e:
             ubifs.log.write('DIR Fail: %s' % e)
 
-        if 'dent' in inode:
-            for dnode in inode['dent']:
-                dents(ubifs, inodes, dnode, dent_path, perms)
+        for dnode in inode.dent:
+            dents(ubifs, inodes, dnode, dent_path, perms, pool, progress, lock)
 
     elif dent_node.type == UBIFS_ITYPE_REG:
         try:
-            if inode['ino'].nlink > 1:
-                if 'hlink' not in inode:
-                    inode['hlink'] = dent_path
-                    buf = process_reg_file(ubifs, inode, dent_path)
-                    write_reg_file(dent_path, buf)
+            if inode.ino.nlink > 1:
+                if inode.hlink is None:
+                    inode.hlink = dent_path
+                    process_reg_file(ubifs, inode, dent_path, pool, lock)
                 else:
-                    os.link(inode['hlink'], dent_path)
+                    os.link(inode.hlink, dent_path)
             else:
-                buf = process_reg_file(ubifs, inode, dent_path)
-                write_reg_file(dent_path, buf)
+                process_reg_file(ubifs, inode, dent_path, pool, lock)
 
             if perms:
                 set_file_perms(dent_path, inode)
@@ -63,20 +64,20 @@ def dents(ubifs, inodes, dent_node, path='', perms=False):
     elif dent_node.type == UBIFS_ITYPE_LNK:
         try:
             # probably will need to decompress ino data if > UBIFS_MIN_COMPR_LEN
-            os.symlink('%s' % inode['ino'].data, dent_path)
+            os.symlink(native_str(inode.ino.data), dent_path)
         except Exception as e:
-            ubifs.log.write('SYMLINK Fail: %s : %s' % (inode['ino'].data, dent_path))
+            ubifs.log.write('SYMLINK Fail: %s : %s' % (inode.ino.data, dent_path))
 
     elif dent_node.type in [UBIFS_ITYPE_BLK, UBIFS_ITYPE_CHR]:
         try:
-            dev = struct.unpack('<II', inode['ino'].data)[0]
+            dev = struct.unpack('<II', inode.ino.data)[0]
             if perms:
-                os.mknod(dent_path, inode['ino'].mode, dev)
+                os.mknod(dent_path, inode.ino.mode, dev)
                 if perms:
                     set_file_perms(path, inode)
             else:
                 # Just create dummy file.
-                write_reg_file(dent_path, str(dev))
+                write_reg_file(dent_path, str(dev).encode('ascii'))
                 if perms:
                     set_file_perms(dent_path, inode)
 
@@ -85,7 +86,7 @@ def dents(ubifs, inodes, dent_node, path='', perms=False):
 
     elif dent_node.type == UBIFS_ITYPE_FIFO:
         try:
-            os.mkfifo(dent_path, inode['ino'].mode)
+            os.mkfifo(dent_path, inode.ino.mode)
             if perms:
                 set_file_perms(dent_path, inode)
         except Exception as e:
@@ -94,7 +95,7 @@ def dents(ubifs, inodes, dent_node, path='', perms=False):
     elif dent_node.type == UBIFS_ITYPE_SOCK:
         try:
             # Just create dummy file.
-            write_reg_file(dent_path, '')
+            write_reg_file(dent_path, b'')
             if perms:
                 set_file_perms(dent_path, inode)
         except Exception as e:
@@ -103,8 +104,8 @@ def dents(ubifs, inodes, dent_node, path='', perms=False):
 
 def set_file_perms(path, inode):
     try:
-        os.chmod(path, inode['ino'].mode)
-        os.chown(path, inode['ino'].uid, inode['ino'].gid)
+        os.chmod(path, inode.ino.mode)
+        os.chown(path, inode.ino.uid, inode.ino.gid)
     except:
         raise Exception('Failed File Permissions: %s' % (path))
 
@@ -114,33 +115,61 @@ def write_reg_file(path, data):
         f.write(data)
 
 
-def process_reg_file(ubifs, inode, path):
+def process_reg_file(ubifs, inode, path, pool=None, lock=None):
+    """Write regular file from its data nodes.
+
+    Arguments:
+    Obj:ubifs    -- UBIFS object.
+    Obj:inode    -- Inode object from walk.index.
+    Str:path     -- Path to write file to.
+    Obj:pool     -- (optional) Thread pool to decompress data nodes in.
+    Obj:lock     -- (optional) Lock held while writing each batch, to
+                    serialize writes with other extractions.
+
+    Data nodes are decompressed in key order and written at their block
+    offset. Missing blocks are left as sparse holes by seeking past
+    them, and the file is sized to the inode size. With a pool, nodes
+    are read in batches and decompressed in parallel, writes stay in
+    order.
+    """
     try:
-        buf = ''
-        if 'data' in inode:
-            compr_type = 0
-            sorted_data = sorted(inode['data'], key=lambda x: x.key['khash'])
-            last_khash = sorted_data[0].key['khash'] - 1
-            for data in sorted_data:
-
-                # If data nodes are missing in sequence, fill in blanks
-                # with \x00 * UBIFS_BLOCK_SIZE
-                if data.key['khash'] - last_khash != 1:
-                    while 1 != (data.key['khash'] - last_khash):
-                        buf += '\x00' * UBIFS_BLOCK_SIZE
-                        last_khash += 1
-
-                compr_type = data.compr_type
-                ubifs.file.seek(data.offset)
-                d = ubifs.file.read(data.compr_len)
-                buf += decompress(compr_type, data.size, d)
-                last_khash = data.key['khash']
+        with open(path, 'wb') as f:
+            data_nodes = inode.data_nodes()
+
+            if pool is None or len(data_nodes) < 2:
+                batch_size = 1
+            else:
+                batch_size = DECOMPRESS_BATCH_SZ
+
+            for i in range(0, len(data_nodes), batch_size):
+                batch = data_nodes[i:i + batch_size]
+                compr_nodes = []
+
+                for block_num, offset, compr_len, size, compr_type in batch:
+                    ubifs.file.seek(offset)
+                    compr_nodes.append((compr_type, size, ubifs.file.read(compr_len)))
+
+                if batch_size == 1:
+                    bufs = [decompress(*compr_nodes[0])]
+                else:
+                    bufs = pool.map(_decompress_node, compr_nodes)
+
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    for data, buf in zip(batch, bufs):
+                        f.seek(data[0] * UBIFS_BLOCK_SIZE)
+                        f.write(buf)
+                finally:
+                    if lock is not None:
+                        lock.release()
+
+            # Pad end of file with \x00 if needed.
+            f.truncate(inode.ino.size)
 
     except Exception as e:
-        raise Exception('inode num:%s :%s' % (inode['ino'].key['ino_num'], e))
+        raise Exception('inode num:%s :%s' % (inode.ino.key['ino_num'], e))
 
-    # Pad end of file with \x00 if needed.
-    if inode['ino'].size > len(buf):
-        buf += '\x00' * (inode['ino'].size - len(buf))
 
-    return buf
+def _decompress_node(node):
+    return decompress(*node)
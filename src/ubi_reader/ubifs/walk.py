@@ -17,62 +17,162 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #############################################################
 
-from ubifs import extract
+from array import array
+from itertools import groupby
+
+from ubi.defines import native_str
+from ubi.verify import policy, VERIFY_FULL
+from ubifs import nodes
 from ubifs.defines import *
 
 
-def index(ubifs, lnum, offset, inodes={}):
+class inode(object):
+    """Inode record gathered by the index walk
+
+    Attributes:
+    Obj:ino     -- Inode node, None until found.
+    List:dent   -- Directory entry nodes of a directory inode.
+    Array:data  -- Packed data node locations, see add_data.
+    Str:hlink   -- Path first extracted to, for hard links.
+
+    Methods:
+    add_data(block_num, offset, compr_len, size, compr_type)
+                -- Add data node location.
+    data_nodes()
+                -- List of data node location tuples in block order.
+    """
+    __slots__ = ('ino', 'dent', 'data', 'hlink')
+
+    def __init__(self):
+        self.ino = None
+        self.dent = []
+        self.data = array('L')
+        self.hlink = None
+
+    def add_data(self, block_num, offset, compr_len, size, compr_type):
+        self.data.extend((block_num, offset, compr_len, size, compr_type))
+
+    def data_nodes(self):
+        data = self.data
+        data_nodes = [tuple(data[i:i + 5]) for i in range(0, len(data), 5)]
+        data_nodes.sort()
+        return data_nodes
+
+
+def index(ubifs, lnum, offset, inodes=None, length=None):
     """Walk the index gathering Inode, Dir Entry, and File nodes.
 
     Arguments:
     Obj:ubifs    -- UBIFS object.
     Int:lnum     -- Logical erase block number.
     Int:offset   -- Offset in logical erase block.
-    Dict:inodes  -- Dict of ino/dent/file nodes keyed to inode number.
+    Dict:inodes  -- (optional) Dict of ino/dent/file nodes keyed to
+                    inode number, filled in and returned.
+    Int:length   -- (optional) Length of node at lnum/offset.
 
     Returns:
-    Dict:inodes  -- Dict of ino/dent/file nodes keyed to inode number.
-        'ino'    -- Inode node.
-        'data'   -- List of data nodes if present.
-        'dent'   -- List of directory entry nodes if present.
+    Dict:inodes  -- Dict of inode objects keyed to inode number.
+
+    Walks the tree a level at a time. Branches of a level are sorted
+    by LEB number and offset, each LEB is read once for all nodes of
+    the level in it, and nodes are parsed out of that buffer.
+    """
+    if inodes is None:
+        inodes = {}
+
+    if length is None:
+        length = ubifs.leb_size - offset
+
+    pending = [(lnum, offset, length)]
+
+    while pending:
+        pending.sort()
+        next_level = []
+
+        for lnum, group in groupby(pending, key=lambda x: x[0]):
+            group = list(group)
+            start = group[0][1]
+            end = max([offs + length for lnum, offs, length in group])
+
+            ubifs.file.seek((ubifs.leb_size * lnum) + start)
+            buf = ubifs.file.read(end - start)
+
+            for lnum, offs, length in group:
+                _parse_node(ubifs, buf, offs - start, lnum, offs, inodes, next_level)
+
+        pending = next_level
+
+    # Keep directory entries in index key order.
+    for ino_num in inodes:
+        inodes[ino_num].dent.sort(key=lambda x: x.key['khash'])
+
+    return inodes
+
+
+def _parse_node(ubifs, buf, buf_offset, lnum, offset, inodes, branches):
+    """Parse node in LEB buffer into inodes, or its branches.
+
+    A node failing its CRC check is skipped and added to
+    ubifs.crc_errors.
+
+    Arguments:
+    Obj:ubifs       -- UBIFS object.
+    Str:buf         -- LEB data read by index().
+    Int:buf_offset  -- Offset of node in buf.
+    Int:lnum        -- Logical erase block number of node.
+    Int:offset      -- Offset of node in logical erase block.
+    Dict:inodes     -- Dict of inode objects keyed to inode number.
+    List:branches   -- List to add (lnum, offs, len) of index branches to.
     """
-    chdr = extract.common_hdr(ubifs, lnum, offset)
+    chdr = nodes.common_hdr(buf, buf_offset)
+    node_offset = buf_offset + UBIFS_COMMON_HDR_SZ
+
+    if not policy.crc('node', VERIFY_FULL, chdr.crc,
+                      buf[buf_offset + UBIFS_CRC_OFFSET:buf_offset + chdr.len]):
+        ubifs.crc_errors.append((lnum, offset))
+        ubifs.log.write('CRC Fail: LEB %s offset %s' % (lnum, offset))
+        return
 
     if chdr.node_type == UBIFS_IDX_NODE:
-        idxn = extract.idx_node(ubifs, lnum, offset + UBIFS_COMMON_HDR_SZ)
+        idxn = nodes.idx_node(buf, node_offset)
+        brn_offset = node_offset + UBIFS_IDX_NODE_SZ
 
-        for branch in idxn.branches:
-            index(ubifs, branch.lnum, branch.offs, inodes)
+        for i in range(0, idxn.child_cnt):
+            brn = nodes.branch(buf, brn_offset)
+            branches.append((brn.lnum, brn.offs, brn.len))
+            brn_offset += UBIFS_BRANCH_SZ
 
     elif chdr.node_type == UBIFS_INO_NODE:
-        inon = extract.ino_node(ubifs, lnum, offset + UBIFS_COMMON_HDR_SZ)
+        inon = nodes.ino_node(buf, node_offset)
+        data_offset = node_offset + UBIFS_INO_NODE_SZ
+        inon.data = buf[data_offset:data_offset + inon.data_len]
         ino_num = inon.key['ino_num']
 
         if not ino_num in inodes:
-            inodes[ino_num] = {}
+            inodes[ino_num] = inode()
 
-        inodes[ino_num]['ino'] = inon
+        inodes[ino_num].ino = inon
 
     elif chdr.node_type == UBIFS_DATA_NODE:
-        datn = extract.data_node(ubifs, lnum, offset + UBIFS_COMMON_HDR_SZ, chdr.len)
+        datn = nodes.data_node(buf, node_offset)
         ino_num = datn.key['ino_num']
 
         if not ino_num in inodes:
-            inodes[ino_num] = {}
-
-        if not 'data' in inodes[ino_num]:
-            inodes[ino_num]['data'] = []
+            inodes[ino_num] = inode()
 
-        inodes[ino_num]['data'].append(datn)
+        inodes[ino_num].add_data(datn.key['khash'] & UBIFS_S_KEY_BLOCK_MASK,
+                                 (ubifs.leb_size * lnum) + offset + UBIFS_COMMON_HDR_SZ + UBIFS_DATA_NODE_SZ,
+                                 chdr.len - UBIFS_COMMON_HDR_SZ - UBIFS_DATA_NODE_SZ,
+                                 datn.size,
+                                 datn.compr_type)
 
     elif chdr.node_type == UBIFS_DENT_NODE:
-        dn = extract.dent_node(ubifs, lnum, offset + UBIFS_COMMON_HDR_SZ)
+        dn = nodes.dent_node(buf, node_offset)
+        name_offset = node_offset + UBIFS_DENT_NODE_SZ
+        dn.name = native_str(buf[name_offset:name_offset + dn.nlen])
         ino_num = dn.key['ino_num']
 
         if not ino_num in inodes:
-            inodes[ino_num] = {}
-
-        if not 'dent' in inodes[ino_num]:
-            inodes[ino_num]['dent'] = []
+            inodes[ino_num] = inode()
 
-        inodes[ino_num]['dent'].append(dn)
+        inodes[ino_num].dent.append(dn)
@@ -18,6 +18,7 @@
 #############################################################
 
 import os
+from multiprocessing.pool import ThreadPool
 
 from ubi_io import leb_virtual_file
 from ubifs import ubifs, walk, output
@@ -27,25 +28,37 @@ from ubi.defines import PRINT_VOL_TYPE_LIST, UBI_VTBL_AUTORESIZE_FLG
 output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'output')
 
 
-def extract_files(ubifs, out_path, perms=False):
+def extract_files(ubifs, out_path, perms=False, jobs=1):
     """Extract UBIFS contents to_path/
 
     Arguments:
     Obj:ubifs    -- UBIFS object.
     Str:out_path  -- Path to extract contents to.
+    Bool:perms   -- (optional) Set file permissions and owners.
+    Int:jobs     -- (optional) Number of threads to decompress file
+                    data with.
     """
+    pool = None
     try:
-        inodes = {}
-        walk.index(ubifs, ubifs.master_node.root_lnum, ubifs.master_node.root_offs, inodes)
+        inodes = walk.index(ubifs, ubifs.master_node.root_lnum, ubifs.master_node.root_offs,
+                            length=ubifs.master_node.root_len)
 
-        for dent in inodes[1]['dent']:
-            output.dents(ubifs, inodes, dent, out_path, perms)
+        if jobs > 1:
+            pool = ThreadPool(jobs)
+
+        for dent in inodes[1].dent:
+            output.dents(ubifs, inodes, dent, out_path, perms, pool)
 
     except Exception as e:
         import traceback
         ubifs.log.write('%s' % e)
         traceback.print_exc()
 
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
 
 def get_ubi_params(ubi):
     """Get UBI utils params
@@ -96,7 +109,7 @@ def get_ubi_params(ubi):
                 ini_params[img_seq][volume]['vol_flags'] = image.volumes[volume].vol_rec.flags
 
             ini_params[img_seq][volume]['vol_id'] = image.volumes[volume].vol_id
-            ini_params[img_seq][volume]['vol_name'] = image.volumes[volume].name.rstrip('\x00')
+            ini_params[img_seq][volume]['vol_name'] = image.volumes[volume].name
             ini_params[img_seq][volume]['vol_alignment'] = image.volumes[volume].vol_rec.alignment
 
             ini_params[img_seq][volume]['vol_size'] = image.volumes[volume].vol_rec.reserved_pebs * ubi.leb_size
@@ -116,7 +129,7 @@ def get_ubi_params(ubi):
 
             for key, value in image.volumes[volume].vol_rec:
                 if key == 'name':
-                    value = value.rstrip('\x00')
+                    value = image.volumes[volume].name
 
                 if key in ubi_flags:
                     ubi_args[img_seq][volume][key] = value